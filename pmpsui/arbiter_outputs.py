@@ -1,10 +1,15 @@
 import json
 
 from pydm import Display
-from pydm.widgets import PyDMEmbeddedDisplay
 from pydm.widgets.channel import PyDMChannel
+from qtpy import QtCore, QtWidgets
 
 from .beamclass_table import install_bc_setText
+from .chatter import ChatterMonitor
+from .fast_faults import indicator_macros
+from .ff_store import FastFaultStore
+from .manifest import manifest_for
+from .template_cache import CachedEmbeddedDisplay
 from .tooltips import get_tooltip_for_bc
 
 
@@ -14,9 +19,12 @@ class ArbiterOutputs(Display):
         super().__init__(parent=parent, args=args, macros=macros)
         self.config = macros
         self._channels = []
+        self.ffo_items = []
         self.setup_ui()
 
     def setup_ui(self):
+        ChatterMonitor.configure(self.config)
+        FastFaultStore.configure(self.config)
         self.setup_outputs()
         self.setup_bitmask_summaries()
 
@@ -51,53 +59,135 @@ class ArbiterOutputs(Display):
         self.ui.rate_summary_label.setText(f'{rate} Hz')
 
     def setup_outputs(self):
+        """
+        Build the PLC -> FFO -> FF tree of arbiter outputs.
+
+        Each PLC in the config gets a top-level item and each of its FFOs
+        gets a child item that holds the usual arbiter output row.
+        The individual fast faults are only added to the tree, and only
+        subscribe to their PVs, while their FFO item is expanded.
+        """
         ffs = self.config.get('fastfaults')
         if not ffs:
             return
         outs_container = self.ui.arbiter_outputs_content
         if outs_container is None:
             return
-        count = 0
-        for ff in ffs:
-            name = ff.get('name')
-            prefix = ff.get('prefix')
-            ffo_start = ff.get('ffo_start')
-            ffo_end = ff.get('ffo_end')
-            ff_start = ff.get('ff_start')
-            ff_end = ff.get('ff_end')
-            ff_count = ff.get('ff_end', -1) - ff.get('ff_start', 0) + 1
-
-            ffos_zfill = len(str(ffo_end)) + 1
-
-            entries = range(ffo_start, ffo_end+1)
-            ffo_desc = ff.get('ffo_desc', ['']*len(entries))
-            ffo_veto = ff.get('ffo_veto', ['']*len(entries))
-
-            template = '../templates/arbiter_outputs_entry.py'
-            for _ffo, desc, veto in zip(entries, ffo_desc, ffo_veto):
-                s_ffo = str(_ffo).zfill(ffos_zfill)
+        self.tree = QtWidgets.QTreeWidget(parent=outs_container)
+        self.tree.setHeaderHidden(True)
+        self.tree.setColumnCount(1)
+        self.tree.setIndentation(12)
+        self.tree.setSelectionMode(QtWidgets.QAbstractItemView.NoSelection)
+        self.tree.setVerticalScrollMode(
+            QtWidgets.QAbstractItemView.ScrollPerPixel
+        )
+        self.tree.itemExpanded.connect(self.expand_ffo)
+        self.tree.itemCollapsed.connect(self.collapse_ffo)
+        outs_container.layout().addWidget(self.tree)
+
+        manifest = manifest_for(self.config)
+        template = '../templates/arbiter_outputs_entry.py'
+        for plc in manifest.plcs:
+            plc_item = QtWidgets.QTreeWidgetItem(
+                self.tree, [f'{plc.name} ({plc.prefix})']
+            )
+            for ffo in manifest.ffos[plc.ffos.start:plc.ffos.stop]:
                 macros = dict(
-                    index=count,
-                    ff_start=ff_start,
-                    ff_end=ff_end,
-                    P=prefix,
-                    FFO=s_ffo,
-                    NAME=name,
-                    FFO_INDEX=_ffo,
-                    FF_COUNT=ff_count,
-                    DESC=desc,
-                    VETO=veto,
+                    index=ffo.index,
+                    ff_start=ffo.ff_start,
+                    ff_end=ffo.ff_end,
+                    P=ffo.prefix,
+                    FFO=ffo.ffo_text,
+                    NAME=ffo.name,
+                    FFO_INDEX=ffo.ffo,
+                    FF_COUNT=len(ffo.faults),
+                    DESC=ffo.desc,
+                    VETO=ffo.veto,
                 )
-                widget = PyDMEmbeddedDisplay(parent=outs_container)
+                widget = CachedEmbeddedDisplay(parent=self.tree)
                 widget.macros = json.dumps(macros)
                 widget.filename = template
                 widget.disconnectWhenHidden = False
                 widget.loadWhenShown = False
                 widget.setMinimumHeight(40)
-                outs_container.layout().addWidget(widget)
-                count += 1
-
-        print(f'Added {count} arbiter outputs')
+                ffo_item = QtWidgets.QTreeWidgetItem(plc_item)
+                ffo_item.setChildIndicatorPolicy(
+                    QtWidgets.QTreeWidgetItem.ShowIndicator
+                )
+                ffo_item.setData(0, QtCore.Qt.UserRole, macros)
+                ffo_item.setSizeHint(0, QtCore.QSize(0, 40))
+                self.tree.setItemWidget(ffo_item, 0, widget)
+                self.ffo_items.append(ffo_item)
+            plc_item.setExpanded(True)
+
+        print(f'Added {len(self.ffo_items)} arbiter outputs')
+
+    def expand_ffo(self, item):
+        """
+        Create the fast fault rows for an FFO item that was just expanded.
+        """
+        macros = item.data(0, QtCore.Qt.UserRole)
+        if macros is None or item.childCount():
+            return
+        manifest = manifest_for(self.config)
+        ffo = manifest.ffos[macros['index']]
+        template = '../templates/fastfaults_entry.ui'
+        for index, row in enumerate(manifest.ffo_faults(ffo)):
+            ff_macros = dict(
+                index=index,
+                P=row.prefix,
+                FFO=row.ffo_text,
+                FF=row.ff_text,
+            )
+            # These rows subscribe on their own, and only while expanded
+            ff_macros.update(indicator_macros(row.base, False))
+            widget = CachedEmbeddedDisplay(parent=self.tree)
+            widget.macros = json.dumps(ff_macros)
+            widget.filename = template
+            widget.disconnectWhenHidden = False
+            widget.loadWhenShown = False
+            ff_item = QtWidgets.QTreeWidgetItem(item)
+            ff_item.setSizeHint(0, widget.sizeHint())
+            self.tree.setItemWidget(ff_item, 0, widget)
+
+    def collapse_ffo(self, item):
+        """
+        Drop the fast fault rows, and their PV connections, for an FFO item.
+        """
+        if item.data(0, QtCore.Qt.UserRole) is None:
+            return
+        # The item widgets can't be looked up once the items are taken
+        widgets = [
+            self.tree.itemWidget(item.child(row), 0)
+            for row in range(item.childCount())
+        ]
+        item.takeChildren()
+        for widget in widgets:
+            if widget is not None:
+                widget.deleteLater()
+
+    def show_fast_fault(self, index):
+        """
+        Expand the tree down to the fast fault at index and scroll to it.
+
+        The index counts fast faults in config order, like the fast faults
+        tab and the heatmap. Returns False if there is no such fault.
+        """
+        manifest = manifest_for(self.config)
+        if not 0 <= index < len(manifest.fault_ffos):
+            return False
+        ffo_index = manifest.fault_ffos[index]
+        if ffo_index is None:
+            return False
+        ffo = manifest.ffos[ffo_index]
+        ffo_item = self.ffo_items[ffo.index]
+        ffo_item.parent().setExpanded(True)
+        ffo_item.setExpanded(True)
+        ff_item = ffo_item.child(index - ffo.faults.start)
+        self.tree.scrollToItem(
+            ff_item, QtWidgets.QAbstractItemView.PositionAtCenter,
+        )
+        return True
 
     def channels(self):
         return self._channels
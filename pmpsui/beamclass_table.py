@@ -158,8 +158,4 @@ def get_max_bc_from_bitmask(bitmask: int) -> int:
     """
     Given a beamclass bitmask, get the highest beamclass.
     """
-    max_bc = 0
-    while bitmask > 0:
-        bitmask = bitmask >> 1
-        max_bc += 1
-    return max_bc
+    return max(int(bitmask), 0).bit_length()
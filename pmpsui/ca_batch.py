@@ -0,0 +1,291 @@
+"""
+Batched delivery of channel access callbacks to the GUI thread.
+
+PyDM's pyepics plugin emits a Qt signal straight from the CA client
+thread for every monitor update, so each update becomes its own queued
+event in the GUI thread. During a burst, e.g. an IOC restart, tens of
+thousands of these flood the event queue.
+
+With the ``install`` hotfix, the plugin's CA callbacks only append to a
+``CallbackQueue`` and the GUI thread is woken at most once per burst.
+The ``CallbackBatcher`` then runs every waiting callback in one event,
+in arrival order, so the updates of each channel are applied in order.
+PyDM connects every listener with a queued connection, which would post
+one event per slot again, so the listeners of batched connections are
+reconnected to be called directly from the drain.
+
+The queue depth and drain latency can be read from
+``CallbackBatcher.instance().queue.stats()``.
+"""
+from __future__ import annotations
+
+import collections
+import functools
+import logging
+import threading
+import time
+from typing import Callable, Optional
+
+import numpy as np
+from pydm.data_plugins.plugin import PyDMConnection
+from qtpy import QtCore, QtWidgets
+
+try:
+    import epics
+    from pydm.data_plugins.epics_plugins.pyepics_plugin_component import \
+        Connection
+except ImportError:
+    epics = Connection = None
+
+logger = logging.getLogger(__name__)
+
+# Number of recent drain latencies to average over
+LATENCY_SAMPLES = 100
+# The pyepics Connection methods that are called from the CA threads
+BATCHED_METHODS = (
+    'send_new_value',
+    'send_connection_state',
+    'send_access_state',
+)
+# The (connection signal, channel slot) pairs that PyDM connects queued
+LISTENER_SIGNALS = (
+    ('connection_state_signal', 'connection_slot'),
+    ('new_severity_signal', 'severity_slot'),
+    ('write_access_signal', 'write_access_slot'),
+    ('enum_strings_signal', 'enum_strings_slot'),
+    ('unit_signal', 'unit_slot'),
+    ('upper_ctrl_limit_signal', 'upper_ctrl_limit_slot'),
+    ('lower_ctrl_limit_signal', 'lower_ctrl_limit_slot'),
+    ('upper_alarm_limit_signal', 'upper_alarm_limit_slot'),
+    ('lower_alarm_limit_signal', 'lower_alarm_limit_slot'),
+    ('upper_warning_limit_signal', 'upper_warning_limit_slot'),
+    ('lower_warning_limit_signal', 'lower_warning_limit_slot'),
+    ('prec_signal', 'prec_slot'),
+    ('timestamp_signal', 'timestamp_slot'),
+)
+# The overloads of new_value_signal that PyDM connects value slots to
+VALUE_TYPES = (int, float, str, bool, object)
+
+
+class CallbackQueue:
+    """
+    First in, first out queue of callbacks with delivery metrics.
+
+    This holds no qt objects so it can be used and tested on its own.
+    Any thread can ``put``, and one thread should ``drain``. Appending to
+    and popping from a deque are atomic, so neither side takes a lock.
+
+    Parameters
+    ----------
+    clock : callable, optional
+        Source of timestamps in seconds, for testing.
+    """
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self._queue = collections.deque()
+        self._latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+        self.max_depth = 0
+        self.drains = 0
+        self.delivered = 0
+        self.max_batch = 0
+        self.max_latency = 0.0
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def put(self, func: Callable, *args, **kwargs) -> None:
+        """Add a call to the end of the queue."""
+        self._queue.append((self.clock(), func, args, kwargs))
+        depth = len(self._queue)
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def drain(self) -> int:
+        """
+        Run every queued call in order, including ones added meanwhile.
+
+        Returns the number of calls that were run. An exception in one
+        call is logged and doesn't stop the others.
+        """
+        count = 0
+        queue = self._queue
+        while True:
+            try:
+                stamp, func, args, kwargs = queue.popleft()
+            except IndexError:
+                break
+            if not count:
+                latency = self.clock() - stamp
+                self._latencies.append(latency)
+                if latency > self.max_latency:
+                    self.max_latency = latency
+            count += 1
+            try:
+                func(*args, **kwargs)
+            except Exception:
+                logger.exception('Error in batched callback %s', func)
+        if count:
+            self.drains += 1
+            self.delivered += count
+            if count > self.max_batch:
+                self.max_batch = count
+        return count
+
+    def mean_latency(self) -> Optional[float]:
+        """Average wait of the oldest call in recent drains, in seconds."""
+        if not self._latencies:
+            return None
+        return sum(self._latencies) / len(self._latencies)
+
+    def stats(self) -> dict:
+        """Snapshot of the queue depth and delivery metrics."""
+        return dict(
+            depth=len(self._queue),
+            max_depth=self.max_depth,
+            drains=self.drains,
+            delivered=self.delivered,
+            max_batch=self.max_batch,
+            mean_latency=self.mean_latency(),
+            max_latency=self.max_latency,
+        )
+
+
+class CallbackBatcher(QtCore.QObject):
+    """
+    Application-wide runner of queued CA callbacks in the GUI thread.
+
+    There is one of these per application, see ``CallbackBatcher.instance``.
+    It must first be created from the GUI thread.
+    """
+    _wake = QtCore.Signal()
+
+    _instance: Optional[CallbackBatcher] = None
+
+    def __init__(self, parent=None):
+        super().__init__(parent=parent)
+        self.queue = CallbackQueue()
+        self._scheduled = False
+        self._wake.connect(self.drain, QtCore.Qt.QueuedConnection)
+
+    @classmethod
+    def instance(cls) -> CallbackBatcher:
+        """Get the application-wide CallbackBatcher, creating it if needed."""
+        if cls._instance is None:
+            cls._instance = cls(parent=QtWidgets.QApplication.instance())
+        return cls._instance
+
+    def call(self, func: Callable, *args, **kwargs) -> None:
+        """
+        Run func in the GUI thread, after any calls that are already queued.
+
+        From the GUI thread, the queue is drained and func runs right away.
+        From other threads, func is queued and the GUI thread is woken up
+        if it doesn't already have a drain coming.
+        """
+        if threading.current_thread() is threading.main_thread():
+            self.queue.drain()
+            func(*args, **kwargs)
+            return
+        self.queue.put(func, *args, **kwargs)
+        if not self._scheduled:
+            self._scheduled = True
+            self._wake.emit()
+
+    def drain(self) -> None:
+        # Clear the flag first, so anything queued from here on wakes us again
+        self._scheduled = False
+        self.queue.drain()
+
+
+def _connect_direct(signal, slot: Callable) -> None:
+    """Swap a queued connection from signal to slot for a direct one."""
+    try:
+        signal.disconnect(slot)
+    except TypeError:
+        # Not connected to this overload
+        return
+    signal.connect(slot)
+
+
+def direct_listeners(connection, channel) -> None:
+    """
+    Have a batched connection call the channel's slots directly.
+
+    The connection only emits from the GUI thread once batched, so the
+    slots no longer need to be called through the event queue.
+    """
+    for signal_name, slot_name in LISTENER_SIGNALS:
+        slot = getattr(channel, slot_name)
+        if slot is not None:
+            _connect_direct(getattr(connection, signal_name), slot)
+    if channel.value_slot is not None:
+        for signal_type in VALUE_TYPES:
+            _connect_direct(
+                connection.new_value_signal[signal_type], channel.value_slot,
+            )
+
+
+def _batched(method: Callable) -> Callable:
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        CallbackBatcher.instance().call(method, self, *args, **kwargs)
+
+    wrapper.unbatched = method
+    return wrapper
+
+
+def batched_add_listener(self, channel):
+    """
+    Copy of the pyepics Connection.add_listener, with direct slots.
+
+    This is always run in the GUI thread, see install. The current state
+    is sent from a later event, like PyDM's queued connections would,
+    so that the widget is done setting up before its slots are called.
+    """
+    PyDMConnection.add_listener(self, channel)
+    # These are the hotfix lines
+    direct_listeners(self, channel)
+    QtCore.QTimer.singleShot(0, functools.partial(send_current_state, self))
+    # These were the hotfix lines
+    if channel.value_signal is not None:
+        for signal_type in (str, int, float, np.ndarray):
+            try:
+                channel.value_signal[signal_type].connect(
+                    self.put_value, QtCore.Qt.QueuedConnection,
+                )
+            except (KeyError, IndexError, TypeError):
+                pass
+
+
+def send_current_state(connection) -> None:
+    """Send a connection's state to its listeners, if it still has any."""
+    if connection.listener_count < 1:
+        return
+    if epics.ca.isConnected(connection.pv.chid):
+        connection.send_connection_state(conn=True)
+        connection.pv.run_callbacks()
+    else:
+        connection.send_connection_state(conn=False)
+
+
+def install() -> None:
+    """
+    Route the pyepics plugin's CA callbacks through the CallbackBatcher.
+
+    This needs a QApplication, and only affects connections that are
+    made after it is called. New listeners are added in the GUI thread
+    too, so that their slots can be connected directly.
+    """
+    if Connection is None:
+        logger.debug('No pyepics plugin, not batching CA callbacks')
+        return
+    if QtWidgets.QApplication.instance() is None:
+        logger.debug('No QApplication, not batching CA callbacks')
+        return
+    # Create it here, in the GUI thread
+    CallbackBatcher.instance()
+    if hasattr(Connection.add_listener, 'unbatched'):
+        return
+    for name in BATCHED_METHODS:
+        setattr(Connection, name, _batched(getattr(Connection, name)))
+    Connection.add_listener = _batched(batched_add_listener)
@@ -0,0 +1,154 @@
+"""
+Drop value, severity and connection updates that didn't change anything.
+
+PyDM calls every slot on every monitor update, and many of our slots then
+redo the same widget work for a value they have already shown. The tools
+here sit between a channel and its slot, remember the last arguments and
+drop repeats before they reach the widget:
+
+- ``skip_unchanged`` decorates a method, keeping one memory per instance.
+  ``reset_unchanged`` clears it, e.g. after the widget was changed behind
+  the method's back.
+- ``ChangeFilter`` wraps any callable, e.g. a functools.partial.
+- ``filter_slots`` wraps the slots of a PyDMChannel in ChangeFilters.
+
+Every delivered and suppressed call is counted by name so that the
+amount of redundant traffic can be inspected with ``suppression_stats``.
+"""
+from __future__ import annotations
+
+import collections
+import functools
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+# slot name -> number of calls that were passed through
+delivered_counts = collections.Counter()
+# slot name -> number of calls that were dropped as unchanged
+suppressed_counts = collections.Counter()
+
+# The PyDMChannel slots that are worth filtering
+FILTERED_SLOTS = ('value_slot', 'severity_slot', 'connection_slot')
+
+_UNSET = object()
+
+
+def args_equal(old: tuple, new: tuple) -> bool:
+    """Compare two argument tuples, including any numpy arrays in them."""
+    if len(old) != len(new):
+        return False
+    for old_arg, new_arg in zip(old, new):
+        if isinstance(old_arg, np.ndarray) or isinstance(new_arg, np.ndarray):
+            if not np.array_equal(old_arg, new_arg):
+                return False
+        elif type(old_arg) is not type(new_arg) or old_arg != new_arg:
+            return False
+    return True
+
+
+def _remember(args: tuple) -> tuple:
+    # Arrays can be modified in place, so keep our own copy
+    return tuple(
+        arg.copy() if isinstance(arg, np.ndarray) else arg for arg in args
+    )
+
+
+def skip_unchanged(func: Callable) -> Callable:
+    """
+    Method decorator that drops calls with the same arguments as last time.
+
+    The last arguments are stored on the instance, so each widget
+    has its own memory.
+    """
+    name = func.__qualname__
+    attr = f'_last_{func.__name__}_args'
+
+    @functools.wraps(func)
+    def wrapper(self, *args):
+        if args_equal(getattr(self, attr, (_UNSET,)), args):
+            suppressed_counts[name] += 1
+            return None
+        setattr(self, attr, _remember(args))
+        delivered_counts[name] += 1
+        return func(self, *args)
+
+    wrapper.last_args_attr = attr
+    return wrapper
+
+
+def reset_unchanged(method: Callable) -> Optional[tuple]:
+    """
+    Forget the last arguments of a bound skip_unchanged method.
+
+    The next call always goes through. Returns the forgotten arguments,
+    or None if the method hasn't been called yet.
+    """
+    instance = method.__self__
+    attr = method.__func__.last_args_attr
+    last_args = getattr(instance, attr, None)
+    if last_args is not None:
+        delattr(instance, attr)
+    return last_args
+
+
+class ChangeFilter:
+    """
+    Callable wrapper that drops calls with the same arguments as last time.
+
+    Parameters
+    ----------
+    slot : callable
+        The slot to forward changed updates to.
+    name : str, optional
+        The name to count the calls under, by default the slot's name.
+    """
+    def __init__(self, slot: Callable, name: Optional[str] = None):
+        self.slot = slot
+        if name is None:
+            func = getattr(slot, 'func', slot)
+            name = getattr(func, '__qualname__', repr(func))
+        self.name = name
+        self.last_args = (_UNSET,)
+
+    def __call__(self, *args) -> Any:
+        if args_equal(self.last_args, args):
+            suppressed_counts[self.name] += 1
+            return None
+        self.last_args = _remember(args)
+        delivered_counts[self.name] += 1
+        return self.slot(*args)
+
+
+def filter_slots(
+    name: Optional[str] = None,
+    **slots: Optional[Callable],
+) -> dict[str, Optional[Callable]]:
+    """
+    Wrap the value, severity and connection slots of PyDMChannel kwargs.
+
+    Use as ``PyDMChannel(address, **filter_slots(value_slot=...))``.
+    Other keyword arguments, e.g. value_signal, are passed through as-is.
+    If name is given, the calls are counted as e.g. ``name.value_slot``
+    instead of under each slot's own name.
+    """
+    return {
+        key: (
+            ChangeFilter(slot, name=name and f'{name}.{key}')
+            if key in FILTERED_SLOTS and slot else slot
+        )
+        for key, slot in slots.items()
+    }
+
+
+def suppression_stats() -> list[tuple[str, int, int]]:
+    """
+    (name, delivered, suppressed) for every filtered slot, busiest first.
+    """
+    names = set(delivered_counts) | set(suppressed_counts)
+    return sorted(
+        ((name, delivered_counts[name], suppressed_counts[name])
+         for name in names),
+        key=lambda stat: stat[1] + stat[2],
+        reverse=True,
+    )
@@ -0,0 +1,307 @@
+"""
+Detection and display rate limiting for chattering fast faults.
+
+A fast fault whose OK or BeamPermitted readback flaps at tens of Hz will
+otherwise drive a continuous stream of callbacks through every widget
+and counter that watches it. The classes here count every transition
+exactly, but let the displays collapse these channels into a
+"chattering" state that only refreshes at a fixed, slow rate.
+"""
+from __future__ import annotations
+
+import collections
+import functools
+import time
+from typing import Callable, Optional
+
+from pydm.widgets.channel import PyDMChannel
+from qtpy import QtCore, QtWidgets
+
+# Transitions per second above which a channel counts as chattering
+DEFAULT_CHATTER_RATE = 5.0
+# Length of the sliding window used to measure the transition rate
+DEFAULT_CHATTER_WINDOW = 2.0
+# How often to refresh the chattering displays, in ms
+CHATTER_REFRESH_MS = 1000
+
+
+class TransitionTracker:
+    """
+    Count value transitions per key and flag keys that change too often.
+
+    This holds no qt objects so it can be used and tested on its own.
+    A key starts chattering when its transition rate over the sliding
+    window goes above the threshold, and stops again once the rate drops
+    to half of the threshold. The hysteresis keeps the chattering flag
+    itself from flapping.
+
+    Parameters
+    ----------
+    threshold : float, optional
+        The transition rate in transitions per second above which
+        a key is considered to be chattering.
+    window : float, optional
+        The length of the sliding window in seconds.
+    clock : callable, optional
+        Source of timestamps in seconds, for testing.
+    """
+    def __init__(
+        self,
+        threshold: float = DEFAULT_CHATTER_RATE,
+        window: float = DEFAULT_CHATTER_WINDOW,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.threshold = threshold
+        self.window = window
+        self.clock = clock
+        self._last_values = {}
+        self._recent = collections.defaultdict(collections.deque)
+        self._totals = collections.Counter()
+        self._chattering = set()
+
+    def record(self, key: str, value) -> bool:
+        """
+        Stash a new value for key and note if it was a transition.
+
+        Returns True if the key's chattering state changed.
+        The first value seen for a key is never a transition.
+        """
+        try:
+            last = self._last_values[key]
+        except KeyError:
+            self._last_values[key] = value
+            return False
+        self._last_values[key] = value
+        if last == value:
+            return False
+        self._totals[key] += 1
+        self._recent[key].append(self.clock())
+        return self._evaluate(key)
+
+    def forget(self, key: str) -> None:
+        """Drop all state for key, e.g. when its channel is removed."""
+        self._last_values.pop(key, None)
+        self._recent.pop(key, None)
+        self._totals.pop(key, None)
+        self._chattering.discard(key)
+
+    def rate(self, key: str) -> float:
+        """Transitions per second for key over the sliding window."""
+        recent = self._recent.get(key)
+        if not recent:
+            return 0.0
+        self._expire(recent, self.clock())
+        return len(recent) / self.window
+
+    def total(self, key: str) -> int:
+        """The exact number of transitions ever seen for key."""
+        return self._totals[key]
+
+    def is_chattering(self, key: str) -> bool:
+        """True if key is currently flagged as chattering."""
+        return key in self._chattering
+
+    def chattering(self) -> list[str]:
+        """All keys that are currently chattering, sorted."""
+        return sorted(self._chattering)
+
+    def update(self) -> tuple[list[str], list[str]]:
+        """
+        Re-evaluate the chattering keys.
+
+        This is needed because a key that stops changing never calls
+        record again, so it can only leave the chattering state here.
+
+        Returns
+        -------
+        started, stopped : tuple of list of str
+            The keys that started and stopped chattering since the
+            last call to update.
+        """
+        started = []
+        stopped = []
+        for key in list(self._recent):
+            was_chattering = key in self._chattering
+            if self._evaluate(key):
+                if was_chattering:
+                    stopped.append(key)
+                else:
+                    started.append(key)
+        return started, stopped
+
+    def _expire(self, recent: collections.deque, now: float) -> None:
+        cutoff = now - self.window
+        while recent and recent[0] < cutoff:
+            recent.popleft()
+
+    def _evaluate(self, key: str) -> bool:
+        """Update the chattering flag for key, return True on change."""
+        rate = self.rate(key)
+        if key in self._chattering:
+            if rate <= self.threshold / 2:
+                self._chattering.discard(key)
+                return True
+        elif rate > self.threshold:
+            self._chattering.add(key)
+            return True
+        return False
+
+
+class ChatterMonitor(QtCore.QObject):
+    """
+    Shared owner of the channels used to look for chattering fast faults.
+
+    There is one of these per application, see ``ChatterMonitor.instance``.
+    Anything that wants to know if an address is chattering should call
+    ``watch`` with that address. Each address is subscribed to only once,
+    no matter how many tabs are watching it, so that the transition
+    counts are exact.
+
+    The chattering state is only re-evaluated and published once per
+    ``CHATTER_REFRESH_MS`` via ``chatter_changed`` and ``rates_updated``,
+    which sets the pace for every chattering display.
+    """
+    chatter_changed = QtCore.Signal(str, bool)
+    rates_updated = QtCore.Signal()
+
+    _instance: Optional[ChatterMonitor] = None
+
+    def __init__(self, parent=None):
+        super().__init__(parent=parent)
+        self.tracker = TransitionTracker()
+        self._channels = {}
+        self._watchers = collections.Counter()
+        self._timer = QtCore.QTimer(self)
+        self._timer.timeout.connect(self.refresh)
+        self._timer.start(CHATTER_REFRESH_MS)
+        app = QtWidgets.QApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.shutdown)
+
+    @classmethod
+    def instance(cls) -> ChatterMonitor:
+        """Get the application-wide ChatterMonitor, creating it if needed."""
+        if cls._instance is None:
+            cls._instance = cls(parent=QtWidgets.QApplication.instance())
+        return cls._instance
+
+    @classmethod
+    def configure(cls, config: Optional[dict]) -> None:
+        """
+        Apply the chatter settings from the config file, if any.
+
+        Uses the ``chatter_rate`` (transitions per second) and
+        ``chatter_window`` (seconds) keys.
+        """
+        if not config:
+            return
+        tracker = cls.instance().tracker
+        tracker.threshold = float(config.get('chatter_rate', tracker.threshold))
+        tracker.window = float(config.get('chatter_window', tracker.window))
+
+    def watch(self, address: str) -> None:
+        """Start counting transitions on address, if we aren't already."""
+        self._watchers[address] += 1
+        if address in self._channels:
+            return
+        ch = PyDMChannel(
+            address,
+            value_slot=functools.partial(self.new_value, address),
+        )
+        ch.connect()
+        self._channels[address] = ch
+
+    def unwatch(self, address: str) -> None:
+        """Release one watch on address, disconnecting on the last one."""
+        self._watchers[address] -= 1
+        if self._watchers[address] > 0:
+            return
+        del self._watchers[address]
+        ch = self._channels.pop(address, None)
+        if ch is not None:
+            ch.disconnect()
+        if self.tracker.is_chattering(address):
+            self.chatter_changed.emit(address, False)
+        self.tracker.forget(address)
+
+    def shutdown(self) -> None:
+        """
+        Disconnect everything before the rows are torn down.
+
+        The rows unwatch their addresses when they are destroyed, which on
+        exit is after PyDM already dropped its connections.
+        """
+        self._timer.stop()
+        for ch in self._channels.values():
+            ch.disconnect()
+        self._channels.clear()
+
+    def new_value(self, address: str, value) -> None:
+        """Count the transition, announce only if we start chattering."""
+        if self.tracker.record(address, value):
+            if self.tracker.is_chattering(address):
+                self.chatter_changed.emit(address, True)
+            else:
+                self.chatter_changed.emit(address, False)
+
+    def refresh(self) -> None:
+        """Periodic re-evaluation of all the chattering states."""
+        started, stopped = self.tracker.update()
+        for address in started:
+            self.chatter_changed.emit(address, True)
+        for address in stopped:
+            self.chatter_changed.emit(address, False)
+        if self.tracker.chattering():
+            self.rates_updated.emit()
+
+    def is_chattering(self, address: str) -> bool:
+        return self.tracker.is_chattering(address)
+
+    def rate(self, address: str) -> float:
+        return self.tracker.rate(address)
+
+    def chattering(self) -> list[str]:
+        return self.tracker.chattering()
+
+    def channels(self) -> list[PyDMChannel]:
+        """Make sure PyDM can find the channels we set up for cleanup."""
+        return list(self._channels.values())
+
+
+def chatter_text(rate: float) -> str:
+    """The standard collapsed display text for a chattering channel."""
+    return f'chattering ({rate:.0f} transitions/s)'
+
+
+class ChatterListDialog(QtWidgets.QDialog):
+    """
+    Operator-facing list of every chattering channel.
+
+    The list is refreshed at the monitor's rate-limited pace.
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent=parent)
+        self.setWindowTitle('Chattering Fast Faults')
+        self.monitor = ChatterMonitor.instance()
+        self.list_widget = QtWidgets.QListWidget()
+        self.setLayout(QtWidgets.QVBoxLayout())
+        self.layout().addWidget(self.list_widget)
+        self.resize(600, 300)
+        self.monitor.rates_updated.connect(self.refresh)
+        self.monitor.chatter_changed.connect(self.refresh)
+        self.refresh()
+
+    def refresh(self, *args, **kwargs) -> None:
+        if not self.isVisible():
+            return
+        self.list_widget.clear()
+        for address in self.monitor.chattering():
+            rate = self.monitor.rate(address)
+            total = self.monitor.tracker.total(address)
+            self.list_widget.addItem(
+                f'{address}: {chatter_text(rate)}, {total} total'
+            )
+
+    def showEvent(self, ev):
+        super().showEvent(ev)
+        self.refresh()
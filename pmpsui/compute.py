@@ -0,0 +1,174 @@
+"""
+Run pure-python computations off the GUI thread, newest request first.
+
+Some display updates need a bit of pure-python work before anything can
+be drawn, like rendering a beam class table or walking the eV ranges for
+a tooltip. Each one is cheap, but a burst of updates does them all back
+to back in the GUI thread, for values that are replaced right away.
+
+The ``ComputeService`` runs these in a small thread pool and hands each
+result back to a callback in the GUI thread, through the same
+``CallbackBatcher`` as the CA callbacks. Requests are coalesced by key:
+while a key's computation runs, newer requests for the same key only
+replace each other, and only the newest is computed next. A result that
+is already out of date when it arrives is dropped. Each widget then
+computes at most two values per burst, and always ends up showing the
+newest one.
+
+Only hand it pure functions of their arguments: they run in another
+thread and must not touch any widgets.
+"""
+from __future__ import annotations
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Hashable, Optional
+
+from qtpy import QtCore, QtWidgets
+
+from .ca_batch import CallbackBatcher
+
+logger = logging.getLogger(__name__)
+
+# Threads in the pool. The work holds the GIL, so more would not be faster
+COMPUTE_WORKERS = 2
+
+
+class Coalescer:
+    """
+    Bookkeeping of the running and waiting request of each key.
+
+    This is only used from the GUI thread, so it needs no locking.
+    """
+    def __init__(self):
+        self.running = set()
+        self.waiting = {}
+        self.submitted = 0
+        self.computed = 0
+        self.coalesced = 0
+        self.superseded = 0
+
+    def request(self, key: Hashable, job: Any) -> Optional[Any]:
+        """
+        Note a new request, returning the job if it should start now.
+
+        Otherwise, it waits for the key's running job, replacing any job
+        that was already waiting.
+        """
+        self.submitted += 1
+        if key not in self.running:
+            self.running.add(key)
+            return job
+        if key in self.waiting:
+            self.coalesced += 1
+        self.waiting[key] = job
+        return None
+
+    def finished(self, key: Hashable) -> tuple[bool, Optional[Any]]:
+        """
+        Note that the key's job finished.
+
+        Returns whether its result is still the newest, and the waiting
+        job to start next, if any.
+        """
+        self.computed += 1
+        job = self.waiting.pop(key, None)
+        if job is None:
+            self.running.discard(key)
+            return True, None
+        self.superseded += 1
+        return False, job
+
+    def stats(self) -> dict:
+        return dict(
+            submitted=self.submitted,
+            computed=self.computed,
+            coalesced=self.coalesced,
+            superseded=self.superseded,
+            waiting=len(self.waiting),
+        )
+
+
+class ComputeService(QtCore.QObject):
+    """
+    Application-wide pool for computations with results for the GUI.
+
+    There is one of these per application, see ``ComputeService.instance``.
+    It must first be created from the GUI thread.
+    """
+    _instance: Optional[ComputeService] = None
+
+    def __init__(self, parent=None):
+        super().__init__(parent=parent)
+        self.coalescer = Coalescer()
+        self.executor = ThreadPoolExecutor(
+            max_workers=COMPUTE_WORKERS,
+            thread_name_prefix='pmpsui-compute',
+        )
+        # The results come back through this, so it must exist already
+        self.batcher = CallbackBatcher.instance()
+        app = QtWidgets.QApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.shutdown)
+
+    @classmethod
+    def instance(cls) -> ComputeService:
+        """Get the application-wide ComputeService, creating it if needed."""
+        if cls._instance is None:
+            cls._instance = cls(parent=QtWidgets.QApplication.instance())
+        return cls._instance
+
+    def submit(
+        self,
+        key: Hashable,
+        func: Callable,
+        args: tuple,
+        callback: Callable[[Any], None],
+    ) -> None:
+        """
+        Compute func(*args) in the pool and pass the result to callback.
+
+        The callback runs in the GUI thread, unless a newer request with
+        the same key came in first. Use the widget being updated, or a
+        (widget, purpose) tuple, as the key.
+        """
+        job = self.coalescer.request(key, (func, args, callback))
+        if job is not None:
+            self._start(key, job)
+
+    def _start(self, key: Hashable, job: tuple) -> None:
+        try:
+            self.executor.submit(self._run, key, *job)
+        except RuntimeError:
+            # Shutting down, nobody will see the result
+            logger.debug('Dropped computation of %s after shutdown', key)
+
+    def _run(self, key, func, args, callback) -> None:
+        # In a pool thread
+        try:
+            result = func(*args)
+            ok = True
+        except Exception:
+            logger.exception('Error computing %s for %s', func, key)
+            result = None
+            ok = False
+        self.batcher.call(self._finished, key, callback, result, ok)
+
+    def _finished(self, key, callback, result, ok) -> None:
+        # Back in the GUI thread
+        newest, job = self.coalescer.finished(key)
+        if job is not None:
+            self._start(key, job)
+        if not (newest and ok):
+            return
+        try:
+            callback(result)
+        except RuntimeError:
+            # The widget was deleted while its result was computed
+            logger.debug('Dropped computed result for deleted %s', key)
+
+    def stats(self) -> dict:
+        return self.coalescer.stats()
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
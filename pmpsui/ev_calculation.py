@@ -1,16 +1,21 @@
 from pydm import Display
 
+from .qos import QoSPolicy
 from .widgets import UndulatorListWidget
 
 
 class EVCalculation(Display):
+    # The tab name for the update rate config, see pmpsui.qos
+    qos_tab = 'ev_calculation'
+
     def __init__(self, parent=None, args=None, macros=None):
         super(EVCalculation, self).__init__(parent=parent, args=args, macros=macros)
         self.config = macros
+        QoSPolicy.configure(self.config)
         self.setup_ui()
 
     def setup_ui(self):
-        und_list = UndulatorListWidget()
+        und_list = UndulatorListWidget(qos_tab=self.qos_tab)
         self.ui.frm_undulators.layout().addWidget(und_list)
         und_list.prefix = self.config.get('line_arbiter_prefix')
 
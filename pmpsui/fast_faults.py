@@ -1,67 +1,240 @@
 import functools
-import itertools
 import json
-from string import Template
 
 from pydm import Display
-from pydm.widgets import PyDMEmbeddedDisplay
 from pydm.widgets.channel import PyDMChannel
 from pydm.widgets.datetime import PyDMDateTimeEdit, PyDMDateTimeLabel
 from qtpy import QtCore, QtWidgets
 
+from .change_filter import skip_unchanged
+from .chatter import ChatterListDialog, ChatterMonitor, chatter_text
+from .ff_store import FF_CHANNELS, FFO_CHANNELS, FastFaultStore
+from .manifest import manifest_for
+from .reconnect import ReconnectGrouper
+from .template_cache import CachedEmbeddedDisplay
 
-class VisibilityEmbedded(PyDMEmbeddedDisplay):
+# The fast fault readbacks that can chatter, by PV suffix, and the row widget
+# that shows each
+CHATTER_SOURCES = {
+    'OK_RBV': 'FFOk',
+    'BeamPermitted_RBV': 'FFBeamOk',
+}
+# The optional filters, by the name of their ui widgets, and their store flag
+FILTER_FLAGS = {
+    'ok': 'ok',
+    'beampermitted': 'beam_permitted',
+    'vetoed': 'vetoed',
+    'bypassed': 'bypassed',
+}
+# The filter that is always on
+DEFAULT_CONDITIONS = {'in_use': True}
+# The row indicators that show a store flag: ui widget, channel macro, flag.
+# With the ingest process these have no channel and the store feeds them.
+STORE_INDICATORS = (
+    ('FFOk', 'OK_CHANNEL', 'ok'),
+    ('FFBeamOk', 'BEAM_CHANNEL', 'beam_permitted'),
+    ('VetoIndicator', 'VETO_CHANNEL', 'vetoed'),
+    ('BypassIndicator', 'BYPASS_CHANNEL', 'bypassed'),
+)
 
-    def __init__(self, channel=None, *args, **kwargs):
+
+def indicator_macros(base, store_fed):
+    """
+    The channel macros of a row's store indicators.
+
+    These are the same PVs that the store subscribes to, so in process
+    PyDM shares one connection between the two. When the store is fed by
+    the ingest process, the channels are left empty so that the rows
+    don't subscribe to them after all.
+    """
+    ffo_base = base.rsplit(':FF:', 1)[0]
+    addresses = {flag: f'ca://{base}:{suffix}' for suffix, flag in FF_CHANNELS}
+    addresses.update(
+        (flag, f'ca://{ffo_base}:{suffix}') for suffix, flag in FFO_CHANNELS
+    )
+    return {
+        macro: '' if store_fed else addresses[flag]
+        for _, macro, flag in STORE_INDICATORS
+    }
+
+
+class VisibilityEmbedded(CachedEmbeddedDisplay):
+
+    def __init__(self, index=None, prefix=None, store_fed=False,
+                 *args, **kwargs):
         super(VisibilityEmbedded, self).__init__(*args, **kwargs)
         self.setVisible(False)
-        self._connected = None
-        self.channel = None
-        if channel:
-            self.channel = PyDMChannel(channel, connection_slot=self.connection_changed)
-
-    def connection_changed(self, status):
-        self._connected = status
-        if not status:
-            self.setVisible(False)
-
-    @QtCore.Slot(list)
-    def update_filter(self, filters):
-        self.rules = "[]"
-
-        if not filters and self._connected:
-            self.setVisible(True)
+        # Our fast fault's position in the FastFaultStore
+        self.index = index
+        # Whether our indicators are fed from the store, see indicator_macros
+        self.store_fed = store_fed
+        self.conditions = dict(DEFAULT_CONDITIONS)
+        self.chatter_widgets = {}
+        self.chatter_addresses = set()
+        self._chatter_label = None
+        self._collapsed = {}
+        self.ioc_prefix = ReconnectGrouper.instance().prefix_for(prefix)
+
+    def set_chatter(self, address, chattering):
+        """
+        Mark one of our chatter sources as chattering or not.
+
+        While any source is chattering, its indicator is disconnected and
+        replaced by a label that shows the transition rate instead.
+        """
+        if chattering:
+            self.chatter_addresses.add(address)
+        else:
+            self.chatter_addresses.discard(address)
+        self.apply_chatter_state()
+
+    def apply_chatter_state(self):
+        """Collapse or restore the indicators to match our chatter state."""
+        row = self.embedded_widget
+        if row is None:
+            # Not loaded yet, we'll try again in showEvent
             return
-        channels = []
-        conditions = []
-        for idx, filter in enumerate(filters):
-            ch = Template(filter['channel']).safe_substitute(**self.parsed_macros())
-            conditions.append(f'ch[{idx}] == {filter["condition"]}')
-            channels.append(dict(channel=ch, trigger=True))
-
-        rule = {
-            "name": "FF_Visibility",
-            "property": "Visible",
-            "channels": channels,
-            "expression": " and ".join(conditions)
-        }
-        rules = json.dumps([rule])
-        self.rules = rules
+        for address, widget_name in self.chatter_widgets.items():
+            widget = row.findChild(QtWidgets.QWidget, widget_name)
+            if widget is None:
+                continue
+            if address in self.chatter_addresses:
+                if widget_name not in self._collapsed:
+                    self._collapsed[widget_name] = widget.channel
+                    widget.channel = ''
+                    widget.hide()
+            elif widget_name in self._collapsed:
+                widget.channel = self._collapsed.pop(widget_name)
+                widget.show()
+        if self.chatter_addresses and self._chatter_label is None:
+            self._chatter_label = QtWidgets.QLabel(parent=row)
+            self._chatter_label.setStyleSheet('QLabel { color : red; }')
+            row.layout().insertWidget(
+                row.layout().indexOf(row.findChild(QtWidgets.QWidget, 'FFOk')),
+                self._chatter_label,
+            )
+        if self._chatter_label is not None:
+            self._chatter_label.setVisible(bool(self.chatter_addresses))
+            self.update_chatter_rate()
+
+    def update_chatter_rate(self):
+        """Rate-limited refresh of the chattering label text."""
+        if self._chatter_label is None or not self.chatter_addresses:
+            return
+        monitor = ChatterMonitor.instance()
+        rate = max(monitor.rate(addr) for addr in self.chatter_addresses)
+        self._chatter_label.setText(chatter_text(rate))
+
+    def showEvent(self, e):
+        super().showEvent(e)
+        if self.chatter_addresses:
+            self.apply_chatter_state()
+
+    def open_file(self, force=False):
+        display = super().open_file(force=force)
+        if display is not None and self.store_fed:
+            self.feed_indicators(display, 'connected')
+        return display
+
+    def feed_indicators(self, row, flag):
+        """Show one store flag of our fast fault on the row's indicators."""
+        if row is None:
+            return
+        record = FastFaultStore.instance().faults[self.index]
+        for widget_name, _, indicator_flag in STORE_INDICATORS:
+            if flag not in ('connected', indicator_flag):
+                continue
+            widget = row.findChild(QtWidgets.QWidget, widget_name)
+            if widget is None:
+                continue
+            if flag == 'connected':
+                widget.connection_changed(bool(record['connected']))
+            widget.value_changed(int(record[indicator_flag]))
+
+    def fault_changed(self):
+        """Recompute our visibility after our fast fault changed."""
+        # Show or hide all of an IOC's rows together once it is done reconnecting
+        if ReconnectGrouper.instance().hold(
+                self.ioc_prefix, self.apply_visibility):
+            return
+        self.apply_visibility()
+
+    def apply_visibility(self):
+        """Show the row if our fast fault matches the current filters."""
+        matching = FastFaultStore.instance().table.matching(
+            self.conditions, slice(self.index, self.index + 1),
+        )
+        self.set_shown(bool(matching[0]))
+
+    def set_shown(self, shown):
+        if self.isHidden() == shown:
+            self.setVisible(shown)
 
 
 class FastFaults(Display):
-    filters_changed = QtCore.Signal(list)
 
     def __init__(self, parent=None, args=None, macros=None):
         super(FastFaults, self).__init__(parent=parent, args=args, macros=macros)
         self.config = macros
+        self.chatter_rows = {}
+        self.rows = []
+        # store index -> row
+        self.fault_rows = {}
+        # Whether the rows are fed from the store, see indicator_macros
+        self.store_fed = False
+        self.conditions = dict(DEFAULT_CONDITIONS)
         self.setup_ui()
 
     def setup_ui(self):
         self.ui.btn_apply_filters.clicked.connect(self.update_filters)
+        self.setup_chatter()
         self.setup_fastfaults()
         self.setup_datetimes()
 
+    def setup_chatter(self):
+        """
+        Hook up the shared chatter monitor and the chattering list button.
+        """
+        ChatterMonitor.configure(self.config)
+        monitor = ChatterMonitor.instance()
+        monitor.chatter_changed.connect(self.chatter_changed)
+        monitor.rates_updated.connect(self.update_chatter_rates)
+        self.chatter_dialog = None
+        self.chatter_button = QtWidgets.QPushButton('Chattering: 0')
+        self.chatter_button.setToolTip(
+            'Fast faults changing state faster than '
+            f'{monitor.tracker.threshold:g} transitions/s. '
+            'Click to see the full list.'
+        )
+        self.chatter_button.clicked.connect(self.show_chatter_list)
+        layout = self.ui.frame.layout()
+        layout.insertWidget(layout.count() - 1, self.chatter_button)
+
+    def chatter_changed(self, address, chattering):
+        """Route chatter changes to the row that owns the address."""
+        self.chatter_button.setText(
+            f'Chattering: {len(ChatterMonitor.instance().chattering())}'
+        )
+        try:
+            row = self.chatter_rows[address]
+        except KeyError:
+            return
+        row.set_chatter(address, chattering)
+
+    def update_chatter_rates(self):
+        """Refresh the chattering labels at the monitor's slow pace."""
+        for address in ChatterMonitor.instance().chattering():
+            try:
+                self.chatter_rows[address].update_chatter_rate()
+            except KeyError:
+                pass
+
+    def show_chatter_list(self):
+        if self.chatter_dialog is None:
+            self.chatter_dialog = ChatterListDialog(parent=self)
+        self.chatter_dialog.show()
+        self.chatter_dialog.raise_()
+
     def setup_fastfaults(self):
         ffs = self.config.get('fastfaults')
         if not ffs:
@@ -69,69 +242,94 @@ class FastFaults(Display):
         ff_container = self.ui.fastfaults_content
         if ff_container is None:
             return
+        FastFaultStore.configure(self.config)
+        store = FastFaultStore.instance()
+        self.store_fed = store.ingesting
+        template = '../templates/fastfaults_entry.ui'
         count = 0
-        for ff in ffs:
-            prefix = ff.get('prefix')
-            ffo_start = ff.get('ffo_start')
-            ffo_end = ff.get('ffo_end')
-            ff_start = ff.get('ff_start')
-            ff_end = ff.get('ff_end')
-
-            ffos_zfill = len(str(ffo_end)) + 1
-            ffs_zfill = len(str(ff_end)) + 1
-
-            entries = itertools.product(
-                range(ffo_start, ffo_end+1),
-                range(ff_start, ff_end+1)
+        for row in manifest_for(self.config).fastfaults:
+            macros = dict(index=count, P=row.prefix, FFO=row.ffo_text,
+                          FF=row.ff_text)
+            macros.update(indicator_macros(row.base, self.store_fed))
+            widget = VisibilityEmbedded(
+                parent=ff_container,
+                index=row.index,
+                prefix=row.prefix,
+                store_fed=self.store_fed,
             )
-            template = '../templates/fastfaults_entry.ui'
-            for _ffo, _ff in entries:
-                s_ffo = str(_ffo).zfill(ffos_zfill)
-                s_ff = str(_ff).zfill(ffs_zfill)
-                macros = dict(index=count, P=prefix, FFO=s_ffo, FF=s_ff)
-                ch = Template('ca://${P}FFO:${FFO}:FF:${FF}:Info:InUse_RBV').safe_substitute(**macros)
-                widget = VisibilityEmbedded(parent=ff_container, channel=ch)
-                widget.prefixes = macros
-                self.filters_changed[list].connect(widget.update_filter)
-                widget.macros = json.dumps(macros)
-                widget.filename = template
-                widget.disconnectWhenHidden = False
-                ff_container.layout().addWidget(widget)
-                count += 1
+            widget.prefixes = macros
+            self.fault_rows[widget.index] = widget
+            widget.macros = json.dumps(macros)
+            widget.filename = template
+            widget.disconnectWhenHidden = False
+            for suffix, widget_name in CHATTER_SOURCES.items():
+                address = f'ca://{row.base}:{suffix}'
+                widget.chatter_widgets[address] = widget_name
+                self.chatter_rows[address] = widget
+                ChatterMonitor.instance().watch(address)
+                widget.destroyed.connect(functools.partial(
+                    ChatterMonitor.instance().unwatch, address,
+                ))
+            ff_container.layout().addWidget(widget)
+            self.rows.append(widget)
+            count += 1
         vertical_spacer = QtWidgets.QSpacerItem(20, 40,
                                                 QtWidgets.QSizePolicy.Preferred,
                                                 QtWidgets.QSizePolicy.MinimumExpanding)
         ff_container.layout().addItem(vertical_spacer)
+        store.fault_changed.connect(self.fault_changed)
         self.update_filters()
         print(f'Added {count} fast faults')
 
     def ui_filename(self):
         return 'ui/fast_faults.ui'
 
+    def scroll_to_fault(self, index):
+        """
+        Scroll the list so that the fast fault at index is in view.
+
+        The index counts fast faults in config order. Returns False if there
+        is no such row or if the row is currently hidden by the filters.
+        """
+        try:
+            row = self.rows[index]
+        except IndexError:
+            return False
+        if row.isHidden():
+            return False
+        self.ui.scrollArea.ensureWidgetVisible(row)
+        return True
+
+    def fault_changed(self, index, flag):
+        """Update the indicators and visibility of a changed fast fault."""
+        try:
+            row = self.fault_rows[index]
+        except KeyError:
+            return
+        if self.store_fed:
+            row.feed_indicators(row.embedded_widget, flag)
+        if flag != 'connected' and flag not in self.conditions:
+            return
+        row.fault_changed()
+
     def update_filters(self):
-        default_options = [
-            {
-                'name': 'inuse',
-                'channel': 'ca://${P}FFO:${FFO}:FF:${FF}:Info:InUse_RBV',
-                'condition': '"TRUE"',
-            }
-        ]
-        options = [
-            {'name': 'ok', 'channel': 'ca://${P}FFO:${FFO}:FF:${FF}:OK_RBV'},
-            {'name': 'beampermitted', 'channel': 'ca://${P}FFO:${FFO}:FF:${FF}:BeamPermitted_RBV'},
-            {'name': 'vetoed', 'channel': 'ca://${P}FFO:${FFO}:EnableVeto_RBV'},
-            {'name': 'bypassed', 'channel': 'ca://${P}FFO:${FFO}:FF:${FF}:Ovrd:Active_RBV'}
-        ]
-        filters = []
-        for opt in default_options:
-            filters.append(opt)
-        for opt in options:
-            gb = self.findChild(QtWidgets.QGroupBox, f"ff_filter_gb_{opt['name']}")
-            cb = self.findChild(QtWidgets.QComboBox, f"ff_filter_cb_{opt['name']}")
+        """
+        Show only the fast faults that match the filters in the ui.
+
+        Every row is checked at once against the FastFaultStore, and from
+        then on each row is checked again when its fast fault changes.
+        """
+        conditions = dict(DEFAULT_CONDITIONS)
+        for name, flag in FILTER_FLAGS.items():
+            gb = self.findChild(QtWidgets.QGroupBox, f"ff_filter_gb_{name}")
+            cb = self.findChild(QtWidgets.QComboBox, f"ff_filter_cb_{name}")
             if gb.isChecked():
-                opt['condition'] = '"' + str(cb.currentText()).upper() + '"'
-                filters.append(opt)
-        self.filters_changed.emit(filters)
+                conditions[flag] = str(cb.currentText()).upper() == 'TRUE'
+        self.conditions = conditions
+        matching = FastFaultStore.instance().table.matching(conditions)
+        for row in self.rows:
+            row.conditions = conditions
+            row.set_shown(bool(matching[row.index]))
 
     def setup_datetimes(self):
         self.timer = QtCore.QTimer()
@@ -154,9 +352,17 @@ class FastFaults(Display):
     def update_time_delta(self, arbiter_time):
         client_time = QtCore.QDateTime.currentSecsSinceEpoch()
         diff = arbiter_time - client_time
-        text = f'({diff:+d}s)'
-        self.ui.time_delta_label.setText(text)
+        self.set_time_delta_text(f'({diff:+d}s)')
         if abs(diff) >= 5:
-            self.ui.time_delta_label.setStyleSheet("QLabel { color : red; }")
+            self.set_time_delta_style("QLabel { color : red; }")
         elif abs(diff) < 2:
-            self.ui.time_delta_label.setStyleSheet("QLabel { color : black; }")
+            self.set_time_delta_style("QLabel { color : black; }")
+
+    @skip_unchanged
+    def set_time_delta_text(self, text):
+        self.ui.time_delta_label.setText(text)
+
+    @skip_unchanged
+    def set_time_delta_style(self, style):
+        # Setting a stylesheet re-polishes the label, so only do it on change
+        self.ui.time_delta_label.setStyleSheet(style)
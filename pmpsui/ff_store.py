@@ -0,0 +1,472 @@
+"""
+One shared store of the state of every configured fast fault.
+
+The Fast Faults, Arbiter Outputs and PLC IOC Status tabs, as well as the
+overview heatmap, all show the same few readbacks of every fast fault.
+Rather than have each of them subscribe and track these on its own, the
+``FastFaultStore`` subscribes each PV once and keeps the latest state in
+one ``FaultTable``: a NumPy structured array with one record per fast
+fault, in config order (PLC, then FFO, then FF), and an index by
+``(prefix, ffo, ff)``.
+
+Consumers read their counts and flags straight from the table, and
+connect to ``fault_changed`` on the store, or on the ``FastFaultGroup``
+of their PLC or FFO, to hear about each change. Since every tab reads
+the same records, they can't disagree on the counts.
+"""
+from __future__ import annotations
+
+import functools
+import logging
+from typing import Iterator, Optional
+
+import numpy as np
+from pydm.widgets.channel import PyDMChannel
+from qtpy import QtCore, QtWidgets
+
+from .manifest import fastfault_rows
+from .reconnect import ReconnectGrouper
+
+logger = logging.getLogger(__name__)
+
+# The flags that are kept per fast fault, all False until we hear otherwise
+FLAGS = (
+    'connected',
+    'in_use',
+    'alarmed',
+    'ok',
+    'beam_permitted',
+    'bypassed',
+    'vetoed',
+)
+FAULT_DTYPE = np.dtype(
+    [('plc', np.int16), ('ffo', np.int16), ('ff', np.int16)]
+    + [(flag, np.bool_) for flag in FLAGS]
+)
+# PV suffix and flag for the value of each per-fast fault subscription
+FF_CHANNELS = (
+    ('Info:InUse_RBV', 'in_use'),
+    ('OK_RBV', 'ok'),
+    ('BeamPermitted_RBV', 'beam_permitted'),
+    ('Ovrd:Active_RBV', 'bypassed'),
+)
+# The subscription that also sets 'connected' and 'alarmed'
+STATUS_CHANNEL = 'Info:InUse_RBV'
+# PV suffix and flag for each per-FFO subscription, copied to all its faults
+FFO_CHANNELS = (
+    ('EnableVeto_RBV', 'vetoed'),
+)
+# The states that are counted per PLC and per FFO, see FaultTable.counts
+COUNTED_STATES = ('online', 'in_use', 'alarmed', 'faulted', 'bypassed')
+# The flags that these counts depend on
+COUNTED_FLAGS = ('connected', 'in_use', 'alarmed', 'ok', 'bypassed')
+
+
+def fastfault_entries(
+    ffs: Optional[list[dict]],
+) -> Iterator[tuple[str, int, int, str]]:
+    """
+    (prefix, ffo, ff, pv base) for each fast fault in the config, in order.
+
+    The pv base is e.g. ``PLC:TST:MOT:FFO:01:FF:01``, zero-padded the
+    same way as everywhere else in the ui.
+    """
+    for row in fastfault_rows(ffs):
+        yield row.prefix, row.ffo, row.ff, row.base
+
+
+class FaultTable:
+    """
+    The flags of many fast faults in one structured array.
+
+    This holds no qt objects so it can be used and tested on its own.
+    Each PLC's faults, and each of its FFOs' faults, are contiguous, so
+    their records can be read through a slice from ``where``.
+
+    The counts of everything, of each PLC and of each FFO are kept as
+    running totals, adjusted by every flag change in ``set`` and
+    ``set_range``, so reading them from ``totals`` never recounts.
+
+    Parameters
+    ----------
+    ffs : list of dict
+        The ``fastfaults`` section of the config.
+    """
+    def __init__(self, ffs: Optional[list[dict]]):
+        self.plcs = []
+        self.names = []
+        self._index = {}
+        self._slices = {}
+        records = []
+        unset = (False,) * len(FLAGS)
+        for prefix, _ffo, _ff, name in fastfault_entries(ffs):
+            if prefix not in self.plcs:
+                self.plcs.append(prefix)
+            index = len(records)
+            records.append((self.plcs.index(prefix), _ffo, _ff) + unset)
+            self.names.append(name)
+            self._index[(prefix, _ffo, _ff)] = index
+            for key in ((prefix,), (prefix, _ffo)):
+                start = self._slices.get(key, slice(index, index)).start
+                self._slices[key] = slice(start, index + 1)
+        self.faults = np.array(records, dtype=FAULT_DTYPE)
+        # Every flag starts False, so every count starts at zero
+        self._totals = {
+            key: dict.fromkeys(COUNTED_STATES, 0)
+            for key in [()] + list(self._slices)
+        }
+
+    def __len__(self) -> int:
+        return len(self.faults)
+
+    def index(self, prefix: str, ffo: int, ff: int) -> int:
+        """The position of one fast fault's record."""
+        return self._index[(prefix, ffo, ff)]
+
+    def where(self, prefix: str, ffo: Optional[int] = None) -> slice:
+        """The positions of a PLC's records, or of one of its FFOs'."""
+        if ffo is None:
+            return self._slices[(prefix,)]
+        return self._slices[(prefix, ffo)]
+
+    def ffos(self) -> list[tuple[str, int]]:
+        """The (prefix, ffo) of every FFO, in config order."""
+        return [key for key in self._slices if len(key) == 2]
+
+    def group_keys(self, index: int) -> tuple[tuple[str], tuple[str, int]]:
+        """The PLC and FFO keys that the record at index belongs to."""
+        record = self.faults[index]
+        prefix = self.plcs[record['plc']]
+        return (prefix,), (prefix, int(record['ffo']))
+
+    def set(self, index: int, flag: str, value) -> bool:
+        """Set one flag, returning True if it changed."""
+        value = bool(value)
+        column = self.faults[flag]
+        if column[index] == value:
+            return False
+        if flag not in COUNTED_FLAGS:
+            column[index] = value
+            return True
+        before = self._counted(index)
+        column[index] = value
+        self._add_to_totals(index, before, self._counted(index))
+        return True
+
+    def set_range(self, where: slice, flag: str, value) -> list[int]:
+        """Set one flag on many records, returning the ones that changed."""
+        value = bool(value)
+        column = self.faults[flag]
+        start = where.start or 0
+        changed = (np.flatnonzero(column[where] != value) + start).tolist()
+        if flag not in COUNTED_FLAGS:
+            column[where] = value
+            return changed
+        for index in changed:
+            before = self._counted(index)
+            column[index] = value
+            self._add_to_totals(index, before, self._counted(index))
+        return changed
+
+    def _counted(self, index: int) -> tuple[bool, ...]:
+        """Whether one record counts towards each of COUNTED_STATES."""
+        record = self.faults[index]
+        return (
+            bool(record['connected']),
+            bool(record['in_use']),
+            bool(record['alarmed']),
+            bool(record['in_use'] and not record['ok']),
+            bool(record['bypassed']),
+        )
+
+    def _add_to_totals(
+        self,
+        index: int,
+        before: tuple[bool, ...],
+        after: tuple[bool, ...],
+    ) -> None:
+        """Adjust the running totals by the change of one record."""
+        deltas = [
+            (state, int(now) - int(was))
+            for state, was, now in zip(COUNTED_STATES, before, after)
+            if was != now
+        ]
+        for key in ((),) + self.group_keys(index):
+            totals = self._totals[key]
+            for state, delta in deltas:
+                totals[state] += delta
+
+    def totals(
+        self,
+        prefix: Optional[str] = None,
+        ffo: Optional[int] = None,
+    ) -> dict[str, int]:
+        """
+        The running counts of everything, one PLC or one FFO.
+
+        These are the same as ``counts`` of the matching slice, without
+        going over the records.
+        """
+        if prefix is None:
+            return dict(self._totals[()])
+        if ffo is None:
+            return dict(self._totals[(prefix,)])
+        return dict(self._totals[(prefix, ffo)])
+
+    def counts(self, where: slice = slice(None)) -> dict[str, int]:
+        """
+        The number of online, in use, alarmed, faulted and bypassed faults.
+
+        A fault is only faulted when it is in use and not OK, because
+        faults that aren't in use are never OK either.
+        """
+        faults = self.faults[where]
+        return dict(
+            online=int(np.count_nonzero(faults['connected'])),
+            in_use=int(np.count_nonzero(faults['in_use'])),
+            alarmed=int(np.count_nonzero(faults['alarmed'])),
+            faulted=int(np.count_nonzero(faults['in_use'] & ~faults['ok'])),
+            bypassed=int(np.count_nonzero(faults['bypassed'])),
+        )
+
+    def matching(
+        self,
+        conditions: dict[str, bool],
+        where: slice = slice(None),
+    ) -> np.ndarray:
+        """
+        Mask of the connected faults whose flags all have the given values.
+        """
+        faults = self.faults[where]
+        mask = faults['connected'].copy()
+        for flag, wanted in conditions.items():
+            mask &= faults[flag] == bool(wanted)
+        return mask
+
+
+class FastFaultGroup(QtCore.QObject):
+    """
+    Change notifications for the fast faults of one PLC or one FFO.
+
+    ``fault_changed`` is emitted with the store index and the flag name.
+    """
+    fault_changed = QtCore.Signal(int, str)
+
+
+class FastFaultStore(QtCore.QObject):
+    """
+    Application-wide owner of the fast fault subscriptions and their state.
+
+    There is one of these per application, see ``FastFaultStore.instance``.
+    The ``fastfaults`` config is applied once with ``configure``, and from
+    then on every PV is subscribed exactly once and its state is kept in
+    ``table``. ``fault_changed`` is emitted with the store index and the
+    flag name for every change, along with the same signal on the
+    ``group`` of the fault's PLC and FFO.
+
+    Connection changes are reported to the ReconnectGrouper, so consumers
+    can hold their recomputes while an IOC reconnects.
+
+    With ``ingest_process``, the PVs are subscribed in a child process
+    instead, and the store reads the changes from shared memory once per
+    frame (see ``pmpsui.ingest``). Consumers can't tell the difference.
+    If the child never gets ready, or exits later on, the store falls
+    back to subscribing in this process.
+    """
+    fault_changed = QtCore.Signal(int, str)
+
+    _instance: Optional[FastFaultStore] = None
+
+    def __init__(self, parent=None):
+        super().__init__(parent=parent)
+        self.table = FaultTable(None)
+        self._groups = {}
+        self._channels = []
+        self._ingest = None
+        self._poll_timer = None
+
+    @classmethod
+    def instance(cls) -> FastFaultStore:
+        """Get the application-wide FastFaultStore, creating it if needed."""
+        if cls._instance is None:
+            cls._instance = cls(parent=QtWidgets.QApplication.instance())
+        return cls._instance
+
+    @classmethod
+    def configure(
+        cls,
+        config: Optional[dict],
+        ingest_process: bool = False,
+    ) -> None:
+        """
+        Subscribe to every fast fault in the ``fastfaults`` config section.
+
+        Every tab calls this, but only the first call with fast faults in
+        the config sets up the store. With ingest_process, the PVs are
+        subscribed from a child process, falling back to this process if
+        it can't be started.
+        """
+        if not config or not config.get('fastfaults'):
+            return
+        store = cls.instance()
+        if len(store.table):
+            return
+        if ingest_process:
+            store.start_ingest_process(config['fastfaults'])
+            if store.ingesting:
+                return
+            store.add_channels()
+        else:
+            store.add_fastfaults(config['fastfaults'])
+        store.connect()
+
+    @property
+    def faults(self) -> np.ndarray:
+        """The structured array of every fast fault's flags."""
+        return self.table.faults
+
+    @property
+    def ingesting(self) -> bool:
+        """Whether a child process is subscribing instead of us."""
+        return self._ingest is not None
+
+    def add_fastfaults(self, ffs: list[dict]) -> None:
+        """Build the table and the channels for the fast faults config."""
+        self.add_table(ffs)
+        self.add_channels()
+
+    def add_channels(self) -> None:
+        """Build the channels for every fast fault in the table."""
+        table = self.table
+        grouper = ReconnectGrouper.instance()
+        for index, base in enumerate(table.names):
+            for suffix, flag in FF_CHANNELS:
+                address = f'ca://{base}:{suffix}'
+                ch = PyDMChannel(
+                    address,
+                    value_slot=functools.partial(self.new_value, index, flag),
+                )
+                if suffix == STATUS_CHANNEL:
+                    ch.connection_slot = grouper.wrap(
+                        address,
+                        functools.partial(self.new_value, index, 'connected'),
+                    )
+                    ch.severity_slot = functools.partial(
+                        self.new_severity, index,
+                    )
+                self._channels.append(ch)
+        for key in table.ffos():
+            # Same zero-padding as the faults' own names
+            ffo_base = table.names[table.where(*key).start]
+            ffo_base = ffo_base.rsplit(':FF:', 1)[0]
+            for suffix, flag in FFO_CHANNELS:
+                self._channels.append(PyDMChannel(
+                    f'ca://{ffo_base}:{suffix}',
+                    value_slot=functools.partial(
+                        self.new_ffo_value, key, flag,
+                    ),
+                ))
+
+    def add_table(self, ffs: list[dict]) -> None:
+        """Build the table and the groups, without any channels."""
+        self.table = table = FaultTable(ffs)
+        for prefix in table.plcs:
+            self._groups[(prefix,)] = FastFaultGroup(parent=self)
+        for key in table.ffos():
+            self._groups[key] = FastFaultGroup(parent=self)
+
+    def connect(self) -> None:
+        for ch in self._channels:
+            ch.connect()
+
+    def start_ingest_process(self, ffs: list[dict]) -> None:
+        """Subscribe from a child process and poll its shared memory."""
+        from . import ingest
+
+        self.add_table(ffs)
+        self._ingest = ingest.start(ffs, self.table)
+        if self._ingest is None:
+            return
+        self._poll_timer = QtCore.QTimer(self)
+        self._poll_timer.timeout.connect(self.poll_ingest)
+        self._poll_timer.start(ingest.POLL_MS)
+        app = QtWidgets.QApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.stop_ingest_process)
+
+    def poll_ingest(self) -> None:
+        """Apply the changes the child process made since the last frame."""
+        if not self._ingest.is_alive():
+            logger.error('The fast fault ingest process exited')
+            self.fall_back_in_process()
+            return
+        try:
+            self._ingest.check_ready()
+        except (ChildProcessError, TimeoutError):
+            logger.exception('The fast fault ingest process never got ready')
+            self.fall_back_in_process()
+            return
+        grouper = ReconnectGrouper.instance()
+        for index, flag, value in self._ingest.changes():
+            if flag == 'connected':
+                grouper.connection_changed(
+                    f'ca://{self.table.names[index]}:{STATUS_CHANNEL}', value,
+                )
+            self.new_value(index, flag, value)
+
+    def fall_back_in_process(self) -> None:
+        """Subscribe from this process after giving up on the child."""
+        self.stop_ingest_process()
+        # Nothing that the child saw can be trusted until we connect again
+        for index in range(len(self.table)):
+            self.new_value(index, 'connected', False)
+        self.add_channels()
+        self.connect()
+
+    def stop_ingest_process(self) -> None:
+        if self._poll_timer is not None:
+            self._poll_timer.stop()
+        if self._ingest is not None:
+            self._ingest.close()
+            self._ingest = None
+
+    def group(self, prefix: str, ffo: Optional[int] = None) -> FastFaultGroup:
+        """The change notifications for one PLC, or one of its FFOs."""
+        if ffo is None:
+            return self._groups[(prefix,)]
+        return self._groups[(prefix, ffo)]
+
+    def index(self, prefix: str, ffo: int, ff: int) -> int:
+        return self.table.index(prefix, ffo, ff)
+
+    def where(self, prefix: str, ffo: Optional[int] = None) -> slice:
+        return self.table.where(prefix, ffo)
+
+    def counts(
+        self,
+        prefix: Optional[str] = None,
+        ffo: Optional[int] = None,
+    ) -> dict[str, int]:
+        """Running counts of the faults of everything, one PLC or one FFO."""
+        return self.table.totals(prefix, ffo)
+
+    def new_value(self, index: int, flag: str, value) -> None:
+        if self.table.set(index, flag, value):
+            self._notify(index, flag)
+
+    def new_severity(self, index: int, severity: int) -> None:
+        # 0 = NO_ALARM, 1 = MINOR, 2 = MAJOR, 3 = INVALID
+        self.new_value(index, 'alarmed', severity != 0)
+
+    def new_ffo_value(self, key: tuple[str, int], flag: str, value) -> None:
+        for index in self.table.set_range(self.table.where(*key), flag, value):
+            self._notify(index, flag)
+
+    def _notify(self, index: int, flag: str) -> None:
+        for key in self.table.group_keys(index):
+            self._groups[key].fault_changed.emit(index, flag)
+        self.fault_changed.emit(index, flag)
+
+    def channels(self) -> list[PyDMChannel]:
+        """Make sure PyDM can find the channels we set up for cleanup."""
+        return self._channels
@@ -0,0 +1,119 @@
+"""
+Bounded in-process history of the arbiter output counts.
+
+This keeps a short local record of how the fault and bypass counts of
+each FFO have changed, without needing the grafana web view. Everything
+is stored in fixed-size numpy ring buffers so memory use stays constant
+no matter how long the screen is left open.
+"""
+from __future__ import annotations
+
+import time
+from typing import Callable
+
+import numpy as np
+
+# Number of transitions to keep per count
+DEFAULT_HISTORY_LENGTH = 512
+
+
+class RingBuffer:
+    """
+    Fixed-size buffer of (timestamp, value) samples.
+
+    Once full, each new sample overwrites the oldest one.
+
+    Parameters
+    ----------
+    length : int, optional
+        The maximum number of samples to keep.
+    clock : callable, optional
+        Source of timestamps in seconds, for testing.
+    dtype : numpy dtype, optional
+        The type of the stored values.
+    """
+    def __init__(
+        self,
+        length: int = DEFAULT_HISTORY_LENGTH,
+        clock: Callable[[], float] = time.time,
+        dtype: np.dtype = np.int32,
+    ):
+        self.length = length
+        self.clock = clock
+        self._times = np.zeros(length, dtype=np.float64)
+        self._values = np.zeros(length, dtype=dtype)
+        self._next = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, value: int, timestamp: float | None = None) -> None:
+        """Add a sample, by default stamped with the current time."""
+        if timestamp is None:
+            timestamp = self.clock()
+        self._times[self._next] = timestamp
+        self._values[self._next] = value
+        self._next = (self._next + 1) % self.length
+        self._size = min(self._size + 1, self.length)
+
+    def samples(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Return copies of the stored timestamps and values, oldest first.
+        """
+        if self._size < self.length:
+            return (
+                self._times[:self._size].copy(),
+                self._values[:self._size].copy(),
+            )
+        order = np.roll(np.arange(self.length), -self._next)
+        return self._times[order], self._values[order]
+
+    def clear(self) -> None:
+        """Forget all of the stored samples."""
+        self._next = 0
+        self._size = 0
+
+    def latest(self) -> int | None:
+        """The most recent value, or None if nothing has been recorded."""
+        if not self._size:
+            return None
+        return int(self._values[self._next - 1])
+
+
+class FFOHistory:
+    """
+    The fault and bypass count history for one FFO.
+
+    Only transitions are stored, so a count that holds steady
+    does not use up any of the buffer.
+
+    Parameters
+    ----------
+    length : int, optional
+        The maximum number of transitions to keep for each count.
+    clock : callable, optional
+        Source of timestamps in seconds, for testing.
+    """
+    def __init__(
+        self,
+        length: int = DEFAULT_HISTORY_LENGTH,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.faults = RingBuffer(length=length, clock=clock)
+        self.bypasses = RingBuffer(length=length, clock=clock)
+
+    @staticmethod
+    def _record(buffer: RingBuffer, count: int) -> bool:
+        if buffer.latest() == count:
+            return False
+        buffer.append(count)
+        return True
+
+    def record_faults(self, count: int) -> bool:
+        """Record a new fault count, return True if it was a transition."""
+        return self._record(self.faults, count)
+
+    def record_bypasses(self, count: int) -> bool:
+        """Record a new bypass count, return True if it was a transition."""
+        return self._record(self.bypasses, count)
@@ -3,12 +3,18 @@ import logging
 from pydm.widgets.datetime import PyDMDateTimeEdit, TimeBase
 from qtpy import QtCore
 
+from . import ca_batch, monitor_mask
+
 logger = logging.getLogger(__name__)
 
 
 def apply_hotfixes():
     # Edge case: pydm v1.27.1 for Seconds mode (absolute set)
     PyDMDateTimeEdit.send_value = hotfix_send_value
+    # Deliver CA callbacks to the GUI thread in batches, see ca_batch
+    ca_batch.install()
+    # Only subscribe to the CA events that the listeners use
+    monitor_mask.install()
 
 
 def hotfix_send_value(self):
@@ -0,0 +1,313 @@
+"""
+Fast fault ingestion in a child process, shared with the GUI through memory.
+
+With ``--ingest-process``, the FastFaultStore doesn't subscribe to the
+fast fault PVs itself. Instead, an ``IngestProcess`` starts a child
+process (``python -m pmpsui.ingest``) that subscribes to them with
+pyepics. The child gets the ``fastfaults`` config over its stdin, and
+exits when that pipe closes, so it never outlives the GUI. Once it has
+subscribed, it says so on its stdout. The GUI looks for that from its
+poll timer rather than waiting for it, and subscribes in process if it
+never comes, or if the child exits later on. The child writes each
+fault's flags straight into a structured array in shared memory, with
+the same layout as the store's FaultTable. It also bumps a per-record
+version counter after every change.
+
+The child only ever writes and the GUI only ever reads, so no locks are
+shared between them. Once per frame the GUI compares the versions to the
+ones it has seen, and only reads the records that moved (see
+``IngestProcess.changes``). A burst of thousands of CA callbacks then
+costs the GUI thread one vectorized compare per frame instead of one
+event per callback.
+"""
+from __future__ import annotations
+
+import functools
+import json
+import logging
+import os
+import select
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import Optional
+
+import numpy as np
+
+from .ff_store import (FAULT_DTYPE, FF_CHANNELS, FFO_CHANNELS, FLAGS,
+                       STATUS_CHANNEL, FaultTable)
+
+logger = logging.getLogger(__name__)
+
+# How often the GUI reads the changes from the child process, in ms
+POLL_MS = 16
+# What the child process says once it has subscribed
+READY = b'ready\n'
+# How long after the start to give up on the child if it isn't ready, in s
+READY_TIMEOUT = 10.0
+
+
+def shared_size(count: int) -> int:
+    """Bytes of shared memory needed for count fast faults."""
+    return _versions_offset(count) + count * np.dtype(np.uint32).itemsize
+
+
+def _versions_offset(count: int) -> int:
+    # Keep the version counters aligned so each write is a single store
+    return -(-count * FAULT_DTYPE.itemsize // 8) * 8
+
+
+def shared_arrays(buffer, count: int) -> tuple[np.ndarray, np.ndarray]:
+    """The fault records and version counters inside a shared buffer."""
+    faults = np.ndarray(count, dtype=FAULT_DTYPE, buffer=buffer)
+    versions = np.ndarray(
+        count, dtype=np.uint32, buffer=buffer,
+        offset=_versions_offset(count),
+    )
+    return faults, versions
+
+
+class SharedWriter:
+    """
+    The child process's end: set flags and bump the record versions.
+
+    The CA callbacks come from several threads, so writes are serialized
+    with a lock that lives only in the child.
+    """
+    def __init__(self, faults: np.ndarray, versions: np.ndarray):
+        self.faults = faults
+        self.versions = versions
+        self.lock = threading.Lock()
+
+    def set(self, index: int, flag: str, value) -> None:
+        value = bool(value)
+        with self.lock:
+            column = self.faults[flag]
+            if column[index] != value:
+                column[index] = value
+                # The flag first, so the reader never sees a stale record
+                self.versions[index] += 1
+
+    def set_range(self, where: slice, flag: str, value) -> None:
+        value = bool(value)
+        with self.lock:
+            column = self.faults[flag]
+            changed = column[where] != value
+            if changed.any():
+                column[where] = value
+                self.versions[where][changed] += 1
+
+
+class SharedReader:
+    """
+    The GUI's end: find which flags changed since the last look.
+
+    Parameters
+    ----------
+    faults, versions : np.ndarray
+        The shared arrays, see ``shared_arrays``.
+    table : FaultTable
+        The GUI's own copy of the flags, which is compared against.
+    """
+    def __init__(
+        self,
+        faults: np.ndarray,
+        versions: np.ndarray,
+        table: FaultTable,
+    ):
+        self.faults = faults
+        self.versions = versions
+        self.table = table
+        self.seen = np.zeros_like(versions)
+
+    def changes(self) -> list[tuple[int, str, bool]]:
+        """(index, flag, value) of every flag that changed, in index order."""
+        moved = np.flatnonzero(self.versions != self.seen)
+        if not moved.size:
+            return []
+        self.seen[moved] = self.versions[moved]
+        # Copy, so the child can carry on writing while we compare
+        records = self.faults[moved]
+        local = self.table.faults[moved]
+        changes = []
+        for flag in FLAGS:
+            for pos in np.flatnonzero(records[flag] != local[flag]):
+                changes.append(
+                    (int(moved[pos]), flag, bool(records[flag][pos]))
+                )
+        changes.sort()
+        return changes
+
+
+def _new_value(writer, index, flag, value=None, severity=None, **kwargs):
+    if value is not None:
+        writer.set(index, flag, value)
+    if severity is not None and flag == 'in_use':
+        # 0 = NO_ALARM, 1 = MINOR, 2 = MAJOR, 3 = INVALID
+        writer.set(index, 'alarmed', severity != 0)
+
+
+def _new_conn(writer, index, conn=None, **kwargs):
+    writer.set(index, 'connected', conn)
+
+
+def _new_ffo_value(writer, where, flag, value=None, **kwargs):
+    if value is not None:
+        writer.set_range(where, flag, value)
+
+
+def ingest_main(shm_name: str) -> None:
+    """
+    Child process entry point: subscribe and write until the GUI exits.
+    """
+    import epics
+
+    ffs = json.loads(sys.stdin.readline())
+    shm = shared_memory.SharedMemory(name=shm_name)
+    # The GUI owns the memory, don't let our tracker remove it on exit
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    table = FaultTable(ffs)
+    writer = SharedWriter(*shared_arrays(shm.buf, len(table)))
+    pvs = []
+    for index, base in enumerate(table.names):
+        for suffix, flag in FF_CHANNELS:
+            kwargs = {}
+            if suffix == STATUS_CHANNEL:
+                kwargs['connection_callback'] = functools.partial(
+                    _new_conn, writer, index,
+                )
+            pvs.append(epics.PV(
+                f'{base}:{suffix}',
+                callback=functools.partial(_new_value, writer, index, flag),
+                **kwargs,
+            ))
+    for key in table.ffos():
+        ffo_base = table.names[table.where(*key).start].rsplit(':FF:', 1)[0]
+        for suffix, flag in FFO_CHANNELS:
+            pvs.append(epics.PV(
+                f'{ffo_base}:{suffix}',
+                callback=functools.partial(
+                    _new_ffo_value, writer, table.where(*key), flag,
+                ),
+            ))
+    sys.stdout.buffer.write(READY)
+    sys.stdout.flush()
+    # The GUI stops reading, send anything else to stderr instead
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    # Until the GUI closes the pipe, or exits
+    sys.stdin.read()
+    for pv in pvs:
+        pv.clear_callbacks()
+        pv.disconnect()
+    del writer
+    shm.close()
+
+
+class IngestProcess:
+    """
+    The child process that ingests the fast faults, seen from the GUI.
+
+    Parameters
+    ----------
+    ffs : list of dict
+        The ``fastfaults`` section of the config.
+    table : FaultTable
+        The GUI's own copy of the flags, see ``SharedReader``.
+    """
+    def __init__(self, ffs: list[dict], table: FaultTable):
+        count = len(table)
+        self.process = None
+        self.shm = shared_memory.SharedMemory(
+            create=True, size=max(shared_size(count), 1),
+        )
+        faults, versions = shared_arrays(self.shm.buf, count)
+        faults[:] = table.faults
+        versions[:] = 0
+        self.reader = SharedReader(faults, versions, table)
+        self.ready = False
+        self.deadline = time.monotonic() + READY_TIMEOUT
+        self._received = b''
+        try:
+            self.process = subprocess.Popen(
+                [sys.executable, '-m', __name__, self.shm.name],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+            )
+            self.process.stdin.write(json.dumps(ffs).encode() + b'\n')
+            self.process.stdin.flush()
+        except BaseException:
+            self.close()
+            raise
+        logger.info(
+            'Ingesting %d fast faults in process %d', count, self.process.pid,
+        )
+
+    def check_ready(self) -> bool:
+        """
+        See if the child has said it has subscribed, without waiting.
+
+        Raises ChildProcessError if it exited first, and TimeoutError if
+        it still hasn't said so by ``deadline``.
+        """
+        if self.ready:
+            return True
+        stdout = self.process.stdout
+        while select.select([stdout], [], [], 0)[0]:
+            data = os.read(stdout.fileno(), len(READY))
+            if not data:
+                raise ChildProcessError(
+                    'The ingest process exited before it was ready'
+                )
+            self._received += data
+            if self._received.endswith(READY):
+                stdout.close()
+                self.ready = True
+                return True
+        if time.monotonic() > self.deadline:
+            raise TimeoutError(
+                f'The ingest process was not ready after {READY_TIMEOUT} s'
+            )
+        return False
+
+    def changes(self) -> list[tuple[int, str, bool]]:
+        return self.reader.changes()
+
+    def is_alive(self) -> bool:
+        return self.process.poll() is None
+
+    def close(self) -> None:
+        """Stop the child and release the shared memory."""
+        if self.process is not None:
+            try:
+                self.process.stdin.close()
+                self.process.wait(1)
+            except (OSError, subprocess.TimeoutExpired):
+                self.process.kill()
+                self.process.wait()
+        # Drop our views of the buffer before closing it
+        self.reader = None
+        try:
+            self.shm.close()
+            self.shm.unlink()
+        except (BufferError, FileNotFoundError):
+            logger.debug('Shared fast fault memory was already released')
+
+
+def start(ffs: list[dict], table: FaultTable) -> Optional[IngestProcess]:
+    """
+    Start the child process, or return None if that isn't possible.
+
+    This doesn't wait for the child to subscribe, see
+    ``IngestProcess.check_ready``.
+    """
+    try:
+        return IngestProcess(ffs, table)
+    except OSError:
+        logger.exception('Could not start the fast fault ingest process')
+        return None
+
+
+if __name__ == '__main__':
+    ingest_main(sys.argv[1])
@@ -2,14 +2,13 @@ import functools
 
 from pydm import Display
 from pydm.exception import raise_to_operator
-from pydm.widgets import PyDMLabel
 from pydm.widgets.channel import PyDMChannel
 from qtpy import QtCore, QtWidgets
 
 from .beamclass_table import bc_table, get_desc_for_bc, install_bc_setText
 from .data_bounds import VALID_RATES, get_valid_rate
 from .tooltips import get_tooltip_for_bc
-from .utils import morph_into_vertical
+from .widgets import EvRangeBroadcaster
 
 
 class LineBeamParametersControl(Display):
@@ -52,8 +51,8 @@ class LineBeamParametersControl(Display):
         return 'ui/line_beam_parameters.ui'
 
     def setup_ui(self):
+        self.setup_ev_range_labels()
         self.setup_bits_connections()
-        self.setup_bit_indicators()
         self.setup_energy_range_channel()
         self.setup_rate_channel()
         self.setup_bc_bits_connections()
@@ -75,15 +74,6 @@ class LineBeamParametersControl(Display):
             cb.clicked.connect(functools.partial(
                 self.calc_energy_range, key))
 
-    def setup_bit_indicators(self):
-        """
-        Borrowed function from fast_faults, to help morph the labels vertically
-        """
-        for key in self._bits:
-            label = self.findChild(PyDMLabel, f"label_{key}")
-            if label is not None:
-                morph_into_vertical(label)
-
     def calc_energy_range(self, key, checked):
         """
         Catch when a check box is checked/unchecked and calculate
@@ -105,6 +95,18 @@ class LineBeamParametersControl(Display):
         # emit the decimal value to the PhotonEnergyRange
         self.energy_range_signal.emit(decimal_value)
 
+    def setup_ev_range_labels(self):
+        """
+        Make sure the shared eV range definitions feed our bit labels.
+
+        This is already done by the main PMPS screen, but not when this
+        tab is opened on its own.
+        """
+        prefix = self.config.get('line_arbiter_prefix')
+        EvRangeBroadcaster.instance().set_address(
+            f'ca://{prefix}eVRangeCnst_RBV'
+        )
+
     def setup_energy_range_channel(self):
         prefix = self.config.get('line_arbiter_prefix')
         ch = f'ca://{prefix}BeamParamCntl:ReqBP:PhotonEnergyRanges'
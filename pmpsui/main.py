@@ -18,6 +18,12 @@ def make_parser():
         help='Disable the grafana web view tab.',
     )
 
+    parser.add_argument(
+        '--no-fast-faults',
+        action='store_true',
+        help='Skip the fast faults tab to save on startup and PV connections.',
+    )
+
     parser.add_argument(
         '--area',
         required=True,
@@ -25,6 +31,33 @@ def make_parser():
         help="Which area's configuration to load"
     )
 
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        '--mirror',
+        action='store_true',
+        help=(
+            'Show the PVs from a running --aggregate process on this host '
+            'instead of connecting to them directly. The display is '
+            'read-only.'
+        ),
+    )
+    mode.add_argument(
+        '--aggregate',
+        action='store_true',
+        help=(
+            'Run without a display, connecting to the PVs once and serving '
+            'them to the --mirror displays on this host.'
+        ),
+    )
+    mode.add_argument(
+        '--ingest-process',
+        action='store_true',
+        help=(
+            'Subscribe to the fast fault PVs from a separate process, '
+            'leaving the display process free to draw.'
+        ),
+    )
+
     parser.add_argument(
         '--log_level',
         help='Configure logging level',
@@ -57,6 +90,19 @@ def main():
     parser = make_parser()
     args = parser.parse_args()
 
+    if args.aggregate:
+        from .manifest import config_path, load_config
+        from .mirror import run_aggregator
+        logging.basicConfig(
+            format="[%(asctime)s] [%(levelname)-8s] - %(message)s",
+            level=args.log_level,
+        )
+        return run_aggregator(args.area, load_config(config_path(args.area)))
+    if args.mirror:
+        # Before the display connects to anything
+        from .mirror import install, mirror_name
+        install(mirror_name(args.area))
+
     try:
         """
         We must import QtWebEngineWidgets before creating a QApplication
@@ -74,6 +120,10 @@ def main():
     cli_args = ['--log_level', args.log_level]
     if args.no_web:
         cli_args = ['--no-web'] + cli_args
+    if args.no_fast_faults:
+        cli_args = ['--no-fast-faults'] + cli_args
+    if args.ingest_process:
+        cli_args = ['--ingest-process'] + cli_args
 
     # Here we supply the path to PyDMApplication, without doing this teardown
     # results in channel connection errors.  (create QApp, create display, exec)
@@ -83,5 +133,6 @@ def main():
         macros=macros,
         use_main_window=False,
         hide_nav_bar=True,
+        read_only=args.mirror,
     )
     qapp.exec_()
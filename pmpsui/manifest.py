@@ -0,0 +1,299 @@
+"""
+The rows and PV names of a config, expanded once and cached on disk.
+
+The Fast Faults, Arbiter Outputs, PLC IOC Status and Preemptive Requests
+tabs, and the FastFaultStore, all build their rows from the same config
+sections. Rather than each of them expanding the FFO and FF ranges and
+zero-padding them on its own, the config is compiled once into a
+``PVManifest``: a tuple of rows per section, in config order, with the
+PV name bases interned so that each name is one shared str. Each row
+knows its index in its section, and each FFO knows the indices of its
+fast faults.
+
+``load_config`` reads a config file and its manifest from a cache file,
+keyed by the config file's path, mtime and size, and only parses the
+YAML and compiles the manifest when the config changed. Consumers get
+the manifest of a config they were given with ``manifest_for``, and
+the fast fault rows of a ``fastfaults`` section with ``fastfault_rows``.
+The manifest is kept on the ``Config`` that ``load_config`` returns, so
+it is only compiled once per loaded config.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+import yaml
+
+from .version import __version__
+
+logger = logging.getLogger(__name__)
+
+# Bump this when the rows change, so that old cache files are not used
+MANIFEST_FORMAT = 1
+
+
+class FastFaultRow(NamedTuple):
+    """One fast fault, e.g. ``PLC:TST:MOT:FFO:01:FF:001``."""
+    index: int
+    prefix: str
+    ffo: int
+    ff: int
+    ffo_text: str
+    ff_text: str
+    base: str
+
+
+class FFORow(NamedTuple):
+    """One fast fault output, and the indices of its fast faults."""
+    index: int
+    plc: int
+    prefix: str
+    name: str
+    ffo: int
+    ffo_text: str
+    desc: str
+    veto: str
+    ff_start: int
+    ff_end: int
+    faults: range
+
+
+class PLCRow(NamedTuple):
+    """One entry of the ``fastfaults`` section, and its FFOs' indices."""
+    index: int
+    prefix: str
+    name: str
+    ffos: range
+
+
+class RequestRow(NamedTuple):
+    """One preemptive request assertion pool entry."""
+    index: int
+    prefix: str
+    arbiter: str
+    pool_text: str
+
+
+def fastfault_rows(ffs: Optional[list[dict]]) -> tuple[FastFaultRow, ...]:
+    """Expand the ``fastfaults`` config section into one row per fault."""
+    rows = []
+    for ff in ffs or []:
+        prefix = sys.intern(ff.get('prefix'))
+        ffo_end = ff.get('ffo_end')
+        ff_end = ff.get('ff_end')
+        ffos_zfill = len(str(ffo_end)) + 1
+        ffs_zfill = len(str(ff_end)) + 1
+        for _ffo in range(ff.get('ffo_start'), ffo_end + 1):
+            s_ffo = sys.intern(str(_ffo).zfill(ffos_zfill))
+            for _ff in range(ff.get('ff_start'), ff_end + 1):
+                s_ff = sys.intern(str(_ff).zfill(ffs_zfill))
+                rows.append(FastFaultRow(
+                    len(rows), prefix, _ffo, _ff, s_ffo, s_ff,
+                    sys.intern(f'{prefix}FFO:{s_ffo}:FF:{s_ff}'),
+                ))
+    return tuple(rows)
+
+
+class PVManifest:
+    """
+    Every row that the tabs build from one config.
+
+    Parameters
+    ----------
+    config : dict
+        The whole config file.
+    """
+    def __init__(self, config: Optional[dict]):
+        config = config or {}
+        ffs = config.get('fastfaults') or []
+        self.fastfaults = fastfault_rows(ffs)
+        plcs = []
+        ffos = []
+        plc_start = 0
+        for plc, ff in enumerate(ffs):
+            prefix = sys.intern(ff.get('prefix'))
+            ffo_range = range(ff.get('ffo_start'), ff.get('ffo_end') + 1)
+            ff_range = range(ff.get('ff_start'), ff.get('ff_end') + 1)
+            ffos_zfill = len(str(ff.get('ffo_end'))) + 1
+            ffo_desc = ff.get('ffo_desc', [''] * len(ffo_range))
+            ffo_veto = ff.get('ffo_veto', [''] * len(ffo_range))
+            first = len(ffos)
+            # Like the arbiter outputs always did, stop at short lists
+            for pos, (_ffo, desc, veto) in enumerate(
+                zip(ffo_range, ffo_desc, ffo_veto)
+            ):
+                start = plc_start + pos * len(ff_range)
+                ffos.append(FFORow(
+                    len(ffos), plc, prefix, ff.get('name'), _ffo,
+                    sys.intern(str(_ffo).zfill(ffos_zfill)), desc, veto,
+                    ff_range.start, ff_range.stop - 1,
+                    range(start, start + len(ff_range)),
+                ))
+            plc_start += len(ffo_range) * len(ff_range)
+            plcs.append(PLCRow(
+                plc, prefix, ff.get('name'), range(first, len(ffos)),
+            ))
+        self.plcs = tuple(plcs)
+        self.ffos = tuple(ffos)
+        # The index of each fast fault's FFO, None if it has no FFO row
+        fault_ffos = [None] * len(self.fastfaults)
+        for ffo in ffos:
+            for index in ffo.faults:
+                fault_ffos[index] = ffo.index
+        self.fault_ffos = tuple(fault_ffos)
+        requests = []
+        for req in config.get('preemptive_requests') or []:
+            prefix = sys.intern(req.get('prefix'))
+            arbiter = sys.intern(req.get('arbiter_instance'))
+            pool_end = req.get('assertion_pool_end')
+            pool_zfill = len(str(pool_end)) + 1
+            for pool_id in range(req.get('assertion_pool_start'), pool_end + 1):
+                requests.append(RequestRow(
+                    len(requests), prefix, arbiter,
+                    sys.intern(str(pool_id).zfill(pool_zfill)),
+                ))
+        self.requests = tuple(requests)
+
+    def ffo_faults(self, ffo: FFORow) -> tuple[FastFaultRow, ...]:
+        """The fast fault rows of one FFO."""
+        return self.fastfaults[ffo.faults.start:ffo.faults.stop]
+
+    def to_data(self) -> dict:
+        """The rows as plain lists, with each range as [start, stop]."""
+        return dict(
+            fastfaults=[list(row) for row in self.fastfaults],
+            ffos=[row[:-1] + (_span(row.faults),) for row in self.ffos],
+            plcs=[row[:-1] + (_span(row.ffos),) for row in self.plcs],
+            fault_ffos=list(self.fault_ffos),
+            requests=[list(row) for row in self.requests],
+        )
+
+    @classmethod
+    def from_data(cls, data: dict) -> PVManifest:
+        """Rebuild the rows from ``to_data``, interning the names again."""
+        manifest = cls.__new__(cls)
+        manifest.fastfaults = tuple(
+            FastFaultRow(index, sys.intern(prefix), ffo, ff,
+                         sys.intern(ffo_text), sys.intern(ff_text),
+                         sys.intern(base))
+            for index, prefix, ffo, ff, ffo_text, ff_text, base
+            in data['fastfaults']
+        )
+        manifest.ffos = tuple(
+            FFORow(index, plc, sys.intern(prefix), name, ffo,
+                   sys.intern(ffo_text), desc, veto, ff_start, ff_end,
+                   range(*faults))
+            for (index, plc, prefix, name, ffo, ffo_text, desc, veto,
+                 ff_start, ff_end, faults) in data['ffos']
+        )
+        manifest.plcs = tuple(
+            PLCRow(index, sys.intern(prefix), name, range(*ffos))
+            for index, prefix, name, ffos in data['plcs']
+        )
+        manifest.fault_ffos = tuple(data['fault_ffos'])
+        manifest.requests = tuple(
+            RequestRow(index, sys.intern(prefix), sys.intern(arbiter),
+                       sys.intern(pool_text))
+            for index, prefix, arbiter, pool_text in data['requests']
+        )
+        return manifest
+
+
+def _span(span: range) -> list[int]:
+    return [span.start, span.stop]
+
+
+class Config(dict):
+    """A config file's contents, holding its manifest once compiled."""
+    manifest: Optional[PVManifest] = None
+
+
+def manifest_for(config: Optional[dict]) -> PVManifest:
+    """
+    The manifest of a config.
+
+    A ``Config`` from ``load_config`` keeps its manifest, so it is only
+    compiled once, and dropped along with the config. Any other dict is
+    compiled on each call.
+    """
+    manifest = getattr(config, 'manifest', None)
+    if manifest is None:
+        manifest = PVManifest(config)
+        if isinstance(config, Config):
+            config.manifest = manifest
+    return manifest
+
+
+def config_path(area: str) -> Path:
+    """The bundled config file for an area, e.g. KFE."""
+    return Path(__file__).parent / 'configs' / f'{area}_config.yml'
+
+
+def cache_path(path: Path) -> Path:
+    """Where the compiled version of a config file is kept."""
+    root = Path(os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache')
+    digest = hashlib.sha1(str(path).encode()).hexdigest()[:12]
+    return root / 'pmpsui' / f'{path.stem}-{digest}.json'
+
+
+def load_config(path) -> Config:
+    """
+    Load a config file, using its compiled cache if it's up to date.
+
+    The cache is JSON of the config and its manifest's rows. The
+    manifest is then available from ``manifest_for`` on the returned
+    config.
+    """
+    start = time.perf_counter()
+    path = Path(path).resolve()
+    stat = path.stat()
+    key = [MANIFEST_FORMAT, str(__version__), str(path), stat.st_mtime_ns,
+           stat.st_size]
+    cache = cache_path(path)
+    try:
+        with open(cache, 'r') as fd:
+            cached = json.load(fd)
+        cached_key = cached['key']
+        if cached_key == key:
+            config = cached['config']
+            manifest = PVManifest.from_data(cached['manifest'])
+    except FileNotFoundError:
+        cached_key = None
+    except Exception:
+        logger.debug('Ignoring unreadable config cache %s', cache,
+                     exc_info=True)
+        cached_key = None
+    if cached_key == key:
+        source = 'cache'
+    else:
+        source = 'yaml'
+        with open(path, 'r') as fd:
+            config = yaml.safe_load(fd)
+        manifest = PVManifest(config)
+        try:
+            text = json.dumps(dict(key=key, config=config,
+                                   manifest=manifest.to_data()))
+            cache.parent.mkdir(parents=True, exist_ok=True)
+            # Write and rename, so a concurrent start never reads half
+            tmp = cache.with_suffix(f'.{os.getpid()}.tmp')
+            tmp.write_text(text)
+            os.replace(tmp, cache)
+        except (OSError, TypeError):
+            logger.debug('Could not write config cache %s', cache,
+                         exc_info=True)
+    config = Config(config)
+    config.manifest = manifest
+    logger.info(
+        'Loaded %s from %s in %.1f ms: %d fast faults, %d FFOs, '
+        '%d preemptive requests',
+        path.name, source, (time.perf_counter() - start) * 1000,
+        len(manifest.fastfaults), len(manifest.ffos), len(manifest.requests),
+    )
+    return config
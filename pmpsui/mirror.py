@@ -0,0 +1,477 @@
+"""
+Read-only mirror of the channel access PVs over a local socket.
+
+Normally every pmpsui instance opens its own CA channels to every PV it
+shows, so several operators on one host mean several times the IOC load
+and several slow startups. Instead, one ``pmpsui --aggregate`` process
+per area can own the CA connections through a ``MirrorServer``. Any
+number of ``pmpsui --mirror`` displays on the same host can then render
+from it.
+
+The mirror displays replace PyDM's ca:// plugin with the ``MirrorPlugin``.
+Every widget works as usual, but without any CA connections of its own
+and without write access.
+
+The aggregator subscribes to the config's fast faults up front. It keeps
+every PV that any client has asked for subscribed for as long as it runs,
+so later clients start from its cached state right away.
+
+The protocol is one JSON object per line. Clients send ``{"sub": pvname}``
+and ``{"unsub": pvname}``. The server sends ``{"pv": pvname, ...}`` with
+the fields of the PV's state that changed: ``conn``, ``value`` (see
+``encode_value``) and the CTRL_FIELDS.
+"""
+from __future__ import annotations
+
+import collections
+import functools
+import json
+import logging
+import signal
+from typing import Any, Callable, Optional
+
+import numpy as np
+from pydm import data_plugins
+from pydm.data_plugins.plugin import PyDMConnection, PyDMPlugin
+from qtpy import QtCore, QtNetwork, QtWidgets
+
+from .ca_batch import CallbackBatcher
+from .ff_store import FF_CHANNELS, FFO_CHANNELS, fastfault_entries
+
+try:
+    import epics
+    from pydm.data_plugins.epics_plugins.pyepics_plugin_component import (
+        float_types, int_types)
+except ImportError:
+    epics = None
+    float_types = int_types = set()
+
+logger = logging.getLogger(__name__)
+
+# How long a mirror display waits before trying the aggregator again, in ms
+RETRY_MS = 2000
+# How long to wait for a running aggregator to answer before replacing it
+ANSWER_MS = 500
+# The control fields of a PV's state, and the signal that each one feeds
+CTRL_FIELDS = dict(
+    severity='new_severity_signal',
+    precision='prec_signal',
+    enum_strs='enum_strings_signal',
+    units='unit_signal',
+    upper_ctrl_limit='upper_ctrl_limit_signal',
+    lower_ctrl_limit='lower_ctrl_limit_signal',
+    upper_alarm_limit='upper_alarm_limit_signal',
+    lower_alarm_limit='lower_alarm_limit_signal',
+    upper_warning_limit='upper_warning_limit_signal',
+    lower_warning_limit='lower_warning_limit_signal',
+    timestamp='timestamp_signal',
+)
+# How to make each control field JSON-friendly
+CTRL_TYPES = dict(
+    severity=int,
+    precision=int,
+    enum_strs=lambda strs: [
+        s.decode('ascii') if isinstance(s, bytes) else str(s) for s in strs
+    ],
+    units=lambda units: (
+        units.decode() if isinstance(units, bytes) else str(units)
+    ),
+    timestamp=float,
+)
+
+_UNSET = object()
+
+
+def mirror_name(area: str) -> str:
+    """The local socket name of the aggregator for an area."""
+    return f'pmpsui-{area.lower()}'
+
+
+def encode_value(value, char_value: Optional[str], ftype: Optional[int]):
+    """
+    JSON-friendly [kind, value] of a pyepics callback value.
+
+    The kind picks the PyDM signal overload, the same way that PyDM's
+    pyepics plugin picks it from the field type.
+    """
+    if isinstance(value, np.ndarray):
+        return ['array', value.tolist(), value.dtype.str]
+    if ftype in int_types:
+        try:
+            return ['int', int(value)]
+        except (ValueError, TypeError):
+            return ['str', char_value]
+    if ftype in float_types:
+        return ['float', float(value)]
+    return ['str', char_value]
+
+
+def decode_value(encoded: list) -> tuple[type, Any]:
+    """The PyDM signal type and value of an encode_value result."""
+    kind, value = encoded[:2]
+    if kind == 'array':
+        return np.ndarray, np.array(value, dtype=np.dtype(encoded[2]))
+    return dict(int=int, float=float, str=str)[kind], value
+
+
+def callback_state(
+    value=None,
+    char_value: Optional[str] = None,
+    ftype: Optional[int] = None,
+    **kwargs,
+) -> dict:
+    """
+    The state fields in the arguments of a pyepics monitor callback.
+    """
+    state = {}
+    for field in CTRL_FIELDS:
+        field_value = kwargs.get(field)
+        if field_value is None:
+            continue
+        if field == 'units' and not len(field_value):
+            # PyDM ignores empty units
+            continue
+        state[field] = CTRL_TYPES.get(field, float)(field_value)
+    if value is not None:
+        state['value'] = encode_value(value, char_value, ftype)
+    return state
+
+
+def encode_message(message: dict) -> bytes:
+    """One line of the protocol."""
+    return json.dumps(message, separators=(',', ':')).encode() + b'\n'
+
+
+class LineReader:
+    """
+    Splits the bytes read from a socket into protocol messages.
+
+    Partial lines are kept until the rest of them arrives.
+    """
+    def __init__(self):
+        self._buffer = b''
+
+    def feed(self, data: bytes) -> list[dict]:
+        """Add newly read bytes, returning the messages they complete."""
+        *lines, self._buffer = (self._buffer + data).split(b'\n')
+        messages = []
+        for line in lines:
+            try:
+                messages.append(json.loads(line))
+            except ValueError:
+                logger.warning('Dropping bad mirror message %r', line[:80])
+        return messages
+
+
+class MirrorSource:
+    """
+    One PV that the aggregator ingests, and its latest state.
+
+    The pyepics callbacks are moved to the main thread by the
+    CallbackBatcher, and only the fields that changed are published.
+
+    Parameters
+    ----------
+    pvname : str
+        The PV to subscribe to.
+    publish : callable
+        Called with the pvname and a dict of the changed fields.
+    """
+    def __init__(self, pvname: str, publish: Callable[[str, dict], None]):
+        self.pvname = pvname
+        self.publish = publish
+        self.state = {}
+        self.pv = epics.PV(
+            pvname,
+            form='ctrl',
+            auto_monitor=(
+                epics.dbr.DBE_VALUE | epics.dbr.DBE_ALARM
+                | epics.dbr.DBE_PROPERTY
+            ),
+            connection_callback=self.new_conn,
+        )
+        self.pv.add_callback(self.new_value, with_ctrlvars=True)
+
+    def new_conn(self, conn=None, **kwargs) -> None:
+        CallbackBatcher.instance().call(self.update, dict(conn=bool(conn)))
+
+    def new_value(self, **kwargs) -> None:
+        CallbackBatcher.instance().call(self.update, callback_state(**kwargs))
+
+    def update(self, fields: dict) -> None:
+        changed = {
+            field: value for field, value in fields.items()
+            if self.state.get(field, _UNSET) != value
+        }
+        if changed:
+            self.state.update(changed)
+            self.publish(self.pvname, changed)
+
+
+class MirrorServer(QtCore.QObject):
+    """
+    The aggregator's end of the mirror, serving PV states to local clients.
+
+    Parameters
+    ----------
+    name : str
+        The local socket name to listen on, see ``mirror_name``.
+    parent : QObject, optional
+        Standard qt parent argument.
+    """
+    def __init__(self, name: str, parent=None):
+        super().__init__(parent=parent)
+        self.sources = {}
+        # pvname -> sockets subscribed to it
+        self.subscribers = collections.defaultdict(set)
+        self._readers = {}
+        self.server = QtNetwork.QLocalServer(self)
+        # Operators sharing the host may be different users of one group
+        self.server.setSocketOptions(
+            QtNetwork.QLocalServer.UserAccessOption
+            | QtNetwork.QLocalServer.GroupAccessOption
+        )
+        if server_answers(name):
+            raise RuntimeError(f'Another aggregator is already serving {name}')
+        # Nothing answered, clean up after one that didn't exit cleanly
+        QtNetwork.QLocalServer.removeServer(name)
+        if not self.server.listen(name):
+            raise RuntimeError(
+                f'Cannot listen on {name}: {self.server.errorString()}'
+            )
+        self.server.newConnection.connect(self.new_client)
+        logger.info('Serving mirror clients on %s', self.server.fullServerName())
+
+    def ingest(self, pvname: str) -> MirrorSource:
+        """Start ingesting a PV, if we aren't already."""
+        try:
+            return self.sources[pvname]
+        except KeyError:
+            source = MirrorSource(pvname, self.publish)
+            self.sources[pvname] = source
+            return source
+
+    def ingest_config(self, config: dict) -> None:
+        """Start ingesting every fast fault PV in the config."""
+        ffo_bases = {}
+        for _, _, _, base in fastfault_entries(config.get('fastfaults')):
+            for suffix, _ in FF_CHANNELS:
+                self.ingest(f'{base}:{suffix}')
+            ffo_bases[base.rsplit(':FF:', 1)[0]] = None
+        for ffo_base in ffo_bases:
+            for suffix, _ in FFO_CHANNELS:
+                self.ingest(f'{ffo_base}:{suffix}')
+        logger.info('Ingesting %d PVs from the config', len(self.sources))
+
+    def new_client(self) -> None:
+        while self.server.hasPendingConnections():
+            sock = self.server.nextPendingConnection()
+            self._readers[sock] = LineReader()
+            sock.readyRead.connect(functools.partial(self.read_client, sock))
+            sock.disconnected.connect(functools.partial(self.drop_client, sock))
+            logger.info('Mirror client connected, %d total', len(self._readers))
+
+    def read_client(self, sock: QtNetwork.QLocalSocket) -> None:
+        for message in self._readers[sock].feed(bytes(sock.readAll())):
+            if 'sub' in message:
+                self.subscribe(sock, message['sub'])
+            elif 'unsub' in message:
+                self.subscribers[message['unsub']].discard(sock)
+
+    def subscribe(self, sock: QtNetwork.QLocalSocket, pvname: str) -> None:
+        """Send a client a PV's updates, starting with what we know now."""
+        self.subscribers[pvname].add(sock)
+        source = self.ingest(pvname)
+        if source.state:
+            sock.write(encode_message(dict(pv=pvname, **source.state)))
+
+    def publish(self, pvname: str, changed: dict) -> None:
+        subscribers = self.subscribers.get(pvname)
+        if not subscribers:
+            return
+        line = encode_message(dict(pv=pvname, **changed))
+        for sock in subscribers:
+            sock.write(line)
+
+    def drop_client(self, sock: QtNetwork.QLocalSocket) -> None:
+        self._readers.pop(sock, None)
+        for subscribers in self.subscribers.values():
+            subscribers.discard(sock)
+        sock.deleteLater()
+        logger.info('Mirror client disconnected, %d left', len(self._readers))
+
+
+class MirrorClient(QtCore.QObject):
+    """
+    A mirror display's link to the aggregator.
+
+    There is one of these per application, see ``MirrorClient.instance``.
+    It keeps trying to reach the aggregator, and while it can't, every
+    mirrored PV shows as disconnected.
+    """
+    # The aggregator's socket name, set by install
+    server_name: Optional[str] = None
+
+    _instance: Optional[MirrorClient] = None
+
+    def __init__(self, parent=None):
+        super().__init__(parent=parent)
+        self.connections = {}
+        self._reader = LineReader()
+        self._online = None
+        self.socket = QtNetwork.QLocalSocket(self)
+        self.socket.connected.connect(self.resubscribe)
+        self.socket.disconnected.connect(self.lost)
+        self.socket.errorOccurred.connect(self.lost)
+        self.socket.readyRead.connect(self.read)
+        self._retry = QtCore.QTimer(self)
+        self._retry.setSingleShot(True)
+        self._retry.setInterval(RETRY_MS)
+        self._retry.timeout.connect(self.connect_to_server)
+        self.connect_to_server()
+
+    @classmethod
+    def instance(cls) -> MirrorClient:
+        """Get the application-wide MirrorClient, creating it if needed."""
+        if cls._instance is None:
+            cls._instance = cls(parent=QtWidgets.QApplication.instance())
+        return cls._instance
+
+    def connect_to_server(self) -> None:
+        self._reader = LineReader()
+        self.socket.abort()
+        self.socket.connectToServer(self.server_name)
+
+    def is_connected(self) -> bool:
+        return (
+            self.socket.state() == QtNetwork.QLocalSocket.ConnectedState
+        )
+
+    def send(self, message: dict) -> None:
+        if self.is_connected():
+            self.socket.write(encode_message(message))
+
+    def subscribe(self, pvname: str, connection: MirrorConnection) -> None:
+        self.connections[pvname] = connection
+        self.send(dict(sub=pvname))
+
+    def unsubscribe(self, pvname: str) -> None:
+        if self.connections.pop(pvname, None) is not None:
+            self.send(dict(unsub=pvname))
+
+    def resubscribe(self) -> None:
+        logger.info('Connected to the PMPS aggregator %s', self.server_name)
+        self._online = True
+        for pvname in self.connections:
+            self.send(dict(sub=pvname))
+
+    def read(self) -> None:
+        for message in self._reader.feed(bytes(self.socket.readAll())):
+            connection = self.connections.get(message.pop('pv', None))
+            if connection is not None:
+                connection.apply(message)
+
+    def lost(self, *args) -> None:
+        """Show everything as disconnected until we get back in touch."""
+        if self._retry.isActive():
+            return
+        self._retry.start()
+        if self._online is False:
+            return
+        self._online = False
+        logger.warning(
+            'No PMPS aggregator at %s, retrying every %g s',
+            self.server_name, RETRY_MS / 1000,
+        )
+        for connection in self.connections.values():
+            connection.apply(dict(conn=False))
+
+
+class MirrorConnection(PyDMConnection):
+    """
+    A read-only PyDM connection fed by the aggregator instead of CA.
+    """
+    def __init__(self, channel, address, protocol=None, parent=None):
+        super().__init__(channel, address, protocol, parent)
+        self.state = {}
+        MirrorClient.instance().subscribe(address, self)
+        self.add_listener(channel)
+
+    def add_listener(self, channel) -> None:
+        # Deliberately never hooked up to put_value, this is read-only
+        super().add_listener(channel)
+        # Catch the new listener up with what we already know
+        fields = dict(conn=False)
+        fields.update(self.state)
+        self.send_state(fields)
+
+    def apply(self, fields: dict) -> None:
+        """Take in changed fields from the aggregator."""
+        self.state.update(fields)
+        self.send_state(fields)
+
+    def send_state(self, fields: dict) -> None:
+        """Emit state fields in the same order as PyDM's pyepics plugin."""
+        if 'conn' in fields:
+            self.connected = fields['conn']
+            self.connection_state_signal.emit(self.connected)
+            self.write_access_signal.emit(False)
+        for field, signal_name in CTRL_FIELDS.items():
+            try:
+                value = fields[field]
+            except KeyError:
+                continue
+            if field == 'enum_strs':
+                value = tuple(value)
+            getattr(self, signal_name).emit(value)
+        if 'value' in fields:
+            signal_type, value = decode_value(fields['value'])
+            self.new_value_signal[signal_type].emit(value)
+
+    def close(self) -> None:
+        MirrorClient.instance().unsubscribe(self.address)
+
+
+class MirrorPlugin(PyDMPlugin):
+    """PyDM data plugin for ca:// addresses that reads from the aggregator."""
+    protocol = 'ca'
+    connection_class = MirrorConnection
+
+
+def install(name: str) -> None:
+    """
+    Mirror every ca:// address from the aggregator at name.
+
+    Call this before any channels are connected.
+    """
+    MirrorClient.server_name = name
+    data_plugins.initialize_plugins_if_needed()
+    data_plugins.plugin_modules[MirrorPlugin.protocol] = MirrorPlugin()
+
+
+def server_answers(name: str) -> bool:
+    """Whether a server is listening on the local socket name."""
+    sock = QtNetwork.QLocalSocket()
+    sock.connectToServer(name)
+    try:
+        return sock.waitForConnected(ANSWER_MS)
+    finally:
+        sock.abort()
+
+
+def run_aggregator(area: str, config: dict) -> int:
+    """
+    Ingest the area's PVs and serve them to mirror displays until killed.
+    """
+    app = QtCore.QCoreApplication.instance()
+    if app is None:
+        app = QtCore.QCoreApplication([])
+    # Qt doesn't give python a chance to handle ctrl-c, so just exit
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    try:
+        server = MirrorServer(mirror_name(area), parent=app)
+    except RuntimeError as ex:
+        logger.error('%s', ex)
+        return 1
+    server.ingest_config(config)
+    return app.exec_()
@@ -0,0 +1,244 @@
+"""
+Narrow channel access monitor masks to what the listeners of a PV use.
+
+PyDM subscribes every PV for value, alarm and property events, so a
+severity change wakes up a consumer that only shows the value, and a
+value change wakes up a consumer that only cares about the severity.
+
+With the ``install`` hotfix, each channel is given the narrowest mask
+that covers its needs (see ``channel_mask``), and each PV is subscribed
+with the union of the masks of its current listeners. A connection-only
+consumer, like a PV probe, doesn't get a subscription at all.
+
+The callbacks delivered per mask can be read from ``event_stats``.
+"""
+from __future__ import annotations
+
+import collections
+import functools
+import weakref
+from typing import Callable
+
+import pydm
+from pydm.data_plugins.plugin import PyDMConnection
+from qtpy.QtWidgets import QApplication
+
+from .ca_batch import CallbackBatcher, Connection
+
+try:
+    import epics
+    from pydm.data_plugins.epics_plugins.pyepics_plugin_component import \
+        PyEPICSPlugin
+except ImportError:
+    epics = PyEPICSPlugin = None
+
+# The epics.dbr.DBE_* event types
+VALUE = 1
+ALARM = 4
+PROPERTY = 8
+# What PyDM asks for by default
+DEFAULT_MASK = VALUE | ALARM | PROPERTY
+
+# The events that each PyDMChannel slot needs
+SLOT_MASKS = dict(
+    value_slot=VALUE,
+    timestamp_slot=VALUE,
+    severity_slot=ALARM,
+    enum_strings_slot=PROPERTY,
+    unit_slot=PROPERTY,
+    prec_slot=PROPERTY,
+    upper_ctrl_limit_slot=PROPERTY,
+    lower_ctrl_limit_slot=PROPERTY,
+    upper_alarm_limit_slot=PROPERTY,
+    lower_alarm_limit_slot=PROPERTY,
+    upper_warning_limit_slot=PROPERTY,
+    lower_warning_limit_slot=PROPERTY,
+)
+# Widgets that connect every slot but only show the value and alarm
+WIDGET_MASKS = dict(
+    PyDMByteIndicator=VALUE | ALARM,
+    PyDMDateTimeLabel=VALUE | ALARM,
+    RateLimitedLabel=VALUE | ALARM,
+)
+
+# masked_init is a copy of the pyepics plugin's Connection.__init__ from this
+# pydm version, check it against the new one before changing this
+PYDM_VERSION = '1.29.0'
+
+# Every connection made since install, for event_stats
+_connections = weakref.WeakSet()
+
+
+def mask_name(mask: int) -> str:
+    """Readable name of a mask, e.g. 'value|alarm'."""
+    names = [
+        name for name, bit in
+        (('value', VALUE), ('alarm', ALARM), ('property', PROPERTY))
+        if mask & bit
+    ]
+    return '|'.join(names) or 'none'
+
+
+def channel_mask(channel) -> int:
+    """
+    The events that a PyDMChannel needs.
+
+    This is, in order of precedence, the channel's ``monitor_mask``
+    attribute if it has one, the WIDGET_MASKS entry for the widget
+    that owns the channel, or the union of the SLOT_MASKS of the slots
+    that the channel has.
+    """
+    mask = getattr(channel, 'monitor_mask', None)
+    if mask is not None:
+        return mask
+    owner = getattr(channel.value_slot, '__self__', None)
+    if owner is not None:
+        for cls in type(owner).__mro__:
+            try:
+                return WIDGET_MASKS[cls.__name__]
+            except KeyError:
+                pass
+    mask = 0
+    for slot_name, slot_mask in SLOT_MASKS.items():
+        if getattr(channel, slot_name, None) is not None:
+            mask |= slot_mask
+    return mask
+
+
+def _apply_mask(connection) -> None:
+    mask = 0
+    for listener_mask in connection.listener_masks:
+        mask |= listener_mask
+    if connection.pv.auto_monitor != mask:
+        connection.pv.auto_monitor = mask
+
+
+def add_listener_mask(connection, mask: int) -> None:
+    """Widen the connection's subscription for a new listener, if needed."""
+    connection.listener_masks[mask] += 1
+    _apply_mask(connection)
+
+
+def remove_listener_mask(connection, mask: int) -> None:
+    """Narrow the connection's subscription after a listener left."""
+    connection.listener_masks[mask] -= 1
+    if connection.listener_masks[mask] <= 0:
+        del connection.listener_masks[mask]
+    if connection.listener_count > 0:
+        _apply_mask(connection)
+
+
+def event_stats() -> list[tuple[str, int, int]]:
+    """
+    (mask, connections, callbacks) for each subscription mask in use.
+    """
+    connections = collections.Counter()
+    events = collections.Counter()
+    for connection in list(_connections):
+        name = mask_name(connection.pv.auto_monitor or 0)
+        connections[name] += 1
+        events[name] += connection.monitor_events
+    return [
+        (name, connections[name], events[name])
+        for name in sorted(connections)
+    ]
+
+
+def masked_init(self, channel, pv, protocol=None, parent=None):
+    """
+    Copy of the pyepics Connection.__init__, with the channel's mask.
+
+    Copied from pydm v1.29.0, see PYDM_VERSION.
+
+    The PV is created with the first channel's mask, rather than
+    changing it afterwards, which could race the CA thread subscribing
+    with the default mask and leave a second subscription behind.
+    """
+    PyDMConnection.__init__(self, channel, pv, protocol, parent)
+    self.app = QApplication.instance()
+    # These are the hotfix lines
+    self.listener_masks = collections.Counter()
+    self.monitor_events = 0
+    self.pv = epics.PV(
+        pv,
+        connection_callback=self.send_connection_state,
+        form="ctrl",
+        auto_monitor=channel_mask(channel),
+        access_callback=self.send_access_state,
+    )
+    _connections.add(self)
+    # These were the hotfix lines
+    self._value = None
+    self._severity = None
+    self._precision = None
+    self._enum_strs = None
+    self._unit = None
+    self._upper_ctrl_limit = None
+    self._lower_ctrl_limit = None
+    self._upper_alarm_limit = None
+    self._lower_alarm_limit = None
+    self._upper_warning_limit = None
+    self._lower_warning_limit = None
+    self._timestamp = None
+
+    PyEPICSPlugin.thread_pool.submit(self.setup_callbacks, channel)
+
+
+def _masked_add_listener(method: Callable) -> Callable:
+    @functools.wraps(method)
+    def wrapper(self, channel):
+        method(self, channel)
+        # After the listener is added, which may be from the GUI thread too
+        CallbackBatcher.instance().call(
+            add_listener_mask, self, channel_mask(channel),
+        )
+
+    wrapper.unmasked = method
+    return wrapper
+
+
+def _masked_remove_listener(method: Callable) -> Callable:
+    @functools.wraps(method)
+    def wrapper(self, channel, *args, **kwargs):
+        method(self, channel, *args, **kwargs)
+        CallbackBatcher.instance().call(
+            remove_listener_mask, self, channel_mask(channel),
+        )
+
+    wrapper.unmasked = method
+    return wrapper
+
+
+def _counted(method: Callable) -> Callable:
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self.monitor_events += 1
+        method(self, *args, **kwargs)
+
+    wrapper.unmasked = method
+    return wrapper
+
+
+def install() -> None:
+    """
+    Subscribe the pyepics plugin's PVs with their listeners' masks.
+
+    This relies on the CA callback batching from ca_batch, so that the
+    masks are only ever changed from the GUI thread, and like it, only
+    affects connections that are made after it is called.
+    """
+    if Connection is None or not hasattr(Connection.add_listener, 'unbatched'):
+        return
+    if hasattr(Connection.add_listener, 'unmasked'):
+        return
+    assert pydm.__version__ == PYDM_VERSION, (
+        f'monitor_mask.masked_init is a copy of pydm {PYDM_VERSION}, '
+        f'check it against pydm {pydm.__version__} and update it'
+    )
+    masked_init.unmasked = Connection.__init__
+    Connection.__init__ = masked_init
+    Connection.add_listener = _masked_add_listener(Connection.add_listener)
+    Connection.remove_listener = _masked_remove_listener(
+        Connection.remove_listener
+    )
+    Connection.send_new_value = _counted(Connection.send_new_value)
@@ -0,0 +1,234 @@
+"""
+PLC task scan-rate health from the TaskInfo CycleCount PVs.
+
+Each PLC task publishes an ever-increasing cycle count. Keeping the last
+few (time, count) samples of each one in a small ring buffer is enough
+to work out how many cycles per second the task is running, how much
+that rate jitters and whether the task has stopped counting altogether,
+which is the "PLC online but stopped" case that the PV severity alone
+cannot tell us.
+
+The counts are fed in by ``PLCIOCStatus`` from the channels it already
+has open. Other tooling can read the results from
+``PLCHealthMonitor.instance()`` without any additional CA subscriptions:
+
+    monitor = PLCHealthMonitor.instance()
+    for plc in monitor.plcs():
+        print(plc, monitor.plc_health(plc))
+"""
+from __future__ import annotations
+
+import collections
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import numpy as np
+from qtpy import QtCore, QtWidgets
+
+from .history import RingBuffer
+
+# Number of cycle count samples to keep per task
+DEFAULT_CYCLE_SAMPLES = 32
+# Seconds without a new cycle count before a task counts as stalled
+DEFAULT_STALL_TIMEOUT = 5.0
+# How often to re-check for stalls and publish new rates, in ms
+HEALTH_REFRESH_MS = 1000
+
+
+@dataclass(frozen=True)
+class TaskHealth:
+    """
+    Snapshot of the scan-rate health of one PLC task.
+
+    Attributes
+    ----------
+    rate : float or None
+        Average cycles per second over the buffered samples, or None
+        if there are not enough samples yet.
+    jitter : float or None
+        Standard deviation of the cycle rate between consecutive samples,
+        in cycles per second, or None if there are not enough samples.
+    stalled : bool
+        True if the cycle count has not advanced within the stall timeout.
+    last_change : float or None
+        The time.monotonic timestamp of the last cycle count change.
+    """
+    rate: Optional[float]
+    jitter: Optional[float]
+    stalled: bool
+    last_change: Optional[float]
+
+
+class CycleCountTracker:
+    """
+    Ring buffer of (timestamp, cycle count) samples for one PLC task.
+
+    This holds no qt objects so it can be used and tested on its own.
+    A count that goes backwards means the PLC was restarted or the
+    counter wrapped, so the buffer is started over from that sample.
+    A count that is published again unchanged is still buffered, so the
+    rate drops, but it doesn't count as a change for the stall check.
+
+    Parameters
+    ----------
+    length : int, optional
+        The number of samples to keep.
+    stall_timeout : float, optional
+        Seconds without a new cycle count before the task counts as stalled.
+    clock : callable, optional
+        Source of timestamps in seconds, for testing.
+    """
+    def __init__(
+        self,
+        length: int = DEFAULT_CYCLE_SAMPLES,
+        stall_timeout: float = DEFAULT_STALL_TIMEOUT,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.samples = RingBuffer(length=length, clock=clock, dtype=np.int64)
+        self.stall_timeout = stall_timeout
+        self.clock = clock
+        self.changed_at = None
+
+    def record(self, count: int) -> None:
+        """Stash a new cycle count, stamped with the current time."""
+        latest = self.samples.latest()
+        if latest is not None and count < latest:
+            self.samples.clear()
+        if count != latest:
+            self.changed_at = self.clock()
+        self.samples.append(count)
+
+    def rate(self) -> Optional[float]:
+        """Average cycles per second over the buffered samples."""
+        times, counts = self.samples.samples()
+        if len(times) < 2 or times[-1] <= times[0]:
+            return None
+        return float((counts[-1] - counts[0]) / (times[-1] - times[0]))
+
+    def jitter(self) -> Optional[float]:
+        """Standard deviation of the rate between consecutive samples."""
+        times, counts = self.samples.samples()
+        if len(times) < 3:
+            return None
+        dt = np.diff(times)
+        valid = dt > 0
+        if valid.sum() < 2:
+            return None
+        return float(np.std(np.diff(counts)[valid] / dt[valid]))
+
+    def last_change(self) -> Optional[float]:
+        """When the cycle count last changed, or None if never seen."""
+        return self.changed_at
+
+    def is_stalled(self) -> bool:
+        """True if we have seen the task count, but not recently."""
+        last_change = self.last_change()
+        if last_change is None:
+            return False
+        return self.clock() - last_change > self.stall_timeout
+
+    def health(self) -> TaskHealth:
+        """Take a snapshot of this task's current health."""
+        return TaskHealth(
+            rate=self.rate(),
+            jitter=self.jitter(),
+            stalled=self.is_stalled(),
+            last_change=self.last_change(),
+        )
+
+
+class PLCHealthMonitor(QtCore.QObject):
+    """
+    Application-wide store of the cycle count trackers for every PLC task.
+
+    There is one of these per application, see ``PLCHealthMonitor.instance``.
+    ``health_updated`` is emitted once per ``HEALTH_REFRESH_MS`` if any
+    count has changed or if any task is stalled, and ``stall_changed`` is
+    emitted with the plc name, task number and new stall state whenever
+    a task stops or starts counting again.
+    """
+    health_updated = QtCore.Signal()
+    stall_changed = QtCore.Signal(str, int, bool)
+
+    _instance: Optional[PLCHealthMonitor] = None
+
+    def __init__(self, parent=None):
+        super().__init__(parent=parent)
+        self.stall_timeout = DEFAULT_STALL_TIMEOUT
+        self._trackers = collections.defaultdict(dict)
+        self._stalled = set()
+        self._changed = False
+        self._timer = QtCore.QTimer(self)
+        self._timer.timeout.connect(self.refresh)
+        self._timer.start(HEALTH_REFRESH_MS)
+
+    @classmethod
+    def instance(cls) -> PLCHealthMonitor:
+        """Get the application-wide PLCHealthMonitor, creating it if needed."""
+        if cls._instance is None:
+            cls._instance = cls(parent=QtWidgets.QApplication.instance())
+        return cls._instance
+
+    def tracker(self, plc: str, task: int) -> CycleCountTracker:
+        """Get the tracker for one PLC task, creating it if needed."""
+        try:
+            return self._trackers[plc][task]
+        except KeyError:
+            tracker = CycleCountTracker(stall_timeout=self.stall_timeout)
+            self._trackers[plc][task] = tracker
+            return tracker
+
+    def new_count(self, plc: str, task: int, count: int) -> None:
+        """Slot for new cycle count values from any PLC task."""
+        if count is None:
+            return
+        self.tracker(plc, task).record(int(count))
+        self._changed = True
+
+    def refresh(self) -> None:
+        """Periodic check for stalled tasks and publishing of new rates."""
+        for plc, trackers in self._trackers.items():
+            for task, tracker in trackers.items():
+                stalled = tracker.is_stalled()
+                if stalled == ((plc, task) in self._stalled):
+                    continue
+                if stalled:
+                    self._stalled.add((plc, task))
+                else:
+                    self._stalled.discard((plc, task))
+                self.stall_changed.emit(plc, task, stalled)
+        if self._changed or self._stalled:
+            self._changed = False
+            self.health_updated.emit()
+
+    def plcs(self) -> list[str]:
+        """The names of all PLCs with at least one tracked task."""
+        return sorted(self._trackers)
+
+    def task_health(self, plc: str, task: int) -> Optional[TaskHealth]:
+        """The health of one PLC task, or None if it isn't tracked."""
+        try:
+            return self._trackers.get(plc, {})[task].health()
+        except KeyError:
+            return None
+
+    def plc_health(self, plc: str) -> dict[int, TaskHealth]:
+        """The health of every tracked task on one PLC, by task number."""
+        return {
+            task: tracker.health()
+            for task, tracker in sorted(self._trackers.get(plc, {}).items())
+        }
+
+    def is_stalled(self, plc: str) -> bool:
+        """True if any tracked task on the PLC is stalled."""
+        return any(key[0] == plc for key in self._stalled)
+
+
+def rate_text(health: Optional[TaskHealth]) -> str:
+    """Compact text for a task's cycle rate, e.g. '100.0 Hz ±0.2'."""
+    if health is None or health.rate is None:
+        return ''
+    if health.jitter is None:
+        return f'{health.rate:.1f} Hz'
+    return f'{health.rate:.1f} Hz ±{health.jitter:.1f}'
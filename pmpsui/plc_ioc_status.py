@@ -1,29 +1,60 @@
 import functools
-import itertools
-from string import Template
 
 from pydm import Display
-from pydm.widgets import PyDMLabel
 from pydm.widgets.byte import PyDMBitIndicator
 from pydm.widgets.channel import PyDMChannel
-from qtpy import QtWidgets
+from qtpy import QtCore, QtWidgets
 from qtpy.QtGui import QColor
 
+from .ff_store import FastFaultStore
+from .manifest import manifest_for
+from .plc_health import PLCHealthMonitor, rate_text
+from .pv_probe import PVResolver
+from .qos import QoSPolicy
+from .reconnect import ReconnectGrouper
+from .widgets import RateLimitedLabel
+
+# The fast fault counts that are shown per PLC, see FaultTable.totals
+COUNTED_STATES = ('online', 'in_use', 'alarmed')
+# The store flags that these counts depend on
+COUNTED_FLAGS = ('connected', 'in_use', 'alarmed')
+# How long to gather count updates before refreshing the labels, in ms
+LABEL_REFRESH_MS = 16
+
 
 class PLCIOCStatus(Display):
     _on_color = QColor(0, 255, 0)
     _off_color = QColor(100, 100, 100)
+    _stall_color = QColor(255, 0, 0)
     plc_status_ch = None
+    # The tab name for the update rate config, see pmpsui.qos
+    qos_tab = 'plc_ioc_status'
 
     def __init__(self, parent=None, args=None, macros=None):
         super().__init__(parent=parent, args=args, macros=macros)
         self.config = macros
+        QoSPolicy.configure(self.config)
+        FastFaultStore.configure(self.config)
         self.ffs_count_map = {}
         self.ffs_label_map = {}
+        self.dirty_plcs = set()
+        self.label_timer = QtCore.QTimer(self)
+        self.label_timer.setSingleShot(True)
+        self.label_timer.setInterval(LABEL_REFRESH_MS)
+        self.label_timer.timeout.connect(self.refresh_plc_labels)
         self.setup_ui()
 
     def setup_ui(self):
         self.setup_plc_ioc_status()
+        self.setup_plc_health()
+
+    def setup_plc_health(self):
+        """
+        Show the task cycle rates and stalls from the shared health monitor.
+        """
+        monitor = PLCHealthMonitor.instance()
+        monitor.health_updated.connect(self.update_rate_labels)
+        monitor.stall_changed.connect(self.update_stall_indicator)
 
     def setup_plc_ioc_status(self):
         ffs = self.config.get('fastfaults')
@@ -35,47 +66,40 @@ class PLCIOCStatus(Display):
         grid = self.ui.plc_ioc_container.layout()
         self.task_vis_data = {}
 
-        for row, ff in enumerate(ffs):
-            prefix = ff.get('prefix')
-            ffo_start = ff.get('ffo_start')
-            ffo_end = ff.get('ffo_end')
-            ff_start = ff.get('ff_start')
-            ff_end = ff.get('ff_end')
-
-            ffos_zfill = len(str(ffo_end)) + 1
-            ffs_zfill = len(str(ff_end)) + 1
-            entries = itertools.product(
-                range(ffo_start, ffo_end + 1),
-                range(ff_start, ff_end + 1)
-            )
+        for plc in manifest_for(self.config).plcs:
+            row = plc.index
+            prefix = plc.prefix
 
             plc_name = prefix.strip(':')
-            plc_macros = dict(P=prefix)
             # get the heartbeat of the IOC to
-            ico_heart_ch = Template(
-                'ca://${P}HEARTBEAT').safe_substitute(**plc_macros)
+            ico_heart_ch = f'ca://{prefix}HEARTBEAT'
             # the get PLC process cycle count
-            plc_task_info_1 = Template(
-               'ca://${P}TaskInfo:1:CycleCount').safe_substitute(**plc_macros)
-            plc_task_info_2 = Template(
-               'ca://${P}TaskInfo:2:CycleCount').safe_substitute(**plc_macros)
-            plc_task_info_3 = Template(
-                'ca://${P}TaskInfo:3:CycleCount').safe_substitute(**plc_macros)
+            plc_task_info_1 = f'ca://{prefix}TaskInfo:1:CycleCount'
+            plc_task_info_2 = f'ca://{prefix}TaskInfo:2:CycleCount'
+            plc_task_info_3 = f'ca://{prefix}TaskInfo:3:CycleCount'
 
             label_name = QtWidgets.QLabel(str(plc_name))
             label_online = QtWidgets.QLabel()
             label_in_use = QtWidgets.QLabel()
             label_alarmed = QtWidgets.QLabel()
-            label_heartbeat = PyDMLabel(init_channel=ico_heart_ch)
-            label_plc_task_info_1 = PyDMLabel(init_channel=plc_task_info_1)
-            label_plc_task_info_2 = PyDMLabel(init_channel=plc_task_info_2)
-            label_plc_task_info_3 = PyDMLabel(init_channel=plc_task_info_3)
+            # The counts change every cycle, show them at the tab's rate
+            label_heartbeat = RateLimitedLabel(
+                init_channel=ico_heart_ch, qos_tab=self.qos_tab)
+            label_plc_task_info_1 = RateLimitedLabel(
+                init_channel=plc_task_info_1, qos_tab=self.qos_tab)
+            # Tasks 2 and 3 only get their channels once we know they exist
+            label_plc_task_info_2 = RateLimitedLabel(qos_tab=self.qos_tab)
+            label_plc_task_info_3 = RateLimitedLabel(qos_tab=self.qos_tab)
+            label_cycle_rate = QtWidgets.QLabel()
 
             # if alarm of plc_task_info_1 == INVALID => plc down
             # if the count does not update and alarm == NO_ALARM =>
-            # plc online but stopped
+            # plc online but stopped, which is shown by the stall indicator
+            health = PLCHealthMonitor.instance()
             self.plc_status_ch = PyDMChannel(
                     plc_task_info_1,
+                    value_slot=functools.partial(
+                        health.new_count, plc_name, 1),
                     severity_slot=functools.partial(
                         self.plc_cycle_count_severity_changed, plc_name))
             self.plc_status_ch.connect()
@@ -84,7 +108,9 @@ class PLCIOCStatus(Display):
             # if we get the plc_cycle_count and the .SERV is INVALID, the PLC is OFF
             plc_status_indicator = PyDMBitIndicator(circle=True)
             plc_status_indicator.setColor(self._off_color)
-            # TODO - maybe add the case where PLC On but stopped
+            # if any task stops counting, the PLC is on but stopped
+            plc_stall_indicator = PyDMBitIndicator(circle=True)
+            plc_stall_indicator.setColor(self._off_color)
 
             # Handle the visibility of task 2 and 3 info
             # Not every PLC has tasks 2 and 3
@@ -110,6 +136,7 @@ class PLCIOCStatus(Display):
                     'conn': False,
                 },
             }
+            # Only a severity slot, so this only asks for alarm events
             self.plc_task1_vis_ch = PyDMChannel(
                 plc_task_info_1,
                 severity_slot=functools.partial(
@@ -124,10 +151,9 @@ class PLCIOCStatus(Display):
             self.plc_task2_vis_ch = PyDMChannel(
                 plc_task_info_2,
                 value_slot=functools.partial(
-                    self.update_task_visibility,
+                    self.new_task_count,
                     plc_name=plc_name,
-                    task='task2',
-                    value_type='value',
+                    task=2,
                     widget=label_plc_task_info_2,
                 ),
                 severity_slot=functools.partial(
@@ -145,14 +171,12 @@ class PLCIOCStatus(Display):
                     widget=label_plc_task_info_2,
                 ),
             )
-            self.plc_task2_vis_ch.connect()
             self.plc_task3_vis_ch = PyDMChannel(
                 plc_task_info_3,
                 value_slot=functools.partial(
-                    self.update_task_visibility,
+                    self.new_task_count,
                     plc_name=plc_name,
-                    task='task3',
-                    value_type='value',
+                    task=3,
                     widget=label_plc_task_info_3,
                 ),
                 severity_slot=functools.partial(
@@ -170,41 +194,38 @@ class PLCIOCStatus(Display):
                     widget=label_plc_task_info_3,
                 ),
             )
-            self.plc_task3_vis_ch.connect()
-
-            # total initial number of ffs to initialize the dictionaries with
-            # num_ffo * num_ff
-            all_ffos = ((ffo_end - ffo_start) + 1) * (ff_end - ff_start + 1)
-            self.ffs_count_map[plc_name] = {'online': [False]*all_ffos,
-                                            'in_use': [False]*all_ffos,
-                                            'alarmed': [False]*all_ffos,
-                                            'plc_status': False}
+            PVResolver.instance().when_resolved(
+                key=(prefix, 'TaskInfo'),
+                addresses=[plc_task_info_2, plc_task_info_3],
+                reference=plc_task_info_1,
+                callback=functools.partial(
+                    self.task_info_resolved,
+                    tasks=(
+                        (label_plc_task_info_2, self.plc_task2_vis_ch,
+                         plc_task_info_2),
+                        (label_plc_task_info_3, self.plc_task3_vis_ch,
+                         plc_task_info_3),
+                    ),
+                ),
+            )
+
+            # The fast fault counts come from the shared store
+            self.ffs_count_map[plc_name] = {
+                'prefix': prefix,
+                'plc_status': False,
+                'ioc_prefix': ReconnectGrouper.instance().prefix_for(prefix),
+            }
             self.ffs_label_map[plc_name] = {'online': label_online,
                                             'in_use': label_in_use,
                                             'alarmed': label_alarmed,
-                                            'plc_status': plc_status_indicator}
-
-            count = 0
-            for _ffo, _ff in entries:
-                s_ffo = str(_ffo).zfill(ffos_zfill)
-                s_ff = str(_ff).zfill(ffs_zfill)
-                ch_macros = dict(index=count, P=prefix, FFO=s_ffo, FF=s_ff)
-
-                ch = Template(
-                    'ca://${P}FFO:${FFO}:FF:${FF}:Info:InUse_RBV').safe_substitute(**ch_macros)
-                channel = PyDMChannel(
-                    ch,
-                    connection_slot=functools.partial(
-                        self.ffo_connection_callback, plc_name, count),
-                    value_slot=functools.partial(
-                        self.ffo_value_changed, plc_name, count),
-                    severity_slot=functools.partial(
-                        self.ffo_severity_changed, plc_name, count))
-                # should not be adding a new connection because this address
-                # already exists in the connections,
-                # instead should just add a listener
-                channel.connect()
-                count += 1
+                                            'plc_status': plc_status_indicator,
+                                            'cycle_rate': label_cycle_rate,
+                                            'plc_stall': plc_stall_indicator}
+            self.update_plc_labels(plc_name)
+
+            FastFaultStore.instance().group(prefix).fault_changed.connect(
+                functools.partial(self.ff_state_changed, plc_name)
+            )
 
             # this is the same width as the labels in the plc_ioc_header
             max_width = 150
@@ -214,7 +235,8 @@ class PLCIOCStatus(Display):
             widget_list = [label_name, label_online, label_in_use,
                            label_alarmed, label_heartbeat,
                            label_plc_task_info_1, label_plc_task_info_2,
-                           label_plc_task_info_3, plc_status_indicator]
+                           label_plc_task_info_3, label_cycle_rate,
+                           plc_stall_indicator, plc_status_indicator]
 
             self.setup_widget_size(
                 max_width=max_width,
@@ -232,7 +254,9 @@ class PLCIOCStatus(Display):
             grid.addWidget(label_plc_task_info_1, row, 5)
             grid.addWidget(label_plc_task_info_2, row, 6)
             grid.addWidget(label_plc_task_info_3, row, 7)
-            grid.addWidget(plc_status_indicator, row, 8)
+            grid.addWidget(label_cycle_rate, row, 8)
+            grid.addWidget(plc_stall_indicator, row, 9)
+            grid.addWidget(plc_status_indicator, row, 10)
 
         b_vertical_spacer = (
             QtWidgets.QSpacerItem(20, 20,
@@ -284,6 +308,70 @@ class PLCIOCStatus(Display):
             plc['plc_status'] = True
         self.update_status_labels(key)
 
+    def task_info_resolved(self, result, tasks):
+        """
+        Connect the task 2 and 3 widgets for the tasks that the PLC has.
+
+        The tasks that don't exist stay hidden and unconnected, so we
+        don't search for their PVs forever.
+        """
+        for exists, (label, vis_ch, address) in zip(result, tasks):
+            if exists:
+                label.channel = address
+                vis_ch.connect()
+            else:
+                label.hide()
+
+    def new_task_count(self, value, plc_name, task, widget):
+        """
+        Route a task 2 or 3 cycle count to the health monitor and visibility.
+
+        A count of 0 means that the PLC does not run this task, so there
+        is nothing to track and it should not count as stalled.
+        """
+        if value:
+            PLCHealthMonitor.instance().new_count(plc_name, task, value)
+        self.update_task_visibility(
+            value,
+            plc_name=plc_name,
+            task=f'task{task}',
+            value_type='value',
+            widget=widget,
+        )
+
+    def update_rate_labels(self):
+        """
+        Show the task 1 cycle rate for each PLC, with all tasks in the tooltip.
+        """
+        monitor = PLCHealthMonitor.instance()
+        for plc_name, labels in self.ffs_label_map.items():
+            tasks = monitor.plc_health(plc_name)
+            labels['cycle_rate'].setText(rate_text(tasks.get(1)))
+            labels['cycle_rate'].setToolTip('\n'.join(
+                f'Task {task}: {rate_text(health) or "unknown"}'
+                + (' (stalled)' if health.stalled else '')
+                for task, health in tasks.items()
+            ))
+            if tasks:
+                self.update_stall_indicator(plc_name)
+
+    def update_stall_indicator(self, plc_name, *args):
+        """
+        Light the stall indicator while any of the PLC's tasks are stalled.
+
+        This is green once the PLC's tasks are counting normally and
+        red while any of them has stopped counting.
+        """
+        labels = self.ffs_label_map.get(plc_name)
+        if labels is None:
+            return
+        if PLCHealthMonitor.instance().is_stalled(plc_name):
+            labels['plc_stall'].setColor(self._stall_color)
+            labels['plc_stall'].setToolTip('PLC task cycle count has stopped')
+        else:
+            labels['plc_stall'].setColor(self._on_color)
+            labels['plc_stall'].setToolTip('PLC tasks are counting')
+
     def update_task_visibility(
         self,
         value,
@@ -326,41 +414,48 @@ class PLCIOCStatus(Display):
         else:
             widget.show()
 
-    def ffo_connection_callback(self, key, idx, conn):
-        # Update ffos count for connected In_Use PVs
-        plc = self.ffs_count_map.get(key)
-        plc['online'][idx] = conn
-        # Call routine to update proper label
-        self.update_plc_labels(key)
+    def ff_state_changed(self, key, index, flag):
+        """
+        Note that one of the PLC's fast faults changed in the store.
 
-    def ffo_value_changed(self, key, idx, value):
-        # Update ffos count for In_Use == True Pvs
-        plc = self.ffs_count_map.get(key)
-        plc['in_use'][idx] = value
-        self.update_plc_labels(key)
+        The labels are not touched here, they are refreshed at most once
+        per LABEL_REFRESH_MS for each PLC, or once at the end if the
+        PLC's IOC is reconnecting.
+        """
+        if flag not in COUNTED_FLAGS:
+            return
+        self.dirty_plcs.add(key)
+        grouper = ReconnectGrouper.instance()
+        if grouper.hold(self.ffs_count_map[key]['ioc_prefix'],
+                        self.refresh_plc_labels):
+            return
+        if not self.label_timer.isActive():
+            self.label_timer.start()
 
-    def ffo_severity_changed(self, key, idx, alarm):
-        # 0 = NO_ALARM, 1 = MINOR, 2 = MAJOR, 3 = INVALID
-        plc = self.ffs_count_map.get(key)
-        if alarm != 0:
-            plc['alarmed'][idx] = True
-        else:
-            plc['alarmed'][idx] = False
-        self.update_plc_labels(key)
+    def refresh_plc_labels(self):
+        """
+        Refresh the count labels of every PLC that changed since last time.
+
+        PLCs whose IOC is still reconnecting are left for the end of the
+        reconnect.
+        """
+        grouper = ReconnectGrouper.instance()
+        dirty_plcs = self.dirty_plcs
+        self.dirty_plcs = set()
+        for key in dirty_plcs:
+            if grouper.in_batch(self.ffs_count_map[key]['ioc_prefix']):
+                self.dirty_plcs.add(key)
+            else:
+                self.update_plc_labels(key)
 
     def update_plc_labels(self, key):
-        # Fetch value from count
-        # TODO maybe have some checks here....?
-        counts = self.ffs_count_map.get(key)
-        online_cnt = sum(counts['online'])
-        in_use_cnt = sum(counts['in_use'])
-        alarmed_cnt = sum(counts['alarmed'])
-        # Pick the label from the map
-        # Update label with new count
+        # The store keeps running totals per PLC, nothing is recounted here
+        totals = FastFaultStore.instance().counts(
+            self.ffs_count_map[key]['prefix']
+        )
         labels = self.ffs_label_map.get(key)
-        labels['online'].setText(str(online_cnt))
-        labels['in_use'].setText(str(in_use_cnt))
-        labels['alarmed'].setText(str(alarmed_cnt))
+        for state in COUNTED_STATES:
+            labels[state].setText(str(totals[state]))
 
     def update_status_labels(self, key):
         status = self.ffs_count_map.get(key)
@@ -1,25 +1,27 @@
 import argparse
 import logging
 from functools import partial
-from os import path
 from pathlib import Path
 from typing import Optional, Union
 
-import yaml
 from pydm import Display
-from pydm.widgets import PyDMLabel
 from pydm.widgets.channel import PyDMChannel
-from qtpy import QtCore, QtGui
-from qtpy.QtGui import QPixmap
-from qtpy.QtWidgets import QApplication
+from qtpy import QtCore, QtGui, QtWidgets
+from qtpy.QtGui import QCursor, QPixmap
+from qtpy.QtWidgets import QApplication, QToolTip
 
 from pmpsui.beamclass_table import install_bc_setText
+from pmpsui.ff_store import FastFaultStore
 from pmpsui.hotfix import apply_hotfixes
+from pmpsui.manifest import config_path, load_config
+from pmpsui.qos import QoSDialog, QoSPolicy
+from pmpsui.reconnect import ReconnectGrouper
 from pmpsui.splash import PMPSSplashScreen
+from pmpsui.template_cache import log_build_stats
 from pmpsui.tooltips import (get_mode_tooltip_lines, get_tooltip_for_bc,
                              setup_combobox_tooltip)
-from pmpsui.utils import BackCompat, morph_into_vertical
-from pmpsui.widgets import EvByteIndicator
+from pmpsui.utils import BackCompat
+from pmpsui.widgets import EvByteIndicator, FastFaultHeatmap
 
 apply_hotfixes()
 
@@ -36,6 +38,22 @@ def make_parser():
         action='store_true',
         help='Disable the grafana web view tab.',
     )
+    parser.add_argument(
+        '--no-fast-faults',
+        action='store_true',
+        help=(
+            'Skip the fast faults tab. The individual fast faults can '
+            'still be shown by expanding the arbiter outputs.'
+        ),
+    )
+    parser.add_argument(
+        '--ingest-process',
+        action='store_true',
+        help=(
+            'Subscribe to the fast fault PVs from a separate process, '
+            'leaving the display process free to draw.'
+        ),
+    )
     parser.add_argument(
         '--log_level',
         help='Configure logging level',
@@ -72,13 +90,8 @@ class PMPS(Display):
             macros = {}
         # Fallback for old start without macros
         config_name = macros.get('CFG', 'LFE')
-        # Read definitions from db file.
-        c_file = path.join(path.dirname(path.realpath(__file__)),
-                           "configs",
-                           f"{config_name}_config.yml")
-        config = {}
-        with open(c_file, 'r') as f:
-            config = yaml.safe_load(f)
+        # Read definitions from the config file, or its compiled cache
+        config = load_config(config_path(config_name))
 
         macros_from_config = [
             'line_arbiter_prefix',
@@ -101,7 +114,14 @@ class PMPS(Display):
         line_arbiter_prefix = self.config.get('line_arbiter_prefix')
         if line_arbiter_prefix is not None:
             EvByteIndicator.set_range_address(f'ca://{line_arbiter_prefix}eVRangeCnst_RBV')
+        ReconnectGrouper.instance().add_config_prefixes(self.config)
+        QoSPolicy.configure(self.config)
+        FastFaultStore.configure(
+            self.config, ingest_process=self.user_args.ingest_process,
+        )
         self._channels = []
+        self.ff_widget = None
+        self.qos_dialog = None
         self.setup_ui()
 
         self.splash.finish(self)
@@ -136,13 +156,14 @@ class PMPS(Display):
     def setup_ui(self):
         self.update_splash_message('Setting up ui...', progress=10)
         self.setup_mode_selector()
-        self.setup_ev_range_labels()
         self.setup_tooltips()
-        self.update_splash_message('Set up mode selector, ev-range labels, tooltips',
+        self.update_splash_message('Set up mode selector, tooltips',
                                    progress=15)
         self.setup_backcompat()
         self.update_splash_message('Begin setting up tabs', progress=20)
         self.setup_tabs()
+        self.setup_heatmap()
+        self.setup_diagnostics()
         self.update_splash_message('Finished setting up ui', progress=100)
 
     def setup_mode_selector(self):
@@ -206,14 +227,6 @@ class PMPS(Display):
         if isinstance(self.last_pv_mode, str):
             self.new_mode_activated()
 
-    def setup_ev_range_labels(self):
-        labels = list(range(7, 40))
-        labels.remove(23)
-        for l_idx in labels:
-            child_label = self.findChild(PyDMLabel, "PyDMLabel_{}".format(l_idx))
-            if child_label is not None:
-                morph_into_vertical(child_label)
-
     def setup_tooltips(self):
         labels = (self.ui.curr_bc_label, self.ui.req_bc_label)
         for label in labels:
@@ -230,22 +243,25 @@ class PMPS(Display):
 
     def setup_backcompat(self):
         self.backcompat = BackCompat(parent=self)
-        self.backcompat.add_ev_ranges_alternate(self.ui.ev_req_bytes)
-        self.backcompat.add_ev_ranges_alternate(self.ui.ev_curr_bytes)
+        prefix = self.config.get('line_arbiter_prefix')
+        self.backcompat.add_ev_ranges_alternate(self.ui.ev_req_bytes, prefix)
+        self.backcompat.add_ev_ranges_alternate(self.ui.ev_curr_bytes, prefix)
 
     def setup_tabs(self):
         # We will do crazy things at this screen... avoid painting
         self.setUpdatesEnabled(False)
 
-        self.setup_fastfaults()
-        # TODO: maybe figure out how to give real progress quantities?
-        self.update_splash_message('Fast faults added', progress=40)
+        if not self.user_args.no_fast_faults:
+            self.setup_fastfaults()
+            # TODO: maybe figure out how to give real progress quantities?
+            self.update_splash_message('Fast faults added', progress=40)
 
         self.setup_preemptive_requests()
         self.update_splash_message('Preemptive requests added', progress=55)
 
         self.setup_arbiter_outputs()
         self.update_splash_message('Arbiter outputs added', progress=65)
+        log_build_stats()
 
         self.setup_ev_calculation()
         self.update_splash_message('eV Calculation added', progress=70)
@@ -274,6 +290,14 @@ class PMPS(Display):
             self.ui.tab_arbiter_outputs.removeTab(6)
             self.ui.bp_override_frame.hide()
 
+        if self.user_args.no_fast_faults:
+            self.ui.tab_arbiter_outputs.removeTab(
+                self.ui.tab_arbiter_outputs.indexOf(self.ui.tb_fast_faults)
+            )
+            self.ui.tab_arbiter_outputs.setCurrentWidget(
+                self.ui.tb_arbiter_outputs
+            )
+
         # We are done... re-enable painting
         self.setUpdatesEnabled(True)
 
@@ -284,6 +308,57 @@ class PMPS(Display):
         tab = self.ui.tb_fast_faults
         ff_widget = FastFaults(macros=self.config)
         tab.layout().addWidget(ff_widget)
+        self.ff_widget = ff_widget
+
+    def setup_heatmap(self):
+        """
+        Put the fast fault overview heatmap right above the tabs.
+        """
+        self.heatmap = FastFaultHeatmap(parent=self)
+        self.heatmap.setToolTip('Overview of every fast fault. Click to show.')
+        self.heatmap.setup_store(FastFaultStore.instance())
+        self.heatmap.fault_clicked.connect(self.show_fast_fault)
+        layout = self.layout()
+        layout.insertWidget(
+            layout.indexOf(self.ui.tab_arbiter_outputs),
+            self.heatmap,
+        )
+
+    def setup_diagnostics(self):
+        """
+        Open the update rate diagnostics with Ctrl+Shift+D.
+        """
+        shortcut = QtWidgets.QShortcut(
+            QtGui.QKeySequence('Ctrl+Shift+D'), self,
+        )
+        shortcut.activated.connect(self.show_qos_dialog)
+
+    def show_qos_dialog(self):
+        if self.qos_dialog is None:
+            self.qos_dialog = QoSDialog(parent=self)
+        self.qos_dialog.show()
+        self.qos_dialog.raise_()
+
+    def show_fast_fault(self, index: int):
+        """
+        Switch to the fast faults tab and scroll to the fault at index.
+
+        Without the fast faults tab, expand the fault in the arbiter
+        outputs tree instead.
+        """
+        if self.ff_widget is None:
+            self.ui.tab_arbiter_outputs.setCurrentWidget(
+                self.ui.tb_arbiter_outputs
+            )
+            self.ao_widget.show_fast_fault(index)
+            return
+        self.ui.tab_arbiter_outputs.setCurrentWidget(self.ui.tb_fast_faults)
+        if not self.ff_widget.scroll_to_fault(index):
+            QToolTip.showText(
+                QCursor.pos(),
+                'This fast fault is hidden by the current filters.',
+                self.heatmap,
+            )
 
     def setup_preemptive_requests(self):
         from pmpsui.preemptive_requests import PreemptiveRequests
@@ -296,6 +371,7 @@ class PMPS(Display):
         tab = self.ui.tb_arbiter_outputs
         ao_widget = ArbiterOutputs(macros=self.config)
         tab.layout().addWidget(ao_widget)
+        self.ao_widget = ao_widget
 
     def setup_ev_calculation(self):
         from pmpsui.ev_calculation import EVCalculation
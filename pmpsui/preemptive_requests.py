@@ -3,15 +3,21 @@ import json
 import logging
 import typing
 from dataclasses import dataclass
-from string import Template
 
+import numpy as np
 from pydm import Display
-from pydm.widgets import PyDMByteIndicator, PyDMEmbeddedDisplay, PyDMLabel
+from pydm.widgets import PyDMByteIndicator, PyDMLabel
 from pydm.widgets.channel import PyDMChannel
 from qtpy import QtCore, QtWidgets
 
 from .beamclass_table import get_max_bc_from_bitmask, install_bc_setText
+from .change_filter import filter_slots, skip_unchanged
+from .compute import ComputeService
 from .data_bounds import get_valid_rate
+from .manifest import manifest_for
+from .qos import QoSPolicy
+from .reconnect import ReconnectGrouper
+from .template_cache import CachedEmbeddedDisplay
 from .tooltips import get_tooltip_for_bc
 from .utils import BackCompat
 
@@ -45,13 +51,20 @@ class PreemptiveRequests(Display):
       here, and instead we link the channels up with the QTableWidget.hideRow
       and QTableWidget.showRow methods.
     """
+    # The tab name for the update rate config, see pmpsui.qos
+    qos_tab = 'preemptive_requests'
+
     def __init__(self, parent=None, args=None, macros=None):
         super().__init__(parent=parent, args=args, macros=macros)
         self.config = macros
+        QoSPolicy.configure(self.config)
         self._channels = []
+        # The table items, whose channels can change once probed
+        self._items = []
         self.mode = None
         self.mode_index = None
         self.mode_enum = None
+        self.held_items = set()
         self.setup_ui()
 
     def setup_ui(self):
@@ -64,8 +77,9 @@ class PreemptiveRequests(Display):
         """Populate the table from the config file and the item_info_list."""
         if not self.config:
             return
+        if "preemptive_requests" not in self.config:
+            return
         try:
-            reqs = self.config["preemptive_requests"]
             line_arbiter_prefix = self.config["line_arbiter_prefix"]
         except KeyError:
             return
@@ -88,140 +102,145 @@ class PreemptiveRequests(Display):
         self.jf_trans_cache = {}
         self.jf_value_cache = 5
         self.jf_on_cache = False
-        for req in reqs:
-            prefix = req.get('prefix')
-            arbiter = req.get('arbiter_instance')
-            pool_start = req.get('assertion_pool_start')
-            pool_end = req.get('assertion_pool_end')
-
-            pool_zfill = len(str(pool_end)) + 1
-
-            template = '../templates/preemptive_requests_entry.ui'
-            for pool_id in range(pool_start, pool_end+1):
-                pool = str(pool_id).zfill(pool_zfill)
-                macros = dict(index=count, P=prefix,
-                              ARBITER=arbiter, POOL=pool)
-                widget = PyDMEmbeddedDisplay(parent=reqs_table)
-                widget.prefixes = macros
-                widget.macros = json.dumps(macros)
-                widget.filename = template
-                widget.loadWhenShown = False
-                widget.disconnectWhenHidden = False
-
-                # special setup for the rate label
-                # this is a plain QLabel so we can display true rate
-                # true rate is locked to one of a few fixed values
-                rate_label = widget.findChild(
-                    QtWidgets.QLabel,
-                    'rate_label',
-                )
-                rate_label.channel = Template(
-                    'ca://${P}${ARBITER}:AP:Entry:${POOL}:Rate_RBV'
-                ).safe_substitute(**macros)
-                rate_channel = PyDMChannel(
-                    rate_label.channel,
-                    value_slot=functools.partial(
-                        self.update_valid_rate,
-                        label=rate_label,
-                    ),
-                )
-                rate_channel.connect()
-                self._channels.append(rate_channel)
+        template = '../templates/preemptive_requests_entry.ui'
+        for req in manifest_for(self.config).requests:
+            macros = dict(index=count, P=req.prefix,
+                          ARBITER=req.arbiter, POOL=req.pool_text)
+            widget = CachedEmbeddedDisplay(parent=reqs_table)
+            widget.prefixes = macros
+            widget.macros = json.dumps(macros)
+            widget.filename = template
+            widget.loadWhenShown = False
+            widget.disconnectWhenHidden = False
+
+            # special setup for the rate label
+            # this is a plain QLabel so we can display true rate
+            # true rate is locked to one of a few fixed values
+            rate_label = widget.findChild(
+                QtWidgets.QLabel,
+                'rate_label',
+            )
+            rate_label.channel = (
+                f'ca://{req.prefix}{req.arbiter}:AP:Entry:{req.pool_text}'
+                ':Rate_RBV'
+            )
+            rate_channel = PyDMChannel(
+                rate_label.channel,
+                value_slot=functools.partial(
+                    self.update_valid_rate,
+                    label=rate_label,
+                ),
+            )
+            rate_channel.connect()
+            self._channels.append(rate_channel)
 
-                row_logic = BCRowLogic(
-                    widget.embedded_widget,
-                    line_arbiter_prefix,
-                    parent=self,
-                )
-                self._channels.extend(row_logic.pydm_channels)
+            row_logic = BCRowLogic(
+                widget.embedded_widget,
+                line_arbiter_prefix,
+                parent=self,
+            )
+            self._channels.extend(row_logic.pydm_channels)
 
-                row_ev_bytes = widget.findChild(
-                    PyDMByteIndicator,
-                    'energy_bytes',
-                )
-                self.backcompat.add_ev_ranges_alternate(row_ev_bytes)
+            row_ev_bytes = widget.findChild(
+                PyDMByteIndicator,
+                'energy_bytes',
+            )
+            # The widget has no channel until the IOC has been probed
+            ev_channel = row_ev_bytes.channel
+            self.backcompat.add_ev_ranges_alternate(
+                row_ev_bytes,
+                f'{req.prefix}{req.arbiter}',
+            )
 
-                # Special handling for showing scaled transmission requests
-                # from maximum credible energy judgement factor
-                trans_label = widget.findChild(
-                    PyDMLabel,
-                    "transmission_label"
+            # Special handling for showing scaled transmission requests
+            # from maximum credible energy judgement factor
+            trans_label = widget.findChild(
+                PyDMLabel,
+                "transmission_label"
+            )
+            jf_trans_label = widget.findChild(
+                QtWidgets.QLabel,
+                "jf_trans_label",
+            )
+            # Make it easy to look up past values in callbacks without
+            # holding extra references and mucking up gc
+            # Also makes the table widget items work
+            jf_trans_label.channel = trans_label.channel
+            jf_trans_channel = PyDMChannel(
+                trans_label.channel,
+                value_slot=functools.partial(
+                    self.update_jf_from_raw_trans,
+                    label=jf_trans_label,
                 )
-                jf_trans_label = widget.findChild(
-                    QtWidgets.QLabel,
-                    "jf_trans_label",
+            )
+            jf_value_channel = PyDMChannel(
+                f"ca://{line_arbiter_prefix}IntensityJF_RBV",
+                value_slot=functools.partial(
+                    self.update_jf_from_jf,
+                    label=jf_trans_label,
                 )
-                # Make it easy to look up past values in callbacks without
-                # holding extra references and mucking up gc
-                # Also makes the table widget items work
-                jf_trans_label.channel = trans_label.channel
-                jf_trans_channel = PyDMChannel(
-                    trans_label.channel,
-                    value_slot=functools.partial(
-                        self.update_jf_from_raw_trans,
-                        label=jf_trans_label,
-                    )
+            )
+            jf_on_channel = PyDMChannel(
+                f"ca://{line_arbiter_prefix}ApplyJF_RBV",
+                value_slot=functools.partial(
+                    self.update_jf_from_on,
+                    label=jf_trans_label,
                 )
-                jf_value_channel = PyDMChannel(
-                    f"ca://{line_arbiter_prefix}IntensityJF_RBV",
-                    value_slot=functools.partial(
-                        self.update_jf_from_jf,
-                        label=jf_trans_label,
-                    )
+            )
+            jf_trans_channel.connect()
+            jf_value_channel.connect()
+            jf_on_channel.connect()
+            self._channels.append(jf_trans_channel)
+            self._channels.append(jf_value_channel)
+            self._channels.append(jf_on_channel)
+
+            # LFE doesn't have the jf override mechanisms, hide it for clarity
+            if "LFE" in line_arbiter_prefix:
+                # Hide the raw value that goes under the 5mJ header
+                # Keep the calculated value under the "Transmission" header
+                widget.embedded_widget.transmission_label.hide()
+
+            # insert the widget you see into the table
+            row_position = reqs_table.rowCount()
+            reqs_table.insertRow(row_position)
+            reqs_table.setCellWidget(row_position, 0, widget)
+
+            # insert a cell to preserve the original sort order
+            item = PMPSTableWidgetItem(
+                store_type=int,
+                data_type=int,
+                default=count,
                 )
-                jf_on_channel = PyDMChannel(
-                    f"ca://{line_arbiter_prefix}ApplyJF_RBV",
-                    value_slot=functools.partial(
-                        self.update_jf_from_on,
-                        label=jf_trans_label,
-                    )
+            item.setSizeHint(widget.size())
+            reqs_table.setItem(row_position, 1, item)
+
+            # insert invisible customized QTableWidgetItems for sorting
+            for num, info in enumerate(item_info_list):
+                inner_widget = widget.findChild(
+                    info.widget_class,
+                    info.widget_name,
                 )
-                jf_trans_channel.connect()
-                jf_value_channel.connect()
-                jf_on_channel.connect()
-                self._channels.append(jf_trans_channel)
-                self._channels.append(jf_value_channel)
-                self._channels.append(jf_on_channel)
-
-                # LFE doesn't have the jf override mechanisms, hide it for clarity
-                if "LFE" in line_arbiter_prefix:
-                    # Hide the raw value that goes under the 5mJ header
-                    # Keep the calculated value under the "Transmission" header
-                    widget.embedded_widget.transmission_label.hide()
-
-                # insert the widget you see into the table
-                row_position = reqs_table.rowCount()
-                reqs_table.insertRow(row_position)
-                reqs_table.setCellWidget(row_position, 0, widget)
-
-                # insert a cell to preserve the original sort order
+                if info.widget_name == 'energy_bytes':
+                    channel = ev_channel
+                else:
+                    channel = inner_widget.channel
                 item = PMPSTableWidgetItem(
-                    store_type=int,
-                    data_type=int,
-                    default=count,
+                    store_type=info.store_type,
+                    data_type=info.data_type,
+                    default=info.default,
+                    channel=channel,
+                    qos_tab=self.qos_tab,
+                )
+                if info.widget_name == 'energy_bytes':
+                    self.backcompat.add_ev_ranges_alternate(
+                        item,
+                        f'{req.prefix}{req.arbiter}',
                     )
                 item.setSizeHint(widget.size())
-                reqs_table.setItem(row_position, 1, item)
+                reqs_table.setItem(row_position, num + 2, item)
+                self._items.append(item)
 
-                # insert invisible customized QTableWidgetItems for sorting
-                for num, info in enumerate(item_info_list):
-                    inner_widget = widget.findChild(
-                        info.widget_class,
-                        info.widget_name,
-                    )
-                    item = PMPSTableWidgetItem(
-                        store_type=info.store_type,
-                        data_type=info.data_type,
-                        default=info.default,
-                        channel=inner_widget.channel,
-                    )
-                    if info.widget_name == 'energy_bytes':
-                        self.backcompat.add_ev_ranges_alternate(item)
-                    item.setSizeHint(widget.size())
-                    reqs_table.setItem(row_position, num + 2, item)
-                    self._channels.append(item.pydm_channel)
-
-                count += 1
+            count += 1
         reqs_table.resizeRowsToContents()
         self.row_count = count
         print(f'Added {count} preemptive requests')
@@ -303,10 +322,29 @@ class PreemptiveRequests(Display):
             The column of the cell in the table that recieved an update.
             This is currently unused, but is passed by the update signal.
         """
+        item = self.ui.reqs_table_widget.item(row, column)
+        grouper = ReconnectGrouper.instance()
+        ioc_prefix = grouper.prefix_for(getattr(item, 'channel', None))
+        if grouper.hold(ioc_prefix, self.apply_held_items):
+            # Rows move when sorted, so remember the item and not the row
+            self.held_items.add(item)
+            return
         self.update_filter(row)
         if self.ui.auto_update.isChecked():
             self.gui_table_sort()
 
+    def apply_held_items(self):
+        """
+        Filter the rows that updated during an IOC reconnect, then sort once.
+        """
+        rows = {item.row() for item in self.held_items}
+        self.held_items.clear()
+        for row in rows:
+            if row >= 0:
+                self.update_filter(row)
+        if rows and self.ui.auto_update.isChecked():
+            self.gui_table_sort()
+
     def gui_table_sort(self, *args, **kwargs):
         """
         Slot for all signals that want to trigger a full table sort.
@@ -470,7 +508,10 @@ class PreemptiveRequests(Display):
         QTableWidgetItem instances are not instances of QWidget, and
         therefore are not checked by PyDM for channels.
         """
-        return self._channels
+        return self._channels + [
+            item.pydm_channel for item in self._items
+            if item.pydm_channel is not None
+        ]
 
 
 class PMPSTableWidgetItem(QtWidgets.QTableWidgetItem):
@@ -495,13 +536,16 @@ class PMPSTableWidgetItem(QtWidgets.QTableWidgetItem):
         A starting value for the widget item.
     channel : str, optional
         PyDM channel address for value and connection updates.
+    qos_tab : str, optional
+        The tab name used to look up the value update rate, see pmpsui.qos.
     """
     def __init__(self, store_type, data_type, default,
-                 channel=None, parent=None):
+                 channel=None, qos_tab=None, parent=None):
         super().__init__(parent)
         self.store_type = store_type
         self.data_type = data_type
-        self.setText(str(default))
+        self.qos_tab = qos_tab
+        self.store_text(str(default))
         self.pydm_channel = None
         self.channel = channel
         self.connected = False
@@ -514,11 +558,20 @@ class PMPSTableWidgetItem(QtWidgets.QTableWidgetItem):
     def channel(self, addr: str) -> None:
         if self.pydm_channel is not None:
             self.pydm_channel.disconnect()
-        if addr is not None:
+            self.pydm_channel = None
+        if addr:
             self.pydm_channel = PyDMChannel(
                 addr,
-                value_slot=self.update_value,
-                connection_slot=self.update_connection,
+                **filter_slots(
+                    name='PMPSTableWidgetItem',
+                    value_slot=QoSPolicy.instance().throttle(
+                        self.update_value, type(self).__name__,
+                        tab=self.qos_tab,
+                    ),
+                    connection_slot=ReconnectGrouper.instance().wrap(
+                        addr, self.update_connection,
+                    ),
+                ),
                 )
             self.pydm_channel.connect()
         self._channel_addr = addr
@@ -534,7 +587,14 @@ class PMPSTableWidgetItem(QtWidgets.QTableWidgetItem):
         this means you can see what the table is being sorted on
         if you unhide the columns.
         """
-        self.setText(str(self.store_type(value)))
+        self.store_text(str(self.store_type(value)))
+
+    @skip_unchanged
+    def store_text(self, text):
+        """
+        Store new text, skipping repeats that would trigger a filter pass.
+        """
+        self.setText(text)
 
     def update_connection(self, connected):
         """
@@ -561,12 +621,11 @@ def bitmask_count(bitmask):
 
 def str_from_waveform(waveform_array):
     """Convert an EPICS char waveform to a str."""
-    text = ''
-    for num in waveform_array:
-        if num == 0:
-            break
-        text += chr(num)
-    return text
+    chars = np.asarray(waveform_array).astype(np.uint8)
+    end = np.flatnonzero(chars == 0)
+    if end.size:
+        chars = chars[:end[0]]
+    return chars.tobytes().decode('latin-1')
 
 
 class BCRowLogic(QtCore.QObject):
@@ -604,7 +663,12 @@ class BCRowLogic(QtCore.QObject):
         )
 
     def update_beamclass_tooltip(self, value: int):
-        self.beamclass_label.PyDMToolTip = get_tooltip_for_bc(value)
+        ComputeService.instance().submit(
+            self, get_tooltip_for_bc, (value,), self.set_beamclass_tooltip,
+        )
+
+    def set_beamclass_tooltip(self, text: str):
+        self.beamclass_label.PyDMToolTip = text
 
 
 @dataclass(frozen=True)
@@ -0,0 +1,175 @@
+"""
+One-shot checks for which PV names an IOC actually serves.
+
+Some PVs have been renamed between IOC versions (e.g. ``PhotonEnergyRanges``
+became ``eVRanges``) and some only exist on some PLCs (e.g. the task 2 and
+3 ``TaskInfo`` PVs). Subscribing to every possible name means that the
+names that don't exist are searched for over channel access forever.
+
+Instead, a ``PVProbe`` connects to each candidate name only until it has
+an answer, then disconnects, and the answer is cached per IOC prefix by
+the ``PVResolver``. Widgets are then pointed at the names that exist.
+"""
+from __future__ import annotations
+
+import functools
+import logging
+from typing import Callable, Hashable, Optional
+
+from pydm.widgets.channel import PyDMChannel
+from qtpy import QtCore, QtWidgets
+
+logger = logging.getLogger(__name__)
+
+# How long to wait for the other names once the IOC is known to be up, in ms
+PROBE_TIMEOUT_MS = 2000
+
+
+class PVProbe(QtCore.QObject):
+    """
+    Find out which of a few PV addresses exist.
+
+    The IOC is considered to be up once the reference address connects.
+    From then on the other addresses get ``PROBE_TIMEOUT_MS`` to connect
+    before they are considered missing. If no reference is given, the
+    first candidate address to connect is used as the reference.
+
+    While the IOC is down, nothing can be concluded and the probe keeps
+    waiting. Once the answer is known, all of the probe's channels are
+    disconnected and ``resolved`` is emitted with a list holding True
+    or False for each candidate address, in order.
+
+    Parameters
+    ----------
+    addresses : list of str
+        The candidate channel addresses.
+    reference : str, optional
+        An address that always exists when the IOC is up.
+    parent : QObject, optional
+        Standard qt parent argument.
+    """
+    resolved = QtCore.Signal(list)
+
+    def __init__(
+        self,
+        addresses: list[str],
+        reference: Optional[str] = None,
+        parent: Optional[QtCore.QObject] = None,
+    ):
+        super().__init__(parent=parent)
+        self.addresses = list(addresses)
+        self.reference = reference
+        self.result: Optional[list[bool]] = None
+        self._connected = set()
+        self._channels = []
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(PROBE_TIMEOUT_MS)
+        self._timer.timeout.connect(self.finish)
+        probed = self.addresses
+        if reference is not None and reference not in probed:
+            probed = probed + [reference]
+        for address in probed:
+            self._channels.append(PyDMChannel(
+                address,
+                connection_slot=functools.partial(
+                    self.connection_changed, address,
+                ),
+            ))
+
+    def start(self) -> None:
+        """Start connecting the probe channels."""
+        for ch in self._channels:
+            ch.connect()
+
+    def connection_changed(self, address: str, connected: bool) -> None:
+        if self.result is not None or not connected:
+            return
+        self._connected.add(address)
+        if all(address in self._connected for address in self.addresses):
+            self.finish()
+        elif self.reference is None or address == self.reference:
+            if not self._timer.isActive():
+                self._timer.start()
+
+    def finish(self) -> None:
+        """Record the answer, drop the probe channels and announce it."""
+        if self.result is not None:
+            return
+        self._timer.stop()
+        self.result = [
+            address in self._connected for address in self.addresses
+        ]
+        for ch in self._channels:
+            ch.disconnect()
+        self._channels = []
+        missing = [
+            address for address, ok in zip(self.addresses, self.result)
+            if not ok
+        ]
+        if missing:
+            logger.debug('PVs not found: %s', ', '.join(missing))
+        self.resolved.emit(self.result)
+
+    def channels(self) -> list[PyDMChannel]:
+        """Make sure PyDM can find the channels we set up for cleanup."""
+        return self._channels
+
+
+class PVResolver(QtCore.QObject):
+    """
+    Application-wide cache of PVProbe results, one probe per key.
+
+    The key is chosen by the caller and should identify the IOC and the
+    naming question, e.g. ``(prefix, 'eVRanges')``, so that every widget
+    that asks the same question of the same IOC shares one probe.
+    """
+    _instance: Optional[PVResolver] = None
+
+    def __init__(self, parent=None):
+        super().__init__(parent=parent)
+        self._probes = {}
+
+    @classmethod
+    def instance(cls) -> PVResolver:
+        """Get the application-wide PVResolver, creating it if needed."""
+        if cls._instance is None:
+            cls._instance = cls(parent=QtWidgets.QApplication.instance())
+        return cls._instance
+
+    def result(self, key: Hashable) -> Optional[list[bool]]:
+        """The probe result for key, or None if it isn't known yet."""
+        try:
+            return self._probes[key].result
+        except KeyError:
+            return None
+
+    def when_resolved(
+        self,
+        key: Hashable,
+        addresses: list[str],
+        callback: Callable[[list[bool]], None],
+        reference: Optional[str] = None,
+    ) -> None:
+        """
+        Call callback with the probe result for key, probing if needed.
+
+        If this key has already been answered the callback is called
+        right away. Otherwise it is called once the probe finishes.
+        The addresses and reference are only used by the first call
+        for each key, later calls get the answer for those addresses.
+        This is why the result is a list in the same order as addresses
+        rather than a mapping from address.
+        """
+        try:
+            probe = self._probes[key]
+        except KeyError:
+            probe = PVProbe(addresses, reference=reference, parent=self)
+            self._probes[key] = probe
+            probe.resolved.connect(callback)
+            probe.start()
+            return
+        if probe.result is not None:
+            callback(probe.result)
+        else:
+            probe.resolved.connect(callback)
@@ -0,0 +1,332 @@
+"""
+Update-rate tiers for widgets that don't need every monitor update.
+
+The PMPS header and the arbiter outputs are safety-relevant and are shown
+at the full rate of their PVs. Other widgets, like the PLC cycle counts,
+the undulator K bars or the hidden sort keys of the preemptive requests
+table, are just as useful at a couple of updates per second. Each widget
+class and each tab can be put into a named rate tier from the ``qos``
+section of the config file:
+
+    qos:
+      tiers:
+        live: 0
+        normal: 10
+        slow: 2
+      tabs:
+        plc_ioc_status: slow
+      widgets:
+        UndulatorWidget: slow
+
+Rates are in Hz, and 0 means no limit. A widget class entry wins over the
+tab entry, and anything that isn't listed is ``live``.
+
+A ``Throttle`` passes the first update through right away and then at
+most one update per tier period, always the newest one, so a throttled
+widget ends up showing the latest value at most one period late.
+"""
+from __future__ import annotations
+
+import collections
+import logging
+from typing import Callable, Optional
+
+from qtpy import QtCore, QtWidgets
+
+from .ca_batch import CallbackBatcher
+from .change_filter import suppression_stats
+from .monitor_mask import event_stats
+
+logger = logging.getLogger(__name__)
+
+# The rate tiers that exist without any config, in Hz
+DEFAULT_TIERS = dict(live=0, normal=10, slow=2)
+# The tier used for anything that isn't configured
+DEFAULT_TIER = 'live'
+# How often the diagnostics dialog refreshes while shown, in ms
+DIAGNOSTICS_REFRESH_MS = 1000
+
+
+class QoSTier(QtCore.QObject):
+    """
+    One named update rate, shared by every Throttle in the tier.
+
+    A single timer per tier paces all of its throttles. It runs while
+    any of them have held back an update and stops once a period passes
+    without any.
+
+    Parameters
+    ----------
+    name : str
+        The tier's name from the config.
+    rate : float
+        The most updates per second to deliver, 0 for no limit.
+    parent : QObject, optional
+        Standard qt parent argument.
+    """
+    def __init__(self, name: str, rate: float, parent=None):
+        super().__init__(parent=parent)
+        self.name = name
+        self._pending = {}
+        self._timer = QtCore.QTimer(self)
+        self._timer.timeout.connect(self.flush)
+        self.rate = rate
+        # member name -> number of registered slots
+        self.members = collections.Counter()
+        # member name -> number of updates received and delivered
+        self.received = collections.Counter()
+        self.delivered = collections.Counter()
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    @rate.setter
+    def rate(self, value: float) -> None:
+        self._rate = max(float(value), 0.0)
+        if self._rate:
+            self._timer.setInterval(int(round(1000 / self._rate)))
+        else:
+            # Nothing should wait any more
+            self.flush()
+            self._timer.stop()
+
+    def submit(self, throttle: Throttle) -> None:
+        """Deliver now if the tier is idle, otherwise at the next tick."""
+        if not self._rate:
+            throttle.deliver()
+        elif self._timer.isActive():
+            self._pending[throttle] = None
+        else:
+            throttle.deliver()
+            self._timer.start()
+
+    def flush(self) -> None:
+        """Deliver the newest update of every waiting throttle."""
+        pending = self._pending
+        self._pending = {}
+        if not pending:
+            self._timer.stop()
+            return
+        for throttle in pending:
+            throttle.deliver()
+
+
+class Throttle:
+    """
+    Callable wrapper that limits a slot to its tier's update rate.
+
+    Updates that arrive faster than the tier allows replace each other,
+    and only the newest one is delivered at the tier's next tick.
+
+    Parameters
+    ----------
+    slot : callable
+        The slot to forward updates to.
+    tier : QoSTier
+        The tier that sets the pace.
+    name : str
+        The name to count the updates under, usually the widget class.
+    """
+    def __init__(self, slot: Callable, tier: QoSTier, name: str):
+        self.slot = slot
+        self.tier = tier
+        self.name = name
+        self.pending = None
+
+    def __call__(self, *args) -> None:
+        self.tier.received[self.name] += 1
+        self.pending = args
+        self.tier.submit(self)
+
+    def deliver(self) -> None:
+        args = self.pending
+        if args is None:
+            return
+        self.pending = None
+        self.tier.delivered[self.name] += 1
+        try:
+            self.slot(*args)
+        except RuntimeError:
+            # The widget was deleted while its update was waiting
+            logger.debug('Dropped throttled update for deleted %s', self.name)
+
+
+class QoSPolicy(QtCore.QObject):
+    """
+    Application-wide map of tabs and widget classes to rate tiers.
+
+    There is one of these per application, see ``QoSPolicy.instance``.
+    Widgets ask for their slots to be wrapped with ``throttle`` when they
+    are set up, so the config must be applied with ``configure`` before
+    the widgets are created.
+    """
+    _instance: Optional[QoSPolicy] = None
+
+    def __init__(self, parent=None):
+        super().__init__(parent=parent)
+        self.tiers = {
+            name: QoSTier(name, rate, parent=self)
+            for name, rate in DEFAULT_TIERS.items()
+        }
+        self.tab_tiers = {}
+        self.widget_tiers = {}
+
+    @classmethod
+    def instance(cls) -> QoSPolicy:
+        """Get the application-wide QoSPolicy, creating it if needed."""
+        if cls._instance is None:
+            cls._instance = cls(parent=QtWidgets.QApplication.instance())
+        return cls._instance
+
+    @classmethod
+    def configure(cls, config: Optional[dict]) -> None:
+        """
+        Apply the ``qos`` section from the config file, if any.
+
+        ``tiers`` maps tier names to rates in Hz, and ``tabs`` and
+        ``widgets`` map tab and widget class names to tier names.
+        """
+        if not config or not config.get('qos'):
+            return
+        policy = cls.instance()
+        qos = config['qos']
+        for name, rate in (qos.get('tiers') or {}).items():
+            try:
+                policy.tiers[name].rate = rate
+            except KeyError:
+                policy.tiers[name] = QoSTier(name, rate, parent=policy)
+        policy.tab_tiers.update(qos.get('tabs') or {})
+        policy.widget_tiers.update(qos.get('widgets') or {})
+
+    def tier_for(
+        self,
+        widget_class: str,
+        tab: Optional[str] = None,
+    ) -> QoSTier:
+        """The tier for a widget class, falling back to its tab's tier."""
+        name = self.widget_tiers.get(widget_class)
+        if name is None:
+            name = self.tab_tiers.get(tab, DEFAULT_TIER)
+        try:
+            return self.tiers[name]
+        except KeyError:
+            logger.warning(
+                'Unknown QoS tier %r for %s, using %r',
+                name, widget_class, DEFAULT_TIER,
+            )
+            return self.tiers[DEFAULT_TIER]
+
+    def throttle(
+        self,
+        slot: Callable,
+        widget_class: str,
+        tab: Optional[str] = None,
+    ) -> Callable:
+        """
+        Wrap slot to run at the rate of the widget's tier.
+
+        Slots in an unlimited tier are returned as-is. The slot should
+        only need the newest call's arguments, e.g. a full refresh or a
+        value slot, because calls in between may be dropped.
+        """
+        tier = self.tier_for(widget_class, tab)
+        tier.members[widget_class] += 1
+        if not tier.rate:
+            return slot
+        return Throttle(slot, tier, widget_class)
+
+    def stats(self) -> list[tuple[str, float, str, int, int, int]]:
+        """
+        (tier, rate, widget class, members, received, delivered) per class.
+        """
+        return [
+            (tier.name, tier.rate, name, tier.members[name],
+             tier.received[name], tier.delivered[name])
+            for tier in self.tiers.values()
+            for name in sorted(tier.members)
+        ]
+
+
+class QoSDialog(QtWidgets.QDialog):
+    """
+    Diagnostics view of the update-rate tiers and the dropped updates.
+
+    The top table lists every widget class with its tier, how many of
+    its updates arrived and how many were delivered. The bottom table
+    lists the repeated updates dropped by the change filters, and the
+    next one the CA callbacks received per subscription mask. The bottom
+    line shows how the CA callbacks are being batched.
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent=parent)
+        self.setWindowTitle('Update Rate Diagnostics')
+        self.policy = QoSPolicy.instance()
+        self.tier_table = QtWidgets.QTableWidget(0, 6)
+        self.tier_table.setHorizontalHeaderLabels(
+            ['Tier', 'Rate (Hz)', 'Widget', 'Members', 'Received',
+             'Delivered']
+        )
+        self.filter_table = QtWidgets.QTableWidget(0, 3)
+        self.filter_table.setHorizontalHeaderLabels(
+            ['Slot', 'Delivered', 'Unchanged']
+        )
+        self.mask_table = QtWidgets.QTableWidget(0, 3)
+        self.mask_table.setHorizontalHeaderLabels(
+            ['Monitor mask', 'PVs', 'Callbacks']
+        )
+        for table in (self.tier_table, self.filter_table, self.mask_table):
+            table.setEditTriggers(QtWidgets.QTableWidget.NoEditTriggers)
+            table.verticalHeader().hide()
+            table.horizontalHeader().setStretchLastSection(True)
+        self.setLayout(QtWidgets.QVBoxLayout())
+        self.layout().addWidget(QtWidgets.QLabel('Rate tiers'))
+        self.layout().addWidget(self.tier_table)
+        self.layout().addWidget(QtWidgets.QLabel('Unchanged updates'))
+        self.layout().addWidget(self.filter_table)
+        self.layout().addWidget(QtWidgets.QLabel('Monitor masks'))
+        self.layout().addWidget(self.mask_table)
+        self.batch_label = QtWidgets.QLabel()
+        self.layout().addWidget(self.batch_label)
+        self.resize(700, 650)
+        self._timer = QtCore.QTimer(self)
+        self._timer.timeout.connect(self.refresh)
+
+    def refresh(self) -> None:
+        self._fill(self.tier_table, [
+            (tier, 'unlimited' if not rate else f'{rate:g}', *rest)
+            for tier, rate, *rest in self.policy.stats()
+        ])
+        self._fill(self.filter_table, suppression_stats())
+        self._fill(self.mask_table, event_stats())
+        self.batch_label.setText(
+            batch_text(CallbackBatcher.instance().queue.stats())
+        )
+
+    def _fill(self, table: QtWidgets.QTableWidget, rows: list) -> None:
+        table.setRowCount(len(rows))
+        for row, values in enumerate(rows):
+            for col, value in enumerate(values):
+                table.setItem(row, col, QtWidgets.QTableWidgetItem(str(value)))
+        table.resizeColumnsToContents()
+
+    def showEvent(self, ev):
+        super().showEvent(ev)
+        self.refresh()
+        self._timer.start(DIAGNOSTICS_REFRESH_MS)
+
+    def hideEvent(self, ev):
+        super().hideEvent(ev)
+        self._timer.stop()
+
+
+def batch_text(stats: dict) -> str:
+    """One line summary of CallbackQueue.stats for the diagnostics."""
+    mean = stats['mean_latency']
+    mean = 'n/a' if mean is None else f'{mean * 1000:.1f} ms'
+    return (
+        f'CA callbacks: {stats["depth"]} queued (max {stats["max_depth"]}), '
+        f'{stats["delivered"]} delivered in {stats["drains"]} batches '
+        f'(max {stats["max_batch"]}), latency {mean} '
+        f'(max {stats["max_latency"] * 1000:.1f} ms)'
+    )
@@ -0,0 +1,178 @@
+"""
+Grouping of IOC restart reconnect storms into one update per IOC.
+
+When a PLC IOC restarts, every channel with its prefix disconnects and
+then reconnects, each with its own connection, value and severity
+callback. Applied one at a time, each of these would recompute the
+aggregates that depend on them (fault counts, PLC status labels, table
+filters and sorts) thousands of times over with partial data.
+
+Instead, every connection transition is reported to the
+``ReconnectGrouper``, which maps the address onto one of the IOC
+prefixes from the config. The first transition opens a batch for that
+IOC and the batch stays open until its channels have been quiet for
+``BATCH_QUIET_MS``, or at most ``BATCH_MAX_MS``. The per-channel state
+is still stored right away, but the aggregates ask the grouper to
+``hold`` their recompute while the batch is open and then run it once
+when the batch closes.
+
+Addresses that don't match any configured prefix are never held.
+"""
+from __future__ import annotations
+
+import functools
+import logging
+from typing import Callable, Iterable, Optional
+
+from qtpy import QtCore, QtWidgets
+
+logger = logging.getLogger(__name__)
+
+# How long an IOC's channels must be quiet before its batch closes, in ms
+BATCH_QUIET_MS = 100
+# The longest a batch can stay open before it is closed anyway, in ms
+BATCH_MAX_MS = 1000
+
+
+class ReconnectGrouper(QtCore.QObject):
+    """
+    Application-wide tracker of connection transitions per IOC prefix.
+
+    There is one of these per application, see ``ReconnectGrouper.instance``.
+    ``batch_started`` and ``batch_finished`` are emitted with the IOC
+    prefix when a group of transitions starts and after its held
+    recomputes have been run.
+    """
+    batch_started = QtCore.Signal(str)
+    batch_finished = QtCore.Signal(str)
+
+    _instance: Optional[ReconnectGrouper] = None
+
+    def __init__(self, parent=None):
+        super().__init__(parent=parent)
+        self._prefixes = []
+        self._prefix_cache = {}
+        # prefix -> (quiet timer, max timer)
+        self._timers = {}
+        # prefix -> {callback: None}, an ordered set of held recomputes
+        self._held = {}
+        # prefix -> number of transitions in the open batch
+        self._transitions = {}
+
+    @classmethod
+    def instance(cls) -> ReconnectGrouper:
+        """Get the application-wide ReconnectGrouper, creating it if needed."""
+        if cls._instance is None:
+            cls._instance = cls(parent=QtWidgets.QApplication.instance())
+        return cls._instance
+
+    def add_prefixes(self, prefixes: Iterable[str]) -> None:
+        """Register IOC prefixes to group transitions by."""
+        for prefix in prefixes:
+            if prefix and prefix not in self._prefixes:
+                self._prefixes.append(prefix)
+        # Longest first, so nested prefixes resolve to the most specific
+        self._prefixes.sort(key=len, reverse=True)
+        self._prefix_cache.clear()
+
+    def add_config_prefixes(self, config: dict) -> None:
+        """Register every IOC prefix that appears in a PMPS config."""
+        prefixes = [config.get('line_arbiter_prefix')]
+        for key in ('fastfaults', 'preemptive_requests'):
+            prefixes.extend(
+                entry.get('prefix') for entry in config.get(key) or []
+            )
+        self.add_prefixes(prefixes)
+
+    def prefix_for(self, address: Optional[str]) -> Optional[str]:
+        """The configured IOC prefix that address belongs to, if any."""
+        if not address:
+            return None
+        try:
+            return self._prefix_cache[address]
+        except KeyError:
+            pass
+        pvname = address.split('://', 1)[-1]
+        prefix = next(
+            (prefix for prefix in self._prefixes if pvname.startswith(prefix)),
+            None,
+        )
+        self._prefix_cache[address] = prefix
+        return prefix
+
+    def in_batch(self, prefix: Optional[str]) -> bool:
+        """True while the IOC with this prefix has a batch open."""
+        return prefix in self._timers
+
+    def connection_changed(self, address: str, connected: bool) -> None:
+        """Note a connection transition, opening or extending a batch."""
+        prefix = self.prefix_for(address)
+        if prefix is None:
+            return
+        try:
+            quiet, _ = self._timers[prefix]
+        except KeyError:
+            quiet = QtCore.QTimer(self)
+            quiet.setSingleShot(True)
+            quiet.setInterval(BATCH_QUIET_MS)
+            quiet.timeout.connect(functools.partial(self.finish, prefix))
+            longest = QtCore.QTimer(self)
+            longest.setSingleShot(True)
+            longest.setInterval(BATCH_MAX_MS)
+            longest.timeout.connect(functools.partial(self.finish, prefix))
+            longest.start()
+            self._timers[prefix] = (quiet, longest)
+            self._held[prefix] = {}
+            self._transitions[prefix] = 0
+            self.batch_started.emit(prefix)
+        self._transitions[prefix] += 1
+        quiet.start()
+
+    def wrap(self, address: str, slot: Callable) -> Callable:
+        """
+        Wrap a connection slot so that its transitions are grouped.
+
+        Use this in place of slot as a PyDMChannel connection_slot.
+        """
+        return functools.partial(self._wrapped, address, slot)
+
+    def _wrapped(self, address: str, slot: Callable, connected: bool):
+        self.connection_changed(address, connected)
+        slot(connected)
+
+    def hold(self, prefix: Optional[str], callback: Callable[[], None]) -> bool:
+        """
+        Hold a recompute until the IOC's batch closes.
+
+        Returns True if the callback was held, in which case it will be
+        called exactly once when the batch closes no matter how many times
+        it was held. Returns False if there is no open batch for the
+        prefix, in which case the caller should recompute right away.
+        """
+        try:
+            self._held[prefix][callback] = None
+        except KeyError:
+            return False
+        return True
+
+    def finish(self, prefix: str) -> None:
+        """Close the IOC's batch and run each held recompute once."""
+        try:
+            timers = self._timers.pop(prefix)
+        except KeyError:
+            return
+        for timer in timers:
+            timer.stop()
+            timer.deleteLater()
+        held = self._held.pop(prefix)
+        transitions = self._transitions.pop(prefix)
+        logger.debug(
+            'Grouped %d connection transitions for %s into %d recomputes',
+            transitions, prefix, len(held),
+        )
+        for callback in held:
+            try:
+                callback()
+            except Exception:
+                logger.exception('Error in grouped recompute for %s', prefix)
+        self.batch_finished.emit(prefix)
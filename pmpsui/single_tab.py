@@ -1,7 +1,5 @@
 import argparse
-import os.path
 
-import yaml
 from pcdsutils.profile import profiler_context
 from pydm import PyDMApplication
 from pydm.utilities import setup_renderer
@@ -12,8 +10,10 @@ from .ev_calculation import EVCalculation
 from .fast_faults import FastFaults
 from .grafana_log_display import GrafanaLogDisplay
 from .line_beam_parameters import LineBeamParametersControl
+from .manifest import config_path, load_config
 from .plc_ioc_status import PLCIOCStatus
 from .preemptive_requests import PreemptiveRequests
+from .reconnect import ReconnectGrouper
 from .trans_override import TransOverride
 
 options = {
@@ -28,15 +28,6 @@ options = {
 }
 
 
-def load_config(cfg: str) -> dict:
-    config_file = os.path.join(
-            os.path.dirname(os.path.realpath(__file__)),
-            f"{cfg}_config.yml",
-    )
-    with open(config_file, 'r') as fd:
-        return yaml.safe_load(fd)
-
-
 def main(args):
     module = args.tab.lower()
     Cls = options[module]
@@ -44,7 +35,9 @@ def main(args):
     app = PyDMApplication(use_main_window=False)
 
     with profiler_context(module_names=['pydm', 'PyQt5', module], filename=f'{module}.prof'):
-        tab = Cls(macros=load_config(args.cfg.upper()))
+        config = load_config(config_path(args.cfg.upper()))
+        ReconnectGrouper.instance().add_config_prefixes(config)
+        tab = Cls(macros=config)
         tab.show()
 
         if args.close:
@@ -0,0 +1,229 @@
+"""
+Parse-once, clone-many cache for the row templates.
+
+The fast fault, preemptive request and arbiter output tabs each embed
+one copy of a template per row. Loading these through PyDM repeats the
+uic compile, the macro substitution over the whole generated source and
+the python compile for every single row.
+
+Here each .ui template is compiled once into a python builder where
+every string that contains a macro is routed through a substitution
+function. Stamping out a row then only runs the builder and expands
+the handful of strings that actually hold macros. Templates written as
+.py files are imported once and their Display class is reused.
+"""
+from __future__ import annotations
+
+import ast
+import collections
+import functools
+import inspect
+import io
+import logging
+import os.path
+import time
+from string import Template
+from typing import Optional
+
+from pydm import Display
+from pydm.utilities import find_file, import_module_by_filename
+from pydm.widgets import PyDMEmbeddedDisplay
+from qtpy import uic
+
+logger = logging.getLogger(__name__)
+
+MACRO_FUNC = '_pmps_macro'
+
+# template filename -> [rows built, total seconds spent building]
+build_stats = collections.defaultdict(lambda: [0, 0.0])
+
+
+def expand_macros(text: str, macros: dict) -> str:
+    """
+    Substitute macros into text the same way PyDM does.
+
+    This is repeated until the text stops changing so that macros
+    that expand to other macros are fully resolved.
+    """
+    for _ in range(100):
+        expanded = Template(text).safe_substitute(macros)
+        if expanded == text:
+            break
+        text = expanded
+    return text
+
+
+class _MacroStrings(ast.NodeTransformer):
+    """Wrap every string constant that might hold a macro in MACRO_FUNC."""
+    def visit_Constant(self, node: ast.Constant) -> ast.AST:
+        if isinstance(node.value, str) and '$' in node.value:
+            call = ast.Call(
+                func=ast.Name(id=MACRO_FUNC, ctx=ast.Load()),
+                args=[node],
+                keywords=[],
+            )
+            return ast.copy_location(call, node)
+        return node
+
+
+class UiTemplate:
+    """
+    One .ui file compiled into a reusable, macro-aware python builder.
+
+    Parameters
+    ----------
+    ui_file : str
+        The path to the .ui file.
+    """
+    def __init__(self, ui_file: str):
+        self.ui_file = ui_file
+        code = io.StringIO()
+        uic.compileUi(ui_file, code)
+        tree = _MacroStrings().visit(ast.parse(code.getvalue()))
+        ast.fix_missing_locations(tree)
+        namespace = {MACRO_FUNC: self.substitute}
+        exec(compile(tree, ui_file, 'exec'), namespace)
+        self.klass = next(
+            obj for name, obj in namespace.items()
+            if name.startswith('Ui_') and inspect.isclass(obj)
+        )
+        self._macros = {}
+
+    def substitute(self, text: str) -> str:
+        """Expand the macros for the row that is currently being built."""
+        return expand_macros(text, self._macros)
+
+    def setup(self, display: Display, macros: Optional[dict] = None) -> None:
+        """
+        Build the template's widgets into display, like Display.load_ui.
+        """
+        display.retranslateUi = functools.partial(
+            self.retranslate, display, macros,
+        )
+        self._macros = macros or {}
+        try:
+            self.klass.setupUi(display, display)
+        finally:
+            self._macros = {}
+        display.ui = display
+        display._loaded_file = self.ui_file
+
+    def retranslate(
+        self, display: Display, macros: Optional[dict], *args,
+    ) -> None:
+        """Re-run the template's retranslateUi with the row's macros."""
+        self._macros = macros or {}
+        try:
+            self.klass.retranslateUi(display, display)
+        finally:
+            self._macros = {}
+
+
+@functools.lru_cache(maxsize=None)
+def get_ui_template(ui_file: str) -> UiTemplate:
+    """Get the cached builder for a .ui file, compiling it on first use."""
+    return UiTemplate(ui_file)
+
+
+@functools.lru_cache(maxsize=None)
+def get_display_class(py_file: str) -> type:
+    """
+    Get the Display subclass from a .py template, importing it only once.
+
+    This picks the class the same way PyDM does: ``intelclass`` if the
+    module defines it, otherwise its only Display subclass.
+    """
+    module = import_module_by_filename(py_file)
+    if hasattr(module, 'intelclass'):
+        return module.intelclass
+    classes = [
+        obj for _, obj in inspect.getmembers(module)
+        if inspect.isclass(obj) and issubclass(obj, Display)
+        and obj is not Display
+    ]
+    if len(classes) != 1:
+        raise ValueError(
+            f'Expected exactly one Display subclass in {py_file}, '
+            f'found {len(classes)}.'
+        )
+    return classes[0]
+
+
+def load_template(filename: str, macros: Optional[dict] = None) -> Display:
+    """
+    Cached replacement for pydm.display.load_file for row templates.
+
+    Parameters
+    ----------
+    filename : str
+        The full path to a .ui or .py template.
+    macros : dict, optional
+        The macros for this row.
+    """
+    start = time.perf_counter()
+    if os.path.splitext(filename)[1] == '.ui':
+        display = Display(macros=macros)
+        get_ui_template(filename).setup(display, macros)
+    else:
+        display = get_display_class(filename)(macros=macros)
+        display._loaded_file = filename
+    stats = build_stats[os.path.basename(filename)]
+    stats[0] += 1
+    stats[1] += time.perf_counter() - start
+    return display
+
+
+def log_build_stats() -> None:
+    """Log the average per-row construction time for each template."""
+    for name, (count, total) in build_stats.items():
+        logger.info(
+            'Built %d rows from %s in %.2fs (%.2f ms per row)',
+            count, name, total, 1000 * total / count,
+        )
+
+
+class TemplateDisplay(Display):
+    """
+    Display that loads its ui_filename through the template cache.
+
+    Use this for .py row templates so that their .ui file is
+    only compiled once no matter how many rows are created.
+    """
+    def load_ui_from_file(self, ui_file_path: str, macros: Optional[dict] = None):
+        get_ui_template(ui_file_path).setup(self, macros)
+
+
+class CachedEmbeddedDisplay(PyDMEmbeddedDisplay):
+    """
+    PyDMEmbeddedDisplay that builds its display from the template cache.
+    """
+    def template_path(self) -> str:
+        """Resolve our filename the same way PyDMEmbeddedDisplay does."""
+        base_path = ''
+        parent_display = self.find_parent_display()
+        if parent_display:
+            parent_file_path = parent_display.loaded_file()
+            if self._follow_symlinks:
+                parent_file_path = os.path.realpath(parent_file_path)
+            base_path = os.path.dirname(parent_file_path)
+        return _find_template(self.filename, base_path)
+
+    def open_file(self, force=False):
+        if (not force) and (not self._needs_load):
+            return
+        if not self.filename:
+            return
+        try:
+            display = load_template(self.template_path(), self.parsed_macros())
+        except Exception as ex:
+            logger.exception('Could not load template %s', self.filename)
+            self._load_error = ex
+            return None
+        self._needs_load = False
+        self.clear_error_text()
+        return display
+
+
+@functools.lru_cache(maxsize=None)
+def _find_template(filename: str, base_path: str) -> str:
+    return find_file(filename, base_path=base_path, raise_if_not_found=True)
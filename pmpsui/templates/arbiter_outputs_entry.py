@@ -7,223 +7,245 @@ behavior to the ui file in a more natural way.
 """
 from __future__ import annotations
 
-from pydm import Display
+import functools
+from typing import Callable
+
 from pydm.widgets.channel import PyDMChannel
-from qtpy.QtCore import QObject, QTimer, Signal
+from qtpy.QtCore import QObject, Signal
+
+from pmpsui.change_filter import reset_unchanged, skip_unchanged
+from pmpsui.chatter import ChatterMonitor
+from pmpsui.ff_store import FastFaultStore
+from pmpsui.history import FFOHistory
+from pmpsui.reconnect import ReconnectGrouper
+from pmpsui.template_cache import TemplateDisplay
+from pmpsui.widgets import FaultSparkline
 
+# The store flags that feed into the counts
+COUNTED_FLAGS = ("bypassed", "in_use", "connected", "ok")
 
-class ArbiterRow(Display):
+
+class ArbiterRow(TemplateDisplay):
     """
     PyDM display that represents one row in the Arbiter Outputs table.
 
-    This class is responsible for adding PyDM connections to all of the
-    fast fault PVs and keeping track of their status via counting.
+    This class is responsible for keeping track of the status of all of
+    the FFO's fast faults via counting. The fast fault states come from
+    the shared FastFaultStore, which owns the PV connections.
 
     The ui file this class uses has additional widgets for indicator
     lights and text display that are paramterized via macros like normal
     code-free pydm screens.
     """
     fault_summaries: list[FaultSummary]
-    fault_counters: list[CounterElement]
-    faults: list[bool]
-    bypass_counters: list[CounterElement]
-    bypasses: list[bool]
-    in_use_counters: list[CounterElement]
-    in_uses: list[bool]
-    is_connected: list[bool]
+    fault_count: RunningCount
+    bypass_count: RunningCount
+    reg_count: RunningCount
+    conn_count: RunningCount
 
     def __init__(self, parent=None, args=None, macros=None):
         super().__init__(parent=parent, args=args, macros=macros)
         self.config = macros
         self._channels = []
         self.fault_summaries = []
-        self.fault_counters = []
-        self.bypass_counters = []
-        self.in_use_counters = []
-        self.faults = []
-        self.bypasses = []
-        self.in_uses = []
-        self.is_connected = []
+        # Hold the count updates while this PLC's IOC reconnects
+        ioc_prefix = ReconnectGrouper.instance().prefix_for(macros["P"])
+        self.fault_count = RunningCount(ioc_prefix=ioc_prefix, parent=self)
+        self.bypass_count = RunningCount(ioc_prefix=ioc_prefix, parent=self)
+        self.reg_count = RunningCount(ioc_prefix=ioc_prefix, parent=self)
+        self.conn_count = RunningCount(ioc_prefix=ioc_prefix, parent=self)
+        self.chatter_summaries = {}
+        self.history = FFOHistory()
         self.setup_ui()
 
     def setup_ui(self) -> None:
         """Standard-use catch-all method name for qt startup actions."""
+        self.setup_chatter()
+        self.setup_history()
+        self.watch_label_connections()
         self.setup_counters()
 
-    def setup_counters(self) -> None:
+    def setup_history(self) -> None:
+        """
+        Add the sparkline of recent fault and bypass counts to the row.
+
+        It goes just before the trailing spacer, under the "History" header.
+        """
+        self.sparkline = FaultSparkline(self.history, parent=self)
+        layout = self.layout()
+        layout.insertWidget(layout.count() - 1, self.sparkline)
+
+    def setup_chatter(self) -> None:
+        """
+        Listen for chatter updates so we can rate-limit chattering faults.
+
+        Chattering fault summaries hold their latest state until the
+        chatter monitor's next refresh instead of emitting every flap.
+        """
+        monitor = ChatterMonitor.instance()
+        monitor.chatter_changed.connect(self.chatter_changed)
+        monitor.rates_updated.connect(self.flush_chattering)
+
+    def chatter_changed(self, address: str, chattering: bool) -> None:
+        """
+        When a fault stops chattering, make sure its final state is counted.
+        """
+        if chattering:
+            return
+        try:
+            self.chatter_summaries[address].flush()
+        except KeyError:
+            pass
+
+    def flush_chattering(self) -> None:
         """
-        Connect to the fast fault PVs and initialize the counters.
+        Emit the held states of all chattering fault summaries.
+        """
+        for address in ChatterMonitor.instance().chattering():
+            try:
+                self.chatter_summaries[address].flush()
+            except KeyError:
+                pass
 
-        This sets up the initial conditions for the async chain of
-        next_counter_soon calls that split up the widget setup into
-        multiple qt events. It is implemented in this way so that the
-        render events and the user's input events can happen during
-        setup while this tab loads in the background.
+    def setup_counters(self) -> None:
+        """
+        Start counting this FFO's fast faults from the shared store.
 
-        You can think of this like a fancy for loop.
+        Each fast fault gets one slot in each of the running counts and
+        one FaultSummary. These are filled in from the store's current
+        state, and from then on kept up to date from the store's change
+        notifications for this FFO.
         """
         self.prefix = self.config["P"]
         self.ffo = self.config["FFO"]
-        self.ff_start = self.config["ff_start"]
-        self.fault_num = self.ff_start
-        self.ff_end = self.config["ff_end"]
-        self.zfill = len(str(self.ff_end)) + 1
-        self.loop_count = 0
-
-        self.next_counter_soon()
-
-    def next_counter_soon(self) -> None:
-        """
-        Creates a counter by calling setup_next_counter on the qt event queue.
-
-        Combined with setup_next_counter, this starts or continues a chain of
-        counter instantiations that ends when we exhaust our list of
-        configured PVs.
-
-        The event will happen 1ms after this method call to give plenty
-        of time for user input and rendering events, while not being so long
-        as to drag out the chain of initialization.
-
-        A reference is held to the QTimer to prevent garbage collection,
-        but I'm not entirely sure this is needed.
-        """
-        self.setup_counter_timer = QTimer()
-        self.setup_counter_timer.singleShot(1, self.setup_next_counter)
-
-    def setup_next_counter(self) -> None:
-        """
-        Adds one additional counting source, then calls next_counter_soon.
-
-        Combined with next_counter_soon, this starts or continues a chain of
-        counter instantiations that ends when we exhaust our list of
-        configured PVs.
-
-        Each counting source is a group of PyDM channels that consume
-        EPICS PVs with information pertaining to fast faults.
-        These are then aggregated with all the other counting sources to get
-        a total count of e.g. the number of faulting channels, etc.
-        """
-        fault_num_str = str(self.fault_num).zfill(self.zfill)
-        # Use the bypass channel to get the bypass counts
-        bypass_counter = CounterElement(
-            address=f"ca://{self.prefix}FFO:{self.ffo}:FF:{fault_num_str}:Ovrd:Active_RBV",
-            index=self.loop_count,
-            value_cache=self.bypasses,
-            parent=self,
-        )
-        bypass_dest = PyDMChannel(
-            address=f"loc://{self.prefix}{self.ffo}:BypassCount?type=int&init=0",
-            value_slot=self.new_bypass_count,
-            value_signal=bypass_counter.value_sig,
-        )
-        self.bypass_counters.append(bypass_counter)
-        self.bypasses.append(0)
-        bypass_dest.connect()
-        self._channels.append(bypass_dest)
-        bypass_ch = bypass_counter.create_channel()
-        bypass_ch.connect()
-        self._channels.append(bypass_ch)
-
-        # Use the in_use channel to get the registered and connected counts
-        in_use_counter = CounterElement(
-            address=f"ca://{self.prefix}FFO:{self.ffo}:FF:{fault_num_str}:Info:InUse_RBV",
-            index=self.loop_count,
-            value_cache=self.in_uses,
-            conn_cache=self.is_connected,
-            parent=self,
-        )
-        in_use_dest = PyDMChannel(
-            address=f"loc://{self.prefix}{self.ffo}:RegCount?type=int&init=0",
-            value_slot=show_loc_connected,
-            value_signal=in_use_counter.value_sig,
-        )
-        in_use_conn_dest = PyDMChannel(
-            address=f"loc://{self.prefix}{self.ffo}:ConnCount?type=int&init=0",
-            value_slot=show_loc_connected,
-            value_signal=in_use_counter.conn_sig,
-        )
-        self.in_use_counters.append(in_use_counter)
-        self.in_uses.append(0)
-        self.is_connected.append(0)
-        in_use_dest.connect()
-        in_use_conn_dest.connect()
-        self._channels.append(in_use_dest)
-        self._channels.append(in_use_conn_dest)
-        ic_ch = in_use_counter.create_channel()
-        ic_ch.connect()
-        self._channels.append(ic_ch)
-
-        # Combine the ok and in_use channels to get the fault counts
-        # We are faulting if ok=False and in_use=True
-        # Summarize this as a combined local channel
-        fault_summary = FaultSummary(
-            ok_address=f"ca://{self.prefix}FFO:{self.ffo}:FF:{fault_num_str}:OK_RBV",
-            in_use_address=f"ca://{self.prefix}FFO:{self.ffo}:FF:{fault_num_str}:Info:InUse_RBV",
-            dest_address=f"loc://{self.prefix}{self.ffo}{fault_num_str}:SUMMARY?type=int&init=0",
-            parent=self,
-        )
-        fault_summary_ch1, fault_summary_ch2, fault_summary_ch3 = fault_summary.create_channels()
-        fault_counter = CounterElement(
-            address=fault_summary.dest_address,
-            index=self.loop_count,
-            value_cache=self.faults,
-            parent=self,
-        )
-        fault_counter_ch = fault_counter.create_channel()
-        fault_dest_ch = PyDMChannel(
-            address=f"loc://{self.prefix}{self.ffo}:FaultCount?type=int&init=0",
-            value_slot=self.new_fault_count,
-            value_signal=fault_counter.value_sig,
-        )
-        self.fault_summaries.append(fault_summary)
-        self.fault_counters.append(fault_counter)
-        self.faults.append(0)
-        # Connect from the last in the chain to the first
-        for ch in (
-            fault_dest_ch,
-            fault_counter_ch,
-            fault_summary_ch3,
-            fault_summary_ch2,
-            fault_summary_ch1,
+        store = FastFaultStore.instance()
+        self.where = store.where(self.prefix, self.config["FFO_INDEX"])
+
+        self.setup_aggregates()
+        for index in range(self.where.start, self.where.stop):
+            self.bypass_count.add_element()
+            self.reg_count.add_element()
+            self.conn_count.add_element()
+            fault_summary = FaultSummary(
+                ok_address=f"ca://{store.table.names[index]}:OK_RBV",
+                fault_count=self.fault_count,
+                parent=self,
+            )
+            self.chatter_summaries[fault_summary.ok_address] = fault_summary
+            ChatterMonitor.instance().watch(fault_summary.ok_address)
+            self.destroyed.connect(functools.partial(
+                ChatterMonitor.instance().unwatch, fault_summary.ok_address,
+            ))
+            self.fault_summaries.append(fault_summary)
+            for flag in COUNTED_FLAGS:
+                self.fault_changed(index, flag)
+        store.group(
+            self.prefix, self.config["FFO_INDEX"]
+        ).fault_changed.connect(self.fault_changed)
+
+    def fault_changed(self, index: int, flag: str) -> None:
+        """
+        Update the counts from one changed flag of one of our fast faults.
+        """
+        value = bool(FastFaultStore.instance().faults[flag][index])
+        position = index - self.where.start
+        if flag == "bypassed":
+            self.bypass_count.set_value(position, value)
+        elif flag == "in_use":
+            self.reg_count.set_value(position, value)
+            self.fault_summaries[position].new_in_use(value)
+        elif flag == "connected":
+            self.conn_count.set_value(position, value)
+        elif flag == "ok":
+            self.fault_summaries[position].new_ok(value)
+
+    def setup_aggregates(self) -> None:
+        """
+        Publish the FFO-wide counts to the loc:// channels used by the ui.
+
+        These four channels are the only channels per arbiter row.
+        Everything that feeds into them is wired up with direct signals.
+        """
+        self.fault_count.count_changed.connect(self.new_fault_count)
+        self.bypass_count.count_changed.connect(self.new_bypass_count)
+        for name, running_count in (
+            ("FaultCount", self.fault_count),
+            ("BypassCount", self.bypass_count),
+            ("RegCount", self.reg_count),
+            ("ConnCount", self.conn_count),
         ):
+            ch = PyDMChannel(
+                address=f"loc://{self.prefix}{self.ffo}:{name}?type=int&init=0",
+                value_slot=show_loc_connected,
+                value_signal=running_count.count_changed,
+            )
             ch.connect()
             self._channels.append(ch)
 
-        self.loop_count += 1
-        self.fault_num += 1
-
-        if self.fault_num <= self.ff_end:
-            self.next_counter_soon()
-
     def new_fault_count(self, count: int) -> None:
         """
         Slot for all actions to take when we get a new fault count.
         """
         self.update_fault_label_severity(count)
+        if self.history.record_faults(count):
+            self.sparkline.update()
 
     def update_fault_label_severity(self, count: int) -> None:
         """
         Show a "major" alarm when the total fault count is nonzero.
         """
         if count:
-            self.ui.fault_label.alarm_severity_changed(2)
+            self.set_fault_label_severity(2)
         else:
-            self.ui.fault_label.alarm_severity_changed(0)
+            self.set_fault_label_severity(0)
+
+    def watch_label_connections(self) -> None:
+        """
+        Send our severity to the count labels again when they reconnect.
+
+        PyDM resets a label's severity whenever its channel connects or
+        disconnects, behind the back of our skip_unchanged setters.
+        """
+        for label, setter, update, count in (
+            (self.ui.fault_label, self.set_fault_label_severity,
+             self.update_fault_label_severity, self.fault_count),
+            (self.ui.bypass_label, self.set_bypass_label_severity,
+             self.update_bypass_label_severity, self.bypass_count),
+        ):
+            label.severity_reset = functools.partial(
+                resend_severity, setter, update, count,
+            )
+
+    @skip_unchanged
+    def set_fault_label_severity(self, severity: int) -> None:
+        """
+        Pass a new severity to the fault label, skipping repeats.
+        """
+        self.ui.fault_label.alarm_severity_changed(severity)
 
     def new_bypass_count(self, count: int) -> None:
         """
         Slot for all actions to take when we get a new bypass count.
         """
         self.update_bypass_label_severity(count)
+        if self.history.record_bypasses(count):
+            self.sparkline.update()
 
     def update_bypass_label_severity(self, count: int) -> None:
         """
         Show a "minor" alarm when the total bypass count is nonzero.
         """
         if count:
-            self.ui.bypass_label.alarm_severity_changed(1)
+            self.set_bypass_label_severity(1)
         else:
-            self.ui.bypass_label.alarm_severity_changed(0)
+            self.set_bypass_label_severity(0)
+
+    @skip_unchanged
+    def set_bypass_label_severity(self, severity: int) -> None:
+        """
+        Pass a new severity to the bypass label, skipping repeats.
+        """
+        self.ui.bypass_label.alarm_severity_changed(severity)
 
     def channels(self) -> list[PyDMChannel]:
         """
@@ -240,95 +262,90 @@ class ArbiterRow(Display):
         return 'arbiter_outputs_entry.ui'
 
 
-class CounterElement(QObject):
+def resend_severity(
+    setter: Callable[[int], None],
+    update: Callable[[int], None],
+    count: RunningCount,
+    connected: bool,
+) -> None:
     """
-    A helper object for including one channel's value in the shared counts.
+    Forget the severity a label was last sent, and send it again.
 
-    Each data source that contributes to a count should have one
-    CounterElement that points to the unique channel address and to a shared
-    value list and optionally a shared connection list.
+    The label's connection state is passed last, see SeverityResetLabel.
+    """
+    reset_unchanged(setter)
+    if connected:
+        update(count.emitted_count)
+
+
+class RunningCount(QObject):
+    """
+    A running total of many 0 or 1 contributions.
 
-    Then, whenever that value source updates (and optionally when the
-    connection state changes), this class will update the shared list
-    and emit the total count from its value_sig (and optionally the
-    conn_sig too.) This design was chosen to avoid race conditions with
-    counters and counter statuses. For example, if two counters increment at
-    the same time, they will both emit the correct sum regardless of the
-    order they reach the emit method call.
+    Each contributor reserves a slot with ``add_element`` and then reports
+    its latest value with ``set_value``. Only the difference from that
+    slot's previous value is applied to the total, so every update is
+    O(1) no matter how many contributors there are. ``count_changed`` is
+    emitted with the new total whenever it changes.
 
-    The data source is expected to supply integers that are either 1 or 0.
+    While the IOC that feeds the count is reconnecting, the total is
+    still kept up to date but ``count_changed`` is held by the
+    ReconnectGrouper and emitted once when the reconnect is over.
 
     Parameters
     ----------
-    address : str
-        The PyDM channel address to use as the source of data.
-    index : int
-        The index in the various caches that this counter should write
-        its state to.
-    value_cache : list of int
-        A shared list of all the values from all of the different counter
-        elements that contribute to the shared count.
-    conn_cache : list of int, optional
-        If provided, this is the same as the value_cache except it is used
-        to track connection status.
+    ioc_prefix : str, optional
+        The configured IOC prefix of the contributors, used to group
+        updates during reconnects.
     parent : QObject, optional
         Standard qt parent argument. If provided, it makes this object
         a child object of the parent.
     """
-    value_sig = Signal(int)
-    conn_sig = Signal(int)
+    count_changed = Signal(int)
+    values: list[int]
+    count: int
+    emitted_count: int
 
     def __init__(
         self,
-        address: str,
-        index: int,
-        value_cache: list[int],
-        conn_cache: list[int] | None = None,
+        ioc_prefix: str | None = None,
         parent: QObject | None = None,
     ):
         super().__init__(parent=parent)
-        self.address = address
-        self.index = index
-        self.value_cache = value_cache
-        self.conn_cache = conn_cache
+        self.ioc_prefix = ioc_prefix
+        self.values = []
+        self.count = 0
+        self.emitted_count = 0
 
-    def create_channel(self) -> PyDMChannel:
+    def add_element(self) -> int:
         """
-        Create and return the PyDMChannel object.
-
-        Once connected, this channel will start collecting values
-        for the shared lists and this object's signals will be
-        active.
-
-        It is best to create and connect the channels only after
-        downstream consumers are ready to use the values from value_sig
-        and conn_sig.
+        Reserve a slot for a new contributor and return its index.
         """
-        if self.conn_cache is None:
-            return PyDMChannel(
-                address=self.address,
-                value_slot=self.new_value,
-            )
-        else:
-            return PyDMChannel(
-                address=self.address,
-                value_slot=self.new_value,
-                connection_slot=self.new_conn,
-            )
+        self.values.append(0)
+        return len(self.values) - 1
 
-    def new_value(self, value: int) -> None:
+    def set_value(self, index: int, value: int) -> None:
         """
-        When a new value is recieved, stash it and emit the total count.
+        Update the contribution at index and emit the total if it changed.
         """
-        self.value_cache[self.index] = value
-        self.value_sig.emit(sum(self.value_cache))
+        value = int(bool(value))
+        delta = value - self.values[index]
+        if not delta:
+            return
+        self.values[index] = value
+        self.count += delta
+        if ReconnectGrouper.instance().hold(self.ioc_prefix, self.emit_count):
+            return
+        self.emit_count()
 
-    def new_conn(self, conn: int) -> None:
+    def emit_count(self) -> None:
         """
-        When a new connection state is recieved, stash it and emit the total count.
+        Emit the total if it differs from the last total we emitted.
         """
-        self.conn_cache[self.index] = conn
-        self.conn_sig.emit(sum(self.conn_cache))
+        if self.count == self.emitted_count:
+            return
+        self.emitted_count = self.count
+        self.count_changed.emit(self.count)
 
 
 class FaultSummary(QObject):
@@ -342,63 +359,41 @@ class FaultSummary(QObject):
     "NOT OK" by default, creating a lot of false positives for the fault
     counter if we neglect to consider the IN_USE signal.
 
+    While the OK signal is chattering, new fault states are held back
+    and only emitted when ``flush`` is called, so that a flapping fault
+    cannot flood the counters and labels downstream.
+
+    The OK and IN_USE values are passed in through ``new_ok`` and
+    ``new_in_use``.
+
     Parameters
     ----------
     ok_address : str
-        The PyDM channel associated with the "OK" fault signal, which is
-        1 when the condition is OK and 0 when we are faulting.
-    in_use_address : str
-        The PyDM channel associated with the "IN_USE" fault signal,
-        which is 1 when the fault's OK state is valid and is 0 when the
-        fault's OK state is invalid.
-    dest_address : str
-        The PyDM channel that our values should be output to.
-        This channel address can then be re-used for other PyDMChannel
-        instances that are expecting values.
+        The PyDM channel address of the "OK" fault signal, which is
+        1 when the condition is OK and 0 when we are faulting. This is
+        what the chatter monitor knows the signal as.
+    fault_count : RunningCount
+        The shared count of faulting signals that our state feeds into.
     parent : QObject, optional
         Standard qt parent argument. If provided, it makes this object
         a child object of the parent.
     """
-    value_sig = Signal(int)
     is_ok: int
     is_in_use: int
 
     def __init__(
         self,
         ok_address: str,
-        in_use_address: str,
-        dest_address: str,
+        fault_count: RunningCount,
         parent: QObject | None,
     ):
         super().__init__(parent=parent)
         self.ok_address = ok_address
-        self.in_use_address = in_use_address
-        self.dest_address = dest_address
+        self.fault_count = fault_count
+        self.index = fault_count.add_element()
         self.is_ok = 0
         self.is_in_use = 0
-
-    def create_channels(self) -> tuple[PyDMChannel, PyDMChannel, PyDMChannel]:
-        """
-        Create and return the channels associated with the fault summary.
-
-        The first channel is the intake channel for the OK signal.
-        The second channel is the intake channel for the IN_USE signal.
-        The third channel is the output channel for the fault state.
-
-        You should connect the output channel first, so that it is ready
-        to consume the outputs of the intake channels.
-        """
-        return PyDMChannel(
-            address=self.ok_address,
-            value_slot=self.new_ok,
-        ), PyDMChannel(
-            address=self.in_use_address,
-            value_slot=self.new_in_use,
-        ), PyDMChannel(
-            address=self.dest_address,
-            value_signal=self.value_sig,
-            value_slot=show_loc_connected,
-        )
+        self.pending = False
 
     def new_ok(self, value: int):
         """
@@ -416,12 +411,31 @@ class FaultSummary(QObject):
 
     def new_fault(self):
         """
-        Update consumers of value_sig with the current fault state.
+        Update the fault count with the current fault state.
+
+        If the OK signal is chattering, hold the state until the next flush.
+        """
+        if ChatterMonitor.instance().is_chattering(self.ok_address):
+            self.pending = True
+            return
+        self.emit_fault()
+
+    def flush(self):
+        """
+        Count the held fault state, if there is one.
+        """
+        if self.pending:
+            self.emit_fault()
+
+    def emit_fault(self):
         """
+        Put the current fault state into the fault count unconditionally.
+        """
+        self.pending = False
         if self.is_in_use:
-            self.value_sig.emit(1 - self.is_ok)
+            self.fault_count.set_value(self.index, 1 - self.is_ok)
         else:
-            self.value_sig.emit(0)
+            self.fault_count.set_value(self.index, 0)
 
 
 def show_loc_connected(*args, **kwargs):
@@ -432,3 +446,6 @@ def show_loc_connected(*args, **kwargs):
     properly.
     """
     ...
+
+
+intelclass = ArbiterRow
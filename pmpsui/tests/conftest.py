@@ -0,0 +1,20 @@
+import os
+
+import pytest
+
+# Let the tests that need a QApplication run without a display
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+
+class FakeClock:
+    """A clock for the trackers that only moves when a test moves it."""
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
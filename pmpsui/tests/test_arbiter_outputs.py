@@ -0,0 +1,79 @@
+import functools
+import json
+
+from pmpsui.arbiter_outputs import ArbiterOutputs
+from pmpsui.change_filter import skip_unchanged
+from pmpsui.templates.arbiter_outputs_entry import (RunningCount,
+                                                    resend_severity)
+from pmpsui.widgets import SeverityResetLabel
+
+
+class CountLabel:
+    """The severity handling of an ArbiterRow, for one count label."""
+    def __init__(self, label):
+        self.label = label
+        self.sent = []
+        self.count = RunningCount()
+        self.count.add_element()
+        self.count.count_changed.connect(self.update)
+        label.severity_reset = functools.partial(
+            resend_severity, self.set_severity, self.update, self.count,
+        )
+
+    def update(self, count):
+        self.set_severity(2 if count else 0)
+
+    @skip_unchanged
+    def set_severity(self, severity):
+        self.sent.append(severity)
+        self.label.alarm_severity_changed(severity)
+
+
+def test_reconnect_resends_severity(qapp):
+    # Only labels with a channel show a severity at all
+    label = SeverityResetLabel(init_channel='loc://test_reconnect?type=int')
+    row = CountLabel(label)
+    row.count.set_value(0, 1)
+    assert label._alarm_state == 2
+    label.connection_changed(False)
+    label.connection_changed(True)
+    # PyDM cleared the severity on reconnect, and we sent ours again
+    assert row.sent == [2, 2]
+    assert label._alarm_state == 2
+    # Repeats are still skipped in between
+    row.update(1)
+    assert row.sent == [2, 2]
+
+
+CONFIG = dict(fastfaults=[
+    dict(prefix='PLC:TST:', name='TST', ffo_start=1, ffo_end=2,
+         ff_start=1, ff_end=3),
+])
+
+
+def test_expand_collapse_ffo(qapp, qtbot):
+    outputs = ArbiterOutputs(macros=CONFIG)
+    qtbot.addWidget(outputs)
+    assert len(outputs.ffo_items) == 2
+    ffo_item = outputs.ffo_items[1]
+    assert ffo_item.childCount() == 0
+    ffo_item.setExpanded(True)
+    assert ffo_item.childCount() == 3
+    rows = [outputs.tree.itemWidget(ffo_item.child(row), 0)
+            for row in range(3)]
+    assert [json.loads(row.macros)['FF'] for row in rows] == ['01', '02', '03']
+    assert all(json.loads(row.macros)['FFO'] == '02' for row in rows)
+    # Expanding again doesn't add the rows twice
+    outputs.expand_ffo(ffo_item)
+    assert ffo_item.childCount() == 3
+    deleted = []
+    for row in rows:
+        row.destroyed.connect(deleted.append)
+    ffo_item.setExpanded(False)
+    assert ffo_item.childCount() == 0
+    qtbot.waitUntil(lambda: len(deleted) == 3, timeout=1000)
+    # The last fault of the first FFO is found by its config order index
+    assert outputs.show_fast_fault(2)
+    assert outputs.ffo_items[0].isExpanded()
+    assert outputs.ffo_items[0].childCount() == 3
+    assert not outputs.show_fast_fault(6)
@@ -0,0 +1,106 @@
+import types
+
+import numpy as np
+from pydm.data_plugins.plugin import PyDMConnection
+from pydm.widgets.channel import PyDMChannel
+from qtpy import QtCore
+
+from pmpsui import ca_batch
+from pmpsui.ca_batch import CallbackQueue, batched_add_listener
+
+
+def test_callback_queue_order_and_stats(clock):
+    queue = CallbackQueue(clock=clock)
+    calls = []
+    for num in range(5):
+        queue.put(calls.append, num)
+    assert len(queue) == 5
+    assert queue.stats()['max_depth'] == 5
+    clock.now += 0.25
+    assert queue.drain() == 5
+    assert calls == [0, 1, 2, 3, 4]
+    stats = queue.stats()
+    assert stats['depth'] == 0
+    assert stats['drains'] == 1
+    assert stats['delivered'] == 5
+    assert stats['max_batch'] == 5
+    assert stats['mean_latency'] == 0.25
+    assert stats['max_latency'] == 0.25
+    # Nothing queued is not a drain
+    assert queue.drain() == 0
+    assert queue.stats()['drains'] == 1
+
+
+def test_callback_queue_keeps_going():
+    queue = CallbackQueue()
+    calls = []
+
+    def bad():
+        raise ValueError
+
+    queue.put(calls.append, 1)
+    queue.put(bad)
+    # Calls queued while draining are run in the same drain
+    queue.put(lambda: queue.put(calls.append, 3))
+    queue.put(calls.append, 2)
+    assert queue.drain() == 5
+    assert calls == [1, 2, 3]
+
+
+class FakePV:
+    chid = 1
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def run_callbacks(self):
+        self.connection.new_value_signal[int].emit(5)
+
+
+class FakeConnection(PyDMConnection):
+    """A pyepics plugin Connection without channel access."""
+    def __init__(self):
+        super().__init__(None, 'ca://TST')
+        self.pv = FakePV(self)
+        self.puts = []
+
+    def send_connection_state(self, conn=None):
+        self.connection_state_signal.emit(conn)
+
+    def put_value(self, value):
+        self.puts.append(value)
+
+
+class Sender(QtCore.QObject):
+    send_value_signal = QtCore.Signal([int], [float], [str], [bool],
+                                      [np.ndarray])
+
+
+def test_batched_add_listener(qapp, monkeypatch):
+    monkeypatch.setattr(ca_batch, 'epics', types.SimpleNamespace(
+        ca=types.SimpleNamespace(isConnected=lambda chid: True),
+    ))
+    calls = []
+    sender = Sender()
+    channel = PyDMChannel(
+        'ca://TST',
+        connection_slot=lambda conn: calls.append(('conn', conn)),
+        value_slot=lambda value: calls.append(('value', value)),
+        value_signal=sender.send_value_signal,
+    )
+    connection = FakeConnection()
+    batched_add_listener(connection, channel)
+    # The current state is only sent from a later event
+    assert calls == []
+    qapp.processEvents()
+    qapp.processEvents()
+    assert calls == [('conn', True), ('value', 5)]
+    # From then on the slots are called directly, and only once
+    connection.new_value_signal[int].emit(6)
+    assert calls == [('conn', True), ('value', 5), ('value', 6)]
+    qapp.processEvents()
+    assert calls == [('conn', True), ('value', 5), ('value', 6)]
+    # Writes from the widget still reach the PV
+    sender.send_value_signal[int].emit(7)
+    qapp.processEvents()
+    assert connection.puts == [7]
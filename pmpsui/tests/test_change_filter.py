@@ -0,0 +1,65 @@
+import numpy as np
+
+from pmpsui.change_filter import (ChangeFilter, filter_slots, reset_unchanged,
+                                  skip_unchanged, suppressed_counts)
+
+
+class Widget:
+    def __init__(self):
+        self.calls = []
+
+    @skip_unchanged
+    def update(self, value):
+        self.calls.append(value)
+
+
+def test_skip_unchanged_per_instance():
+    first = Widget()
+    second = Widget()
+    for value in (1, 1, 2, 2, 1):
+        first.update(value)
+    second.update(1)
+    assert first.calls == [1, 2, 1]
+    assert second.calls == [1]
+    assert suppressed_counts[Widget.update.__qualname__] >= 2
+
+
+def test_reset_unchanged():
+    widget = Widget()
+    assert reset_unchanged(widget.update) is None
+    widget.update(1)
+    assert reset_unchanged(widget.update) == (1,)
+    assert reset_unchanged(widget.update) is None
+    # The repeat goes through after a reset
+    widget.update(1)
+    widget.update(1)
+    assert widget.calls == [1, 1]
+
+
+def test_change_filter_types_and_arrays():
+    calls = []
+    slot = ChangeFilter(calls.append, name='test_arrays')
+    array = np.array([1, 2, 3])
+    slot(array)
+    array[0] = 5
+    # The filter keeps a copy, so an in-place change is still a change
+    slot(array)
+    slot(np.array([5, 2, 3]))
+    slot(1)
+    slot(True)
+    assert len(calls) == 4
+    assert suppressed_counts['test_arrays'] == 1
+
+
+def test_filter_slots_wraps_only_slots():
+    signal = object()
+    slots = filter_slots(
+        name='test_slots',
+        value_slot=print,
+        connection_slot=None,
+        value_signal=signal,
+    )
+    assert isinstance(slots['value_slot'], ChangeFilter)
+    assert slots['value_slot'].name == 'test_slots.value_slot'
+    assert slots['connection_slot'] is None
+    assert slots['value_signal'] is signal
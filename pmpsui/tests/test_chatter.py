@@ -0,0 +1,87 @@
+from pmpsui import chatter
+from pmpsui.chatter import ChatterMonitor, TransitionTracker
+
+
+def test_transition_tracker_chatter(clock):
+    tracker = TransitionTracker(threshold=5, window=1, clock=clock)
+    # First value is never a transition
+    assert not tracker.record('ff', 0)
+    assert tracker.total('ff') == 0
+    # Repeated values are not transitions
+    tracker.record('ff', 0)
+    assert tracker.total('ff') == 0
+    changed = []
+    for num in range(10):
+        clock.now += 0.05
+        changed.append(tracker.record('ff', (num + 1) % 2))
+    assert tracker.total('ff') == 10
+    assert changed.count(True) == 1
+    assert tracker.is_chattering('ff')
+    assert tracker.chattering() == ['ff']
+    assert tracker.rate('ff') == 10
+    # Going quiet clears the flag on the next update
+    clock.now += 2
+    started, stopped = tracker.update()
+    assert started == []
+    assert stopped == ['ff']
+    assert not tracker.is_chattering('ff')
+    # The exact count survives the chatter state change
+    assert tracker.total('ff') == 10
+
+
+def test_transition_tracker_hysteresis(clock):
+    tracker = TransitionTracker(threshold=4, window=1, clock=clock)
+    tracker.record('ff', 0)
+    for num in range(5):
+        clock.now += 0.1
+        tracker.record('ff', (num + 1) % 2)
+    assert tracker.is_chattering('ff')
+    # 3 transitions/s is under the threshold but above half of it
+    clock.now += 0.75
+    tracker.update()
+    assert tracker.rate('ff') == 3
+    assert tracker.is_chattering('ff')
+
+
+class FakeChannel:
+    def __init__(self, address, value_slot=None):
+        self.address = address
+        self.value_slot = value_slot
+        self.connected = False
+
+    def connect(self):
+        self.connected = True
+
+    def disconnect(self):
+        self.connected = False
+
+
+def test_chatter_monitor_watch_and_unwatch(clock, monkeypatch):
+    monkeypatch.setattr(chatter, 'PyDMChannel', FakeChannel)
+    monitor = ChatterMonitor()
+    monitor.tracker = TransitionTracker(threshold=5, window=1, clock=clock)
+    changes = []
+    monitor.chatter_changed.connect(
+        lambda address, chattering: changes.append((address, chattering))
+    )
+    # Two watchers of one address share one channel
+    monitor.watch('ca://FF')
+    monitor.watch('ca://FF')
+    assert len(monitor.channels()) == 1
+    channel = monitor.channels()[0]
+    assert channel.connected
+    for num in range(11):
+        clock.now += 0.05
+        channel.value_slot(num % 2)
+    assert monitor.is_chattering('ca://FF')
+    assert changes == [('ca://FF', True)]
+    # The channel stays until the last watcher is gone
+    monitor.unwatch('ca://FF')
+    assert channel.connected
+    assert monitor.is_chattering('ca://FF')
+    monitor.unwatch('ca://FF')
+    assert not channel.connected
+    assert monitor.channels() == []
+    assert changes == [('ca://FF', True), ('ca://FF', False)]
+    assert not monitor.is_chattering('ca://FF')
+    assert monitor.tracker.total('ca://FF') == 0
@@ -0,0 +1,22 @@
+from pmpsui.compute import Coalescer
+
+
+def test_coalescer_idle_key_starts():
+    coalescer = Coalescer()
+    assert coalescer.request('a', 1) == 1
+    assert coalescer.request('b', 2) == 2
+    assert coalescer.finished('a') == (True, None)
+    assert coalescer.request('a', 3) == 3
+
+
+def test_coalescer_keeps_newest():
+    coalescer = Coalescer()
+    assert coalescer.request('a', 1) == 1
+    assert coalescer.request('a', 2) is None
+    assert coalescer.request('a', 3) is None
+    # 1 is already out of date, and 2 is never computed
+    assert coalescer.finished('a') == (False, 3)
+    assert coalescer.finished('a') == (True, None)
+    assert coalescer.stats() == dict(
+        submitted=3, computed=2, coalesced=1, superseded=1, waiting=0,
+    )
@@ -0,0 +1,79 @@
+import numpy as np
+
+from pmpsui.ff_store import FaultTable, fastfault_entries
+
+CONFIG = [
+    dict(prefix='PLC:A:', ffo_start=1, ffo_end=2, ff_start=1, ff_end=3),
+    dict(prefix='PLC:B:', ffo_start=1, ffo_end=1, ff_start=1, ff_end=12),
+]
+
+
+def test_fastfault_entries():
+    entries = list(fastfault_entries(CONFIG))
+    assert len(entries) == 18
+    assert entries[0] == ('PLC:A:', 1, 1, 'PLC:A:FFO:01:FF:01')
+    assert entries[3] == ('PLC:A:', 2, 1, 'PLC:A:FFO:02:FF:01')
+    assert entries[-1] == ('PLC:B:', 1, 12, 'PLC:B:FFO:01:FF:012')
+
+
+def test_fault_table_index():
+    table = FaultTable(CONFIG)
+    assert len(table) == 18
+    assert table.plcs == ['PLC:A:', 'PLC:B:']
+    assert table.index('PLC:A:', 2, 3) == 5
+    assert table.where('PLC:A:') == slice(0, 6)
+    assert table.where('PLC:A:', 2) == slice(3, 6)
+    assert table.where('PLC:B:') == slice(6, 18)
+    assert table.ffos() == [('PLC:A:', 1), ('PLC:A:', 2), ('PLC:B:', 1)]
+    assert table.group_keys(7) == (('PLC:B:',), ('PLC:B:', 1))
+    assert table.faults[5]['ffo'] == 2
+    assert table.faults[5]['ff'] == 3
+
+
+def test_fault_table_counts():
+    table = FaultTable(CONFIG)
+    assert table.set(0, 'connected', 1)
+    assert not table.set(0, 'connected', True)
+    table.set(0, 'in_use', 1)
+    table.set(1, 'in_use', 1)
+    table.set(1, 'ok', 1)
+    table.set(7, 'in_use', 1)
+    table.set(8, 'bypassed', 1)
+    assert table.counts() == dict(
+        online=1, in_use=3, alarmed=0, faulted=2, bypassed=1,
+    )
+    assert table.counts(table.where('PLC:A:', 1)) == dict(
+        online=1, in_use=2, alarmed=0, faulted=1, bypassed=0,
+    )
+    assert table.set_range(table.where('PLC:A:', 2), 'vetoed', 1) == [3, 4, 5]
+    assert table.set_range(table.where('PLC:A:', 2), 'vetoed', 1) == []
+
+
+def test_fault_table_matching():
+    table = FaultTable(CONFIG)
+    for index in (0, 1, 2):
+        table.set(index, 'connected', 1)
+        table.set(index, 'in_use', 1)
+    table.set(1, 'ok', 1)
+    # Disconnected faults never match
+    table.set(3, 'in_use', 1)
+    assert table.matching({'in_use': True}).nonzero()[0].tolist() == [0, 1, 2]
+    matching = table.matching({'in_use': True, 'ok': False})
+    assert matching.nonzero()[0].tolist() == [0, 2]
+    assert table.matching({'ok': True}, slice(1, 2)).tolist() == [True]
+
+
+def test_fault_table_totals():
+    table = FaultTable(CONFIG)
+    rng = np.random.default_rng(0)
+    flags = ('connected', 'in_use', 'alarmed', 'ok', 'bypassed', 'vetoed')
+    for _ in range(500):
+        table.set(int(rng.integers(len(table))), rng.choice(flags),
+                  rng.integers(2))
+        table.set_range(table.where('PLC:A:', 2), rng.choice(flags),
+                        rng.integers(2))
+    assert table.totals() == table.counts()
+    for prefix in table.plcs:
+        assert table.totals(prefix) == table.counts(table.where(prefix))
+    for key in table.ffos():
+        assert table.totals(*key) == table.counts(table.where(*key))
@@ -0,0 +1,22 @@
+from pmpsui.history import FFOHistory, RingBuffer
+
+
+def test_ring_buffer_wraps():
+    buffer = RingBuffer(length=3)
+    assert buffer.latest() is None
+    for num in range(5):
+        buffer.append(num, timestamp=float(num))
+    assert len(buffer) == 3
+    assert buffer.latest() == 4
+    times, values = buffer.samples()
+    assert list(times) == [2.0, 3.0, 4.0]
+    assert list(values) == [2, 3, 4]
+
+
+def test_ffo_history_only_keeps_transitions():
+    history = FFOHistory(length=4)
+    assert history.record_faults(0)
+    assert not history.record_faults(0)
+    assert history.record_faults(2)
+    assert history.record_bypasses(1)
+    assert len(history.faults) == 2
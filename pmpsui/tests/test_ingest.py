@@ -0,0 +1,117 @@
+import subprocess
+import sys
+import time
+
+import pytest
+
+from pmpsui.ff_store import FF_CHANNELS, FastFaultStore, FaultTable
+from pmpsui.ingest import (IngestProcess, SharedReader, SharedWriter,
+                           shared_arrays, shared_size)
+
+CONFIG = [
+    dict(prefix='PLC:A:', ffo_start=1, ffo_end=2, ff_start=1, ff_end=3),
+]
+
+
+def test_shared_layout():
+    buffer = bytearray(shared_size(6))
+    faults, versions = shared_arrays(buffer, 6)
+    faults['ok'][5] = True
+    versions[5] = 7
+    again, again_versions = shared_arrays(buffer, 6)
+    assert again['ok'][5]
+    assert again_versions[5] == 7
+    assert not again['ok'][4]
+
+
+def test_writer_reader():
+    table = FaultTable(CONFIG)
+    faults, versions = shared_arrays(bytearray(shared_size(len(table))), 6)
+    faults[:] = table.faults
+    versions[:] = 0
+    writer = SharedWriter(faults, versions)
+    reader = SharedReader(faults, versions, table)
+
+    def changes():
+        # The store applies each change to its table, like this
+        found = reader.changes()
+        for index, flag, value in found:
+            table.set(index, flag, value)
+        return found
+
+    assert changes() == []
+    writer.set(4, 'in_use', 1)
+    writer.set(1, 'connected', True)
+    writer.set(1, 'connected', True)
+    assert versions[1] == 1
+    assert changes() == [(1, 'connected', True), (4, 'in_use', True)]
+    assert changes() == []
+    # Changed and changed back before the GUI looked: nothing to report
+    writer.set(2, 'ok', True)
+    writer.set(2, 'ok', False)
+    assert changes() == []
+    writer.set_range(table.where('PLC:A:', 2), 'vetoed', True)
+    assert changes() == [
+        (3, 'vetoed', True), (4, 'vetoed', True), (5, 'vetoed', True),
+    ]
+
+
+def child(code, timeout=10):
+    """An IngestProcess around a stand-in child process."""
+    ingest = IngestProcess.__new__(IngestProcess)
+    ingest.ready = False
+    ingest.deadline = time.monotonic() + timeout
+    ingest._received = b''
+    ingest.process = subprocess.Popen(
+        [sys.executable, '-c', code], stdout=subprocess.PIPE,
+    )
+    return ingest
+
+
+def check_until_done(ingest):
+    """Check for ready until it is, or raises."""
+    while not ingest.check_ready():
+        time.sleep(0.01)
+
+
+def test_check_ready():
+    ingest = child(
+        'import sys, time; print("subscribing"); sys.stdout.flush(); '
+        'time.sleep(0.2); sys.stdout.write("ready\\n")'
+    )
+    # Never waits for the child
+    assert not ingest.check_ready()
+    check_until_done(ingest)
+    assert ingest.check_ready()
+    assert ingest.process.wait(10) == 0
+    with pytest.raises(ChildProcessError):
+        check_until_done(child('raise SystemExit(1)'))
+    ingest = child('import time; time.sleep(10)', timeout=0.1)
+    with pytest.raises(TimeoutError):
+        check_until_done(ingest)
+    ingest.process.kill()
+    ingest.process.wait()
+
+
+class DeadIngest:
+    """Stand-in for an ingest process that has exited."""
+    def is_alive(self):
+        return False
+
+    def close(self):
+        pass
+
+
+def test_store_falls_back(qapp, monkeypatch):
+    store = FastFaultStore()
+    store.add_table(CONFIG)
+    store.new_value(0, 'connected', True)
+    store._ingest = DeadIngest()
+    connected = []
+    monkeypatch.setattr(store, 'connect', lambda: connected.append(True))
+    store.poll_ingest()
+    assert not store.ingesting
+    assert connected == [True]
+    assert not store.faults['connected'].any()
+    # One channel per fast fault readback, and per FFO readback
+    assert len(store.channels()) == 6 * len(FF_CHANNELS) + 2
@@ -0,0 +1,77 @@
+import gc
+import json
+import os
+import sys
+import weakref
+
+import yaml
+
+from pmpsui.manifest import Config, PVManifest, load_config, manifest_for
+
+CONFIG = dict(
+    fastfaults=[
+        dict(prefix='PLC:A:', name='A', ffo_start=1, ffo_end=2, ff_start=1,
+             ff_end=3, ffo_desc=['first'], ffo_veto=['veto']),
+        dict(prefix='PLC:B:', name='B', ffo_start=1, ffo_end=1, ff_start=1,
+             ff_end=12),
+    ],
+    preemptive_requests=[
+        dict(prefix='PLC:A:', arbiter_instance='ARB:01',
+             assertion_pool_start=9, assertion_pool_end=10),
+    ],
+)
+
+
+def test_manifest_rows():
+    manifest = PVManifest(CONFIG)
+    assert len(manifest.fastfaults) == 18
+    assert manifest.fastfaults[17].base == 'PLC:B:FFO:01:FF:012'
+    assert manifest.fastfaults[17].ff_text == '012'
+    assert [plc.ffos for plc in manifest.plcs] == [range(0, 1), range(1, 2)]
+    # PLC:A: FFO 2 has no description, so no row, like the arbiter outputs
+    first, second = manifest.ffos
+    assert (first.desc, first.veto, first.faults) == ('first', 'veto',
+                                                      range(0, 3))
+    assert (second.prefix, second.faults) == ('PLC:B:', range(6, 18))
+    assert manifest.ffo_faults(second)[0].base == 'PLC:B:FFO:01:FF:001'
+    assert manifest.fault_ffos[:7] == (0, 0, 0, None, None, None, 1)
+    assert [req.pool_text for req in manifest.requests] == ['009', '010']
+
+
+def test_manifest_for_compiles_once():
+    config = Config(CONFIG)
+    manifest = manifest_for(config)
+    assert manifest_for(config) is manifest
+    assert manifest_for(Config(CONFIG)) is not manifest
+    # The manifest goes with its config, nothing else holds either
+    config = weakref.ref(config)
+    manifest = weakref.ref(manifest)
+    gc.collect()
+    assert config() is None and manifest() is None
+
+
+def test_manifest_data():
+    manifest = PVManifest(CONFIG)
+    data = json.loads(json.dumps(manifest.to_data()))
+    loaded = PVManifest.from_data(data)
+    for rows in ('fastfaults', 'ffos', 'plcs', 'fault_ffos', 'requests'):
+        assert getattr(loaded, rows) == getattr(manifest, rows)
+    assert all(sys.intern(row.base) is row.base for row in loaded.fastfaults)
+
+
+def test_load_config_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    path = tmp_path / 'TST_config.yml'
+    path.write_text(yaml.safe_dump(CONFIG))
+    config = load_config(path)
+    assert config == CONFIG
+    cache, = (tmp_path / 'cache' / 'pmpsui').iterdir()
+    assert json.loads(cache.read_text())['config'] == CONFIG
+    cached = load_config(path)
+    assert cached == CONFIG
+    assert manifest_for(cached).fastfaults == manifest_for(config).fastfaults
+    # A changed file is compiled again
+    path.write_text(yaml.safe_dump(dict(CONFIG, preemptive_requests=[])))
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert manifest_for(load_config(path)).requests == ()
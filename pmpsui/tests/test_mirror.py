@@ -0,0 +1,66 @@
+import epics
+import numpy as np
+import pytest
+
+from pmpsui.mirror import (LineReader, MirrorServer, callback_state,
+                           decode_value, encode_message, encode_value,
+                           server_answers)
+
+
+def test_encode_value_kinds():
+    assert encode_value(3, '3', epics.dbr.TIME_ENUM) == ['int', 3]
+    assert encode_value(1.5, '1.5', epics.dbr.TIME_DOUBLE) == ['float', 1.5]
+    assert encode_value('abc', 'abc', epics.dbr.TIME_STRING) == ['str', 'abc']
+    # Empty strings arrive as int types in pyepics
+    assert encode_value('', '', epics.dbr.TIME_CHAR) == ['str', '']
+    array = np.arange(3, dtype=np.int32)
+    signal_type, value = decode_value(encode_value(array, None, None))
+    assert signal_type is np.ndarray
+    assert value.dtype == np.int32
+    assert value.tolist() == [0, 1, 2]
+
+
+def test_callback_state():
+    state = callback_state(
+        value=2,
+        char_value='Two',
+        ftype=epics.dbr.CTRL_ENUM,
+        severity=1,
+        enum_strs=(b'Zero', b'One', b'Two'),
+        units='',
+        upper_ctrl_limit=np.float64(10),
+        pvname='TST:PV',
+    )
+    assert state == dict(
+        severity=1,
+        enum_strs=['Zero', 'One', 'Two'],
+        upper_ctrl_limit=10.0,
+        value=['int', 2],
+    )
+
+
+def test_line_reader():
+    reader = LineReader()
+    data = encode_message({'sub': 'A'}) + encode_message({'sub': 'B'})
+    assert reader.feed(data[:5]) == []
+    assert reader.feed(data[5:-3]) == [{'sub': 'A'}]
+    assert reader.feed(data[-3:]) == [{'sub': 'B'}]
+    # Bad lines are dropped without losing the rest
+    assert reader.feed(b'garbage\n' + data) == [{'sub': 'A'}, {'sub': 'B'}]
+
+
+def test_server_single_instance(qapp, tmp_path):
+    name = str(tmp_path / 'mirror')
+    assert not server_answers(name)
+    server = MirrorServer(name)
+    assert server_answers(name)
+    # A second aggregator must not steal the live one's socket
+    with pytest.raises(RuntimeError):
+        MirrorServer(name)
+    assert server_answers(name)
+    server.server.close()
+    # A stale socket file with nothing behind it is replaced
+    (tmp_path / 'mirror').touch()
+    server = MirrorServer(name)
+    assert server_answers(name)
+    server.server.close()
@@ -0,0 +1,124 @@
+import ast
+import collections
+import inspect
+import textwrap
+
+import pydm
+from pydm.data_plugins.epics_plugins import pyepics_plugin_component
+from pydm.widgets.channel import PyDMChannel
+
+from pmpsui.monitor_mask import (ALARM, DEFAULT_MASK, PROPERTY, PYDM_VERSION,
+                                 VALUE, add_listener_mask, channel_mask,
+                                 mask_name, masked_init, remove_listener_mask)
+
+
+def slot(*args):
+    pass
+
+
+def test_channel_mask_from_slots():
+    assert channel_mask(PyDMChannel('ca://TST', connection_slot=slot)) == 0
+    assert channel_mask(PyDMChannel('ca://TST', value_slot=slot)) == VALUE
+    assert channel_mask(PyDMChannel('ca://TST', severity_slot=slot)) == ALARM
+    channel = PyDMChannel(
+        'ca://TST', value_slot=slot, severity_slot=slot, unit_slot=slot,
+    )
+    assert channel_mask(channel) == DEFAULT_MASK
+
+
+def test_channel_mask_override():
+    channel = PyDMChannel('ca://TST', value_slot=slot, prec_slot=slot)
+    assert channel_mask(channel) == VALUE | PROPERTY
+    channel.monitor_mask = ALARM
+    assert channel_mask(channel) == ALARM
+
+
+def test_mask_name():
+    assert mask_name(0) == 'none'
+    assert mask_name(VALUE | ALARM) == 'value|alarm'
+    assert mask_name(DEFAULT_MASK) == 'value|alarm|property'
+
+
+class FakePV:
+    def __init__(self, auto_monitor):
+        self._auto_monitor = auto_monitor
+        self.masks = []
+
+    @property
+    def auto_monitor(self):
+        return self._auto_monitor
+
+    @auto_monitor.setter
+    def auto_monitor(self, mask):
+        self._auto_monitor = mask
+        self.masks.append(mask)
+
+
+class FakeConnection:
+    """Just what the listener mask bookkeeping uses of a Connection."""
+    def __init__(self, mask):
+        self.pv = FakePV(mask)
+        self.listener_masks = collections.Counter()
+        self.listener_count = 0
+
+    def add(self, mask):
+        self.listener_count += 1
+        add_listener_mask(self, mask)
+
+    def remove(self, mask):
+        self.listener_count -= 1
+        remove_listener_mask(self, mask)
+
+
+def test_listener_masks_widen_and_narrow():
+    connection = FakeConnection(VALUE)
+    connection.add(VALUE)
+    # Already subscribed with this mask
+    assert connection.pv.masks == []
+    connection.add(ALARM)
+    assert connection.pv.auto_monitor == VALUE | ALARM
+    connection.add(VALUE)
+    assert connection.pv.masks == [VALUE | ALARM]
+    connection.remove(ALARM)
+    assert connection.pv.auto_monitor == VALUE
+    # Still one value listener left
+    connection.remove(VALUE)
+    assert connection.pv.masks == [VALUE | ALARM, VALUE]
+    # The last listener leaving doesn't touch the subscription
+    connection.remove(VALUE)
+    assert connection.pv.masks == [VALUE | ALARM, VALUE]
+    assert not connection.listener_masks
+
+
+def statements(source):
+    """
+    ast dumps of a function's statements, without its docstring, its
+    first line (the base class __init__) and the creation of the PV.
+    """
+    body = ast.parse(textwrap.dedent(source)).body[0].body
+    if isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant):
+        body = body[1:]
+    return [
+        ast.dump(statement) for statement in body[1:]
+        if not (isinstance(statement, ast.Assign)
+                and ast.unparse(statement.targets[0]) == 'self.pv')
+    ]
+
+
+def test_masked_init_matches_pydm():
+    assert pydm.__version__ == PYDM_VERSION
+    source = inspect.getsource(pyepics_plugin_component)
+    connection = next(
+        node for node in ast.parse(source).body
+        if isinstance(node, ast.ClassDef) and node.name == 'Connection'
+    )
+    init = next(
+        node for node in connection.body
+        if isinstance(node, ast.FunctionDef) and node.name == '__init__'
+    )
+    # Everything outside of the hotfix lines is the same as in pydm
+    lines = inspect.getsource(masked_init).splitlines()
+    start = lines.index('    # These are the hotfix lines')
+    end = lines.index('    # These were the hotfix lines')
+    copied = statements('\n'.join(lines[:start] + lines[end + 1:]))
+    assert copied == statements(ast.get_source_segment(source, init))
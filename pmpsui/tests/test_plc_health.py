@@ -0,0 +1,38 @@
+import pytest
+
+from pmpsui.plc_health import CycleCountTracker
+
+
+def test_cycle_count_tracker_rate_and_stall(clock):
+    tracker = CycleCountTracker(length=8, stall_timeout=5, clock=clock)
+    assert tracker.health().rate is None
+    assert not tracker.is_stalled()
+    for count in range(0, 1000, 100):
+        tracker.record(count)
+        clock.now += 1
+    health = tracker.health()
+    assert health.rate == pytest.approx(100)
+    assert health.jitter == pytest.approx(0)
+    assert not health.stalled
+    clock.now += 10
+    assert tracker.is_stalled()
+    # Counting backwards is a restart, so the old samples are dropped
+    tracker.record(5)
+    assert tracker.rate() is None
+    assert not tracker.is_stalled()
+
+
+def test_cycle_count_tracker_frozen_count_stalls(clock):
+    tracker = CycleCountTracker(length=8, stall_timeout=5, clock=clock)
+    tracker.record(100)
+    # The IOC keeps publishing the same count, the PLC task isn't running
+    for _ in range(10):
+        clock.now += 1
+        tracker.record(100)
+    assert tracker.last_change() == 0
+    assert tracker.is_stalled()
+    assert tracker.rate() == 0
+    clock.now += 1
+    tracker.record(200)
+    assert tracker.last_change() == clock.now
+    assert not tracker.is_stalled()
@@ -0,0 +1,45 @@
+from pmpsui import pv_probe
+from pmpsui.pv_probe import PVProbe, PVResolver
+
+REFERENCE = 'loc://pmpsui_probe_ref?type=int&init=0'
+FOUND = 'loc://pmpsui_probe_found?type=int&init=0'
+# No such PV, this never connects
+MISSING = 'ca://PMPSUI:TEST:PROBE:MISSING'
+
+
+def test_resolver_probes_once_per_key(qapp, qtbot, monkeypatch):
+    monkeypatch.setattr(pv_probe, 'PROBE_TIMEOUT_MS', 100)
+    resolver = PVResolver()
+    results = []
+    for _ in range(3):
+        resolver.when_resolved(
+            'ioc', [FOUND, MISSING], results.append, reference=REFERENCE,
+        )
+    assert len(resolver.findChildren(PVProbe)) == 1
+    assert resolver.result('ioc') is None
+    # The missing PV times out once the reference has connected
+    qtbot.waitUntil(lambda: len(results) == 3, timeout=2000)
+    assert results == [[True, False]] * 3
+    assert resolver.result('ioc') == [True, False]
+    # Later questions are answered from the cache right away
+    resolver.when_resolved('ioc', [MISSING], results.append)
+    assert results[-1] == [True, False]
+    assert len(resolver.findChildren(PVProbe)) == 1
+    # A different key gets its own probe, which finishes without waiting
+    resolver.when_resolved('other', [FOUND], results.append)
+    assert len(resolver.findChildren(PVProbe)) == 2
+    qtbot.waitUntil(lambda: len(results) == 5, timeout=2000)
+    assert results[-1] == [True]
+    assert resolver.result('unknown') is None
+
+
+def test_probe_waits_for_reference(qapp, qtbot, monkeypatch):
+    monkeypatch.setattr(pv_probe, 'PROBE_TIMEOUT_MS', 50)
+    probe = PVProbe([MISSING], reference=MISSING + ':REF')
+    probe.start()
+    # With the IOC down nothing can be concluded, however long it takes
+    qtbot.wait(200)
+    assert probe.result is None
+    probe.finish()
+    assert probe.result == [False]
+    assert probe.channels() == []
@@ -0,0 +1,80 @@
+from pmpsui.qos import QoSPolicy, QoSTier, Throttle
+
+CONFIG = dict(qos=dict(
+    tiers=dict(slow=5, fast=50),
+    tabs=dict(plc_ioc_status='slow', arbiter='live'),
+    widgets=dict(RateLimitedLabel='fast', Missing='nonexistent'),
+))
+
+
+def test_throttle_delivers_latest(qapp):
+    tier = QoSTier('test', 10)
+    received = []
+    throttle = Throttle(received.append, tier, 'Widget')
+    # The first update of an idle tier goes straight through
+    throttle(1)
+    assert received == [1]
+    for value in (2, 3, 4):
+        throttle(value)
+    assert received == [1]
+    # One tick of the tier timer delivers only the newest value
+    tier.flush()
+    assert received == [1, 4]
+    # A tick with nothing waiting stops the timer, the next one is direct
+    tier.flush()
+    assert not tier._timer.isActive()
+    throttle(5)
+    assert received == [1, 4, 5]
+
+
+def test_throttle_paced_by_timer(qapp, qtbot):
+    tier = QoSTier('test', 20)
+    assert tier._timer.interval() == 50
+    received = []
+    throttle = Throttle(received.append, tier, 'Widget')
+    for value in range(10):
+        throttle(value)
+    assert received == [0]
+    qtbot.waitUntil(lambda: received == [0, 9], timeout=1000)
+    # Unlimited tiers deliver everything right away
+    tier.rate = 0
+    throttle(10)
+    throttle(11)
+    assert received == [0, 9, 10, 11]
+
+
+def test_tier_lookup(qapp, monkeypatch):
+    policy = QoSPolicy()
+    monkeypatch.setattr(QoSPolicy, '_instance', policy)
+    QoSPolicy.configure(CONFIG)
+    assert policy.tiers['slow'].rate == 5
+    assert policy.tiers['fast'].rate == 50
+    # The widget class wins over the tab
+    assert policy.tier_for('RateLimitedLabel', 'plc_ioc_status').name == 'fast'
+    assert policy.tier_for('PyDMLabel', 'plc_ioc_status').name == 'slow'
+    assert policy.tier_for('PyDMLabel', 'arbiter').name == 'live'
+    assert policy.tier_for('PyDMLabel').name == 'live'
+    assert policy.tier_for('Missing', 'plc_ioc_status').name == 'live'
+    # Live slots aren't wrapped at all
+    assert policy.throttle(print, 'PyDMLabel') is print
+    assert isinstance(policy.throttle(print, 'PyDMLabel', 'plc_ioc_status'),
+                      Throttle)
+
+
+def test_stats(qapp):
+    policy = QoSPolicy()
+    policy.tiers['slow'].rate = 10
+    policy.tab_tiers['plc_ioc_status'] = 'slow'
+    received = []
+    first = policy.throttle(received.append, 'Label', 'plc_ioc_status')
+    second = policy.throttle(received.append, 'Label', 'plc_ioc_status')
+    policy.throttle(received.append, 'Other')
+    for value in range(3):
+        first(value)
+        second(value)
+    policy.tiers['slow'].flush()
+    assert received == [0, 2, 2]
+    assert policy.stats() == [
+        ('live', 0.0, 'Other', 1, 0, 0),
+        ('slow', 10.0, 'Label', 2, 6, 3),
+    ]
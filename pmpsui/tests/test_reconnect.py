@@ -0,0 +1,82 @@
+import time
+
+import pytest
+
+from pmpsui import reconnect
+from pmpsui.reconnect import ReconnectGrouper
+
+
+@pytest.fixture
+def grouper(qapp, monkeypatch):
+    monkeypatch.setattr(reconnect, 'BATCH_QUIET_MS', 50)
+    monkeypatch.setattr(reconnect, 'BATCH_MAX_MS', 300)
+    grouper = ReconnectGrouper()
+    grouper.add_prefixes(['PLC:TST:', 'PLC:TST:MOT:', None])
+    return grouper
+
+
+def keep_reconnecting(qtbot, grouper, address, seconds):
+    """Report a transition every 10 ms, well within the quiet time."""
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        grouper.connection_changed(address, True)
+        qtbot.wait(10)
+
+
+def test_prefix_for(grouper):
+    assert grouper.prefix_for('ca://PLC:TST:MOT:FFO:01') == 'PLC:TST:MOT:'
+    assert grouper.prefix_for('PLC:TST:ARB:01') == 'PLC:TST:'
+    assert grouper.prefix_for('ca://OTHER:PV') is None
+    assert grouper.prefix_for(None) is None
+
+
+def test_batch_closes_when_quiet(grouper, qtbot):
+    with qtbot.waitSignal(grouper.batch_started) as started:
+        grouper.connection_changed('ca://PLC:TST:MOT:A', False)
+    assert started.args == ['PLC:TST:MOT:']
+    assert grouper.in_batch('PLC:TST:MOT:')
+    assert not grouper.in_batch('PLC:TST:')
+    # Each transition extends the batch past the quiet time
+    keep_reconnecting(qtbot, grouper, 'ca://PLC:TST:MOT:B', 0.15)
+    assert grouper.in_batch('PLC:TST:MOT:')
+    with qtbot.waitSignal(grouper.batch_finished, timeout=1000) as finished:
+        pass
+    assert finished.args == ['PLC:TST:MOT:']
+    assert not grouper.in_batch('PLC:TST:MOT:')
+
+
+def test_batch_closes_at_max(grouper, qtbot):
+    finished = []
+    grouper.batch_finished.connect(finished.append)
+    grouper.connection_changed('ca://PLC:TST:A', False)
+    # Never quiet, but the batch is closed at BATCH_MAX_MS anyway
+    keep_reconnecting(qtbot, grouper, 'ca://PLC:TST:A', 0.45)
+    assert finished == ['PLC:TST:']
+
+
+def test_hold_runs_once_per_batch(grouper, qtbot):
+    calls = []
+
+    def recompute():
+        calls.append(grouper.in_batch('PLC:TST:'))
+
+    assert not grouper.hold('PLC:TST:', recompute)
+    grouper.connection_changed('ca://PLC:TST:A', False)
+    for _ in range(5):
+        assert grouper.hold('PLC:TST:', recompute)
+    with qtbot.waitSignal(grouper.batch_finished, timeout=1000):
+        pass
+    # Once, after the batch was closed
+    assert calls == [False]
+    assert not grouper.hold('PLC:TST:', recompute)
+
+
+def test_unconfigured_never_held(grouper, qtbot):
+    wrapped = []
+    slot = grouper.wrap('ca://OTHER:PV', wrapped.append)
+    slot(False)
+    slot(True)
+    assert wrapped == [False, True]
+    assert not grouper.in_batch(None)
+    assert not grouper.hold(None, print)
+    assert not grouper.hold(grouper.prefix_for('ca://OTHER:PV'), print)
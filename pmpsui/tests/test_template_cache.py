@@ -0,0 +1,62 @@
+import os.path
+
+import pytest
+from pydm.display import load_file
+from pydm.widgets.base import PyDMWidget
+from qtpy import QtWidgets
+
+from pmpsui.fast_faults import indicator_macros
+from pmpsui.template_cache import expand_macros, load_template
+
+TEMPLATES = os.path.join(os.path.dirname(__file__), '..', 'templates')
+ROWS = {
+    'fastfaults_entry.ui': dict(
+        index=0, P='PLC:TST:', FFO='01', FF='02',
+        **indicator_macros('PLC:TST:FFO:01:FF:02', False),
+    ),
+    'preemptive_requests_entry.ui': dict(
+        index=0, P='PLC:TST:', ARBITER='ARB:01', POOL='003',
+    ),
+}
+
+
+def describe(display):
+    """What matters about each widget of a row, in creation order."""
+    return [
+        (
+            widget.objectName(),
+            type(widget).__name__,
+            widget.channel if isinstance(widget, PyDMWidget) else None,
+            widget.text() if isinstance(widget, QtWidgets.QLabel) else None,
+            widget.toolTip(),
+        )
+        for widget in display.findChildren(QtWidgets.QWidget)
+    ]
+
+
+def test_expand_macros():
+    assert expand_macros('${A}:${B}', dict(A='${B}x', B='y')) == 'yx:y'
+    assert expand_macros('$A:${C}', dict(A='a')) == 'a:${C}'
+
+
+@pytest.mark.parametrize('filename', sorted(ROWS))
+def test_same_as_pydm(qtbot, filename):
+    path = os.path.join(TEMPLATES, filename)
+
+    def both(macros):
+        displays = (load_template(path, macros),
+                    load_file(path, macros=macros, target=None))
+        for display in displays:
+            qtbot.addWidget(display)
+        return [describe(display) for display in displays]
+
+    cached, expected = both(ROWS[filename])
+    assert cached == expected
+    # No macros are left over, and they really were substituted
+    channels = [channel for _, _, channel, _, _ in expected if channel]
+    assert channels
+    assert not any('$' in channel for channel in channels)
+    assert all('PLC:TST:' in channel for channel in channels)
+    # Later rows get their own macros
+    cached, expected = both(dict(ROWS[filename], P='PLC:OTHER:'))
+    assert cached == expected
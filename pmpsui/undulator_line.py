@@ -0,0 +1,192 @@
+"""
+One shared data model for the PVs of an undulator line.
+
+The eV Calculation tab shows a bar and two numeric K labels for every
+segment of the line. Rather than have each of these subscribe its own
+copy of the line-wide and per-segment PVs, ``UndulatorLine`` subscribes
+each line PV once and each segment's PVs once through
+``UndulatorSegment``, and every widget is fed from there.
+"""
+from __future__ import annotations
+
+import functools
+from typing import Optional
+
+from pydm.widgets.channel import PyDMChannel
+from qtpy import QtCore
+
+# The PVs that are shared by the whole line
+LINE_CHANNELS = dict(
+    first_segment='ca://{prefix}PE:UND:FirstSegment_RBV',
+    last_segment='ca://{prefix}PE:UND:LastSegment_RBV',
+    seed_number='ca://{prefix}PE:UND:SeedUndulatorNumber_RBV',
+    upper_k='ca://{prefix}PE:UND:HiK_RBV',
+)
+# The line PVs that only select which segments exist
+RANGE_ENTRIES = ('first_segment', 'last_segment')
+# The PVs that each segment has
+SEGMENT_CHANNELS = dict(
+    active='ca://{prefix}PE:UND:{segment}:Active_RBV',
+    curr_k='ca://{prefix}PE:UND:{segment}:KAct_RBV',
+    target_k='ca://{prefix}PE:UND:{segment}:KDes_RBV',
+    severity='ca://{prefix}PE:UND:{segment}:KDesValid_RBV',
+)
+# The segment PVs that are also shown as labels, which need a precision,
+# units and alarm severity as well
+LABEL_ENTRIES = ('curr_k', 'target_k')
+
+
+class UndulatorSegment(QtCore.QObject):
+    """
+    The PVs of one undulator segment, subscribed once.
+
+    ``value_changed`` and ``connection_changed`` are emitted with the
+    entry name from SEGMENT_CHANNELS. The display precision, units and
+    alarm severity of the K values are sent through ``value_changed`` as
+    e.g. ``curr_k_prec``, ``curr_k_unit`` and ``curr_k_severity``.
+
+    Parameters
+    ----------
+    prefix : str
+        The undulator line prefix.
+    segment : int
+        The segment number.
+    parent : QObject, optional
+        Standard qt parent argument.
+    """
+    value_changed = QtCore.Signal(str, object)
+    connection_changed = QtCore.Signal(str, bool)
+
+    def __init__(self, prefix: str, segment: int, parent=None):
+        super().__init__(parent=parent)
+        self.segment = segment
+        self.values = dict()
+        self.connections = dict()
+        self._channels = []
+        for entry, pv_format in SEGMENT_CHANNELS.items():
+            kwargs = dict(
+                value_slot=functools.partial(self.new_value, entry),
+                connection_slot=functools.partial(self.new_conn, entry),
+            )
+            if entry in LABEL_ENTRIES:
+                for slot in ('prec', 'unit', 'severity'):
+                    kwargs[f'{slot}_slot'] = functools.partial(
+                        self.new_value, f'{entry}_{slot}',
+                    )
+            self._channels.append(PyDMChannel(
+                pv_format.format(prefix=prefix, segment=segment),
+                **kwargs,
+            ))
+            self.values[entry] = None
+            self.connections[entry] = False
+
+    def connect(self) -> None:
+        for ch in self._channels:
+            ch.connect()
+
+    def disconnect(self) -> None:
+        for ch in self._channels:
+            ch.disconnect()
+
+    def new_value(self, entry: str, value) -> None:
+        self.values[entry] = value
+        self.value_changed.emit(entry, value)
+
+    def new_conn(self, entry: str, connected: bool) -> None:
+        self.connections[entry] = connected
+        self.connection_changed.emit(entry, connected)
+
+    def channels(self) -> list[PyDMChannel]:
+        return self._channels
+
+
+class UndulatorLine(QtCore.QObject):
+    """
+    The PVs of a whole undulator line, each subscribed once.
+
+    The line-wide seed number and upper K limit are published through
+    ``value_changed`` and ``connection_changed``. Changes to the first
+    and last segment numbers or their connection states are published
+    through ``range_changed``, see ``segment_range``.
+
+    Segments are only subscribed while something is using them, see
+    ``segment`` and ``remove_segment``.
+
+    Parameters
+    ----------
+    prefix : str
+        The undulator line prefix.
+    parent : QObject, optional
+        Standard qt parent argument.
+    """
+    value_changed = QtCore.Signal(str, object)
+    connection_changed = QtCore.Signal(str, bool)
+    range_changed = QtCore.Signal()
+
+    def __init__(self, prefix: str, parent=None):
+        super().__init__(parent=parent)
+        self.prefix = prefix
+        self.values = dict()
+        self.connections = dict()
+        self._segments = dict()
+        self._channels = []
+        for entry, pv_format in LINE_CHANNELS.items():
+            self._channels.append(PyDMChannel(
+                pv_format.format(prefix=prefix),
+                value_slot=functools.partial(self.new_value, entry),
+                connection_slot=functools.partial(self.new_conn, entry),
+            ))
+            self.values[entry] = None
+            self.connections[entry] = False
+        for ch in self._channels:
+            ch.connect()
+
+    def new_value(self, entry: str, value) -> None:
+        self.values[entry] = value
+        if entry in RANGE_ENTRIES:
+            self.range_changed.emit()
+        else:
+            self.value_changed.emit(entry, value)
+
+    def new_conn(self, entry: str, connected: bool) -> None:
+        self.connections[entry] = connected
+        if entry in RANGE_ENTRIES:
+            self.range_changed.emit()
+        else:
+            self.connection_changed.emit(entry, connected)
+
+    def segment_range(self) -> Optional[range]:
+        """
+        The segments the line currently has, or None if not known.
+        """
+        if not all(self.connections[entry] for entry in RANGE_ENTRIES):
+            return None
+        first = self.values['first_segment']
+        last = self.values['last_segment']
+        if not first or not last or first > last:
+            return None
+        return range(first, last + 1)
+
+    def segment(self, segment: int) -> UndulatorSegment:
+        """Get the model for one segment, subscribing to it if needed."""
+        try:
+            return self._segments[segment]
+        except KeyError:
+            model = UndulatorSegment(self.prefix, segment, parent=self)
+            self._segments[segment] = model
+            model.connect()
+            return model
+
+    def remove_segment(self, segment: int) -> None:
+        """Stop subscribing to a segment that is no longer shown."""
+        model = self._segments.pop(segment, None)
+        if model is not None:
+            model.disconnect()
+            model.deleteLater()
+
+    def channels(self) -> list[PyDMChannel]:
+        """All the line and segment channels, for PyDM's cleanup."""
+        channels = list(self._channels)
+        for model in self._segments.values():
+            channels.extend(model.channels())
+        return channels
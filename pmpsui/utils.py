@@ -1,44 +1,13 @@
+from __future__ import annotations
+
 import functools
-from typing import Callable
+from typing import Callable, Optional
 
 from pydm.widgets.base import PyDMWidget
 from pydm.widgets.channel import PyDMChannel
-from qtpy import QtCore, QtGui, QtWidgets
-
-
-def morph_into_vertical(label: QtWidgets.QLabel):
-    def minimumSizeHint(*args, **kwargs):
-        s = QtWidgets.QLabel.minimumSizeHint(label)
-        return QtCore.QSize(s.height(), s.width())
-
-    def sizeHint(*args, **kwargs):
-        s = QtWidgets.QLabel.sizeHint(label)
-        return QtCore.QSize(s.height(), s.width())
+from qtpy import QtCore
 
-    def paintEvent(*args, **kwargs):
-        painter = QtGui.QPainter(label)
-        painter.translate(label.sizeHint().width(), label.sizeHint().height())
-        painter.rotate(270)
-
-        # size of text inside the label widget
-        text_w = label.fontMetrics().boundingRect(label.text()).width()
-        text_h = label.fontMetrics().boundingRect(label.text()).height()
-        # size of label widget
-        label_h = label.sizeHint().height()
-        label_w = label.sizeHint().width()
-        # this will make it look like it is right (or top) justified
-        pos_x = label_h - text_w
-        # center the text on the bitmask
-        pos_y = -(label_w - text_h)
-        painter.drawText(pos_x, pos_y, label.text())
-
-    # Unbind the size restrictions from the ui file that make it viewable in designer
-    label.setMaximumWidth(label.maximumHeight())
-
-    label.minimumSizeHint = minimumSizeHint
-    label.sizeHint = sizeHint
-    label.paintEvent = paintEvent
-    label.update()
+from .pv_probe import PVResolver
 
 
 class BackCompat(QtCore.QObject):
@@ -114,18 +83,73 @@ class BackCompat(QtCore.QObject):
         if connected and widget.channel != channel:
             widget.channel = channel
 
-    def add_ev_ranges_alternate(self, widget: PyDMWidget) -> None:
+    def add_ev_ranges_alternate(
+        self,
+        widget: PyDMWidget,
+        prefix: Optional[str] = None,
+    ) -> None:
         """
         Handle the evRanges PV name change.
 
         Currently, some IOCs are using "PhotonEnergyRanges" and the
         newer IOCs are using "eVRanges" to appropriately shorten the PV names.
 
-        The .ui files have been updated to use "eVRanges" and this function
-        will use add_alternate_channel for backwards compatibility
-        until we've updated every IOC.
+        The .ui files have been updated to use "eVRanges". Rather than
+        subscribing to both names for every widget, each IOC is probed
+        once for which name it uses. Until the answer is known, the widget
+        is left without a channel, so that it never searches for a name
+        the IOC doesn't have. It is then given "PhotonEnergyRanges" if
+        that is the only name that exists, and "eVRanges" otherwise.
+
+        Parameters
+        ----------
+        widget : PyDMWidget
+            A widget that has a singular "channel" property that holds the
+            channel address that can be updated.
+        prefix : str, optional
+            The PV prefix shared by every widget on the same IOC, so that
+            the IOC is only probed once. Defaults to the widget's channel,
+            which probes once per widget.
         """
-        return self.add_alternate_channel(
-            widget=widget,
-            channel=widget.channel.replace("eVRanges", "PhotonEnergyRanges")
+        current = widget.channel
+        alternate = current.replace("eVRanges", "PhotonEnergyRanges")
+        key = (prefix or current, "eVRanges")
+        resolver = PVResolver.instance()
+        if resolver.result(key) is None:
+            widget.channel = ""
+        resolver.when_resolved(
+            key=key,
+            addresses=[current, alternate],
+            callback=functools.partial(
+                self.apply_ev_ranges_name,
+                widget=widget,
+                channel=current,
+                alternate=alternate,
+            ),
         )
+
+    def apply_ev_ranges_name(
+        self,
+        result: list[bool],
+        widget: PyDMWidget,
+        channel: str,
+        alternate: str,
+    ) -> None:
+        """
+        Probe callback for connecting a widget to the right eVRanges name.
+
+        Parameters
+        ----------
+        result : list of bool
+            Whether the new and the old name exist on the IOC.
+        widget : PyDMWidget
+            Widget to update
+        channel : str
+            The new name's channel address for this widget.
+        alternate : str
+            The old name's channel address for this widget.
+        """
+        has_new, has_old = result
+        if has_old and not has_new:
+            channel = alternate
+        self.apply_alt_channel(True, widget=widget, channel=channel)
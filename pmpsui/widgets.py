@@ -1,24 +1,38 @@
+from __future__ import annotations
+
+import collections
 import functools
+import time
 import weakref
-from typing import Iterable
+from typing import Iterable, Optional
 
-from pydm.widgets.base import PyDMPrimitiveWidget
+import numpy as np
+from pydm.widgets.base import PyDMPrimitiveWidget, refresh_style
 from pydm.widgets.byte import PyDMByteIndicator
 from pydm.widgets.channel import PyDMChannel
 from pydm.widgets.label import PyDMLabel
 from qtpy import QtCore, QtGui, QtWidgets
 
+from .compute import ComputeService
+from .ff_store import FastFaultStore
+from .history import FFOHistory, RingBuffer
+from .qos import QoSPolicy
 from .tooltips import get_ev_range_tooltip, get_tooltip_for_bc_bitmask
+from .undulator_line import LINE_CHANNELS, SEGMENT_CHANNELS, UndulatorLine
 
 
 class UndulatorWidget(QtWidgets.QWidget, PyDMPrimitiveWidget):
+    """
+    Bar showing the current and target K of one undulator segment.
+
+    Set ``prefix`` and ``segment`` for the widget to subscribe its own
+    channels, or use ``set_line`` to feed it from a shared UndulatorLine.
+    Repaints from a shared line are paced by the widget's QoS tier.
+    """
     CHANNELS = dict(
-        seed_number='ca://{prefix}PE:UND:SeedUndulatorNumber_RBV',
-        upper_k='ca://{prefix}PE:UND:HiK_RBV',
-        active='ca://{prefix}PE:UND:{segment}:Active_RBV',
-        curr_k='ca://{prefix}PE:UND:{segment}:KAct_RBV',
-        target_k='ca://{prefix}PE:UND:{segment}:KDes_RBV',
-        severity='ca://{prefix}PE:UND:{segment}:KDesValid_RBV'
+        seed_number=LINE_CHANNELS['seed_number'],
+        upper_k=LINE_CHANNELS['upper_k'],
+        **SEGMENT_CHANNELS,
     )
 
     BASE_BRUSH = QtGui.QBrush(QtGui.QColor('white'), QtCore.Qt.SolidPattern)
@@ -43,6 +57,9 @@ class UndulatorWidget(QtWidgets.QWidget, PyDMPrimitiveWidget):
         QtCore.Qt.DiagCrossPattern
     )
 
+    # (texture size, backwards) -> motion arrow texture, shared by all
+    _texture_cache = dict()
+
     def __init__(self, parent=None):
         super(UndulatorWidget, self).__init__(parent=parent)
         self._prefix = None
@@ -50,8 +67,10 @@ class UndulatorWidget(QtWidgets.QWidget, PyDMPrimitiveWidget):
         self._channels = dict()
         self._values = dict()
         self._connections = dict()
-        self._forward_texture = None
-        self._backward_texture = None
+        # The last drawn result and the render state it was drawn from
+        self._backing = None
+        self._backing_key = None
+        self._refresh = self._update_if_changed
 
     @QtCore.Property(str)
     def prefix(self):
@@ -78,14 +97,46 @@ class UndulatorWidget(QtWidgets.QWidget, PyDMPrimitiveWidget):
     def minimumSizeHint(self):
         return QtCore.QSize(100, 32)
 
+    def set_line(self, line, segment, qos_tab=None):
+        """
+        Show a segment from a shared UndulatorLine instead of our own PVs.
+
+        The repaints are limited to the rate of the QoS tier for this
+        widget class or for qos_tab, see pmpsui.qos.
+        """
+        self._segment = segment
+        self._refresh = QoSPolicy.instance().throttle(
+            self._update_if_changed, type(self).__name__, tab=qos_tab,
+        )
+        segment_model = line.segment(segment)
+        for source in (line, segment_model):
+            for entry, value in source.values.items():
+                if entry in self.CHANNELS:
+                    self._values[entry] = value
+            for entry, connected in source.connections.items():
+                if entry in self.CHANNELS:
+                    self._connections[entry] = connected
+            source.value_changed.connect(self.value_cb)
+            source.connection_changed.connect(self.conn_cb)
+        self._update_if_changed()
+
     def value_cb(self, entry, value):
         self._values[entry] = value
-        if self.connected():
-            self.update()
+        self._refresh()
 
     def conn_cb(self, entry, connected):
         self._connections[entry] = connected
-        if self.connected():
+        self._refresh()
+
+    def _update_if_changed(self):
+        """
+        Only schedule a repaint if the drawing would look different.
+
+        Values that don't change the picture, like a new seed number
+        that is still not this segment or a K move of less than a pixel,
+        don't cost a repaint.
+        """
+        if self._render_key() != self._backing_key:
             self.update()
 
     def connected(self):
@@ -116,7 +167,17 @@ class UndulatorWidget(QtWidgets.QWidget, PyDMPrimitiveWidget):
         return [ch for ch in self._channels.values()]
 
     def _create_textures(self, backwards=False):
-        size = max(self.height() / 10.0, 10)
+        size = int(max(self.height() / 10.0, 10))
+        try:
+            return self._texture_cache[(size, backwards)]
+        except KeyError:
+            pass
+        texture = self._draw_texture(size, backwards)
+        self._texture_cache[(size, backwards)] = texture
+        return texture
+
+    @staticmethod
+    def _draw_texture(size, backwards):
         _texture = QtGui.QPixmap(QtCore.QSize(size, size))
         _texture.fill(QtGui.QColor("transparent"))
 
@@ -165,26 +226,17 @@ class UndulatorWidget(QtWidgets.QWidget, PyDMPrimitiveWidget):
         painter.drawText(upper_rect, upper_str)
         painter.restore()
 
-    def paintEvent(self, event):
-        painter = QtGui.QPainter(self)
-        opt = QtWidgets.QStyleOption()
-        opt.initFrom(self)
-        self.style().drawPrimitive(QtWidgets.QStyle.PE_Widget, opt, painter,
-                                   self)
-        painter.setRenderHint(QtGui.QPainter.Antialiasing)
+    def _render_key(self):
+        """
+        Everything that the drawing depends on, at pixel resolution.
 
+        The K values are converted to pixel widths here so that two
+        states that would draw the same thing have the same key.
+        """
         w, h = self.width(), self.height()
-
-        painter.setBrush(self.BASE_BRUSH)
-        painter.setPen(self.BASE_PEN)
-        painter.drawRect(0, 0, w, h)
-
         if not self.connected():
-            return
+            return (w, h, False)
 
-        painter.setPen(QtGui.QPen(QtCore.Qt.NoPen))
-
-        active = self._values['active']
         upper_k = self._values['upper_k']
         if upper_k is None:
             # e.g. if PV is not connected yet
@@ -192,43 +244,97 @@ class UndulatorWidget(QtWidgets.QWidget, PyDMPrimitiveWidget):
         else:
             upper_k = max(6.0, upper_k)
         lower_k = 0.0
+
+        if self._values['severity'] == -1:
+            return (w, h, True, upper_k, lower_k, 'broken')
+
         curr_k = self._values['curr_k']
         target_k = self._values['target_k']
-        severity = self._values['severity']
-
-        if severity == -1:
-            painter.setBrush(self.BROKEN_BRUSH)
-            painter.drawRect(0, 0, w, h)
-            self._draw_limits(painter, upper_k, lower_k)
-            return
         curr_k = 0 if curr_k is None else curr_k
         target_k = 0 if target_k is None else target_k
-
-        if not active:
-            d_w = self._k_to_width(curr_k, upper_k, lower_k)
-            painter.setBrush(self.INACTIVE_BRUSH)
-            painter.drawRect(QtCore.QRectF(0.0, 0.0, d_w, h))
-            self._draw_limits(painter, upper_k, lower_k)
-            return
+        curr_w = round(self._k_to_width(curr_k, upper_k, lower_k))
+        if not self._values['active']:
+            return (w, h, True, upper_k, lower_k, 'inactive', curr_w)
 
         # Here we are active...
-        # Let's decide if using the seed or normal brush for this widget
-        brush = self.NORMAL_BRUSH if not self.is_seed() else self.SEED_BRUSH
-        curr_w = self._k_to_width(curr_k, upper_k, lower_k)
-        painter.setBrush(brush)
-        painter.drawRect(QtCore.QRectF(0.0, 0.0, curr_w, h))
-
-        if curr_k != target_k:
-            rem_brush = QtGui.QBrush()
-            # Set proper texture for forward/backward movement
-            texture = self._create_textures(backwards=curr_k > target_k)
-            rem_brush.setTexture(texture)
-            target_w = self._k_to_width(target_k, upper_k, lower_k)
-            rem_w = target_w - curr_w
-            painter.setBrush(rem_brush)
-            painter.drawRect(QtCore.QRectF(curr_w, 0.0, rem_w, h))
+        target_w = round(self._k_to_width(target_k, upper_k, lower_k))
+        # Note which direction we are moving in, if at all
+        if curr_k == target_k:
+            moving = 0
+        else:
+            moving = -1 if curr_k > target_k else 1
+        return (w, h, True, upper_k, lower_k, 'active', curr_w,
+                self.is_seed(), target_w, moving)
+
+    def _render(self, key):
+        """Draw the widget for a render key into a new pixmap."""
+        ratio = self.devicePixelRatioF()
+        pixmap = QtGui.QPixmap(self.size() * ratio)
+        pixmap.setDevicePixelRatio(ratio)
+        pixmap.fill(QtGui.QColor("transparent"))
+
+        painter = QtGui.QPainter(pixmap)
+        opt = QtWidgets.QStyleOption()
+        opt.initFrom(self)
+        self.style().drawPrimitive(QtWidgets.QStyle.PE_Widget, opt, painter,
+                                   self)
+        painter.setRenderHint(QtGui.QPainter.Antialiasing)
+
+        w, h, connected = key[:3]
+
+        painter.setBrush(self.BASE_BRUSH)
+        painter.setPen(self.BASE_PEN)
+        painter.drawRect(0, 0, w, h)
+
+        if not connected:
+            painter.end()
+            return pixmap
+
+        painter.setPen(QtGui.QPen(QtCore.Qt.NoPen))
+        upper_k, lower_k, state = key[3:6]
+
+        if state == 'broken':
+            painter.setBrush(self.BROKEN_BRUSH)
+            painter.drawRect(0, 0, w, h)
+        elif state == 'inactive':
+            curr_w = key[6]
+            painter.setBrush(self.INACTIVE_BRUSH)
+            painter.drawRect(QtCore.QRectF(0.0, 0.0, curr_w, h))
+        else:
+            curr_w, seed, target_w, moving = key[6:]
+            # Let's decide if using the seed or normal brush for this widget
+            brush = self.NORMAL_BRUSH if not seed else self.SEED_BRUSH
+            painter.setBrush(brush)
+            painter.drawRect(QtCore.QRectF(0.0, 0.0, curr_w, h))
+
+            if moving:
+                rem_brush = QtGui.QBrush()
+                # Set proper texture for forward/backward movement
+                texture = self._create_textures(backwards=moving < 0)
+                rem_brush.setTexture(texture)
+                rem_w = target_w - curr_w
+                painter.setBrush(rem_brush)
+                painter.drawRect(QtCore.QRectF(curr_w, 0.0, rem_w, h))
         self._draw_limits(painter, upper_k, lower_k)
         painter.end()
+        return pixmap
+
+    def changeEvent(self, event):
+        # Style, palette and font aren't in the render key, so redraw
+        if event.type() in (QtCore.QEvent.StyleChange,
+                            QtCore.QEvent.PaletteChange,
+                            QtCore.QEvent.FontChange):
+            self._backing_key = None
+        super().changeEvent(event)
+
+    def paintEvent(self, event):
+        key = self._render_key()
+        if self._backing is None or key != self._backing_key:
+            self._backing = self._render(key)
+            self._backing_key = key
+        painter = QtGui.QPainter(self)
+        painter.drawPixmap(0, 0, self._backing)
+        painter.end()
 
     def _k_to_width(self, k, upper, lower):
         if not k:
@@ -239,16 +345,24 @@ class UndulatorWidget(QtWidgets.QWidget, PyDMPrimitiveWidget):
 
 
 class UndulatorListWidget(QtWidgets.QWidget, PyDMPrimitiveWidget):
+    """
+    A bar and the current and target K for every segment of a line.
 
-    def __init__(self, parent=None):
+    All of the rows are fed from one shared UndulatorLine, so each line
+    and segment PV is only subscribed once no matter how many widgets
+    show it.
+
+    qos_tab is the tab name used to look up the update rate of the rows,
+    see pmpsui.qos.
+    """
+
+    def __init__(self, parent=None, qos_tab=None):
         super(UndulatorListWidget, self).__init__(parent=parent)
         self._prefix = None
-        self._channels = dict()
-        self._connections = dict()
-        self._forward_texture = None
-        self._backward_texture = None
-        self._first_segment = 0
-        self._last_segment = 0
+        self.qos_tab = qos_tab
+        self.line = None
+        # segment number -> row widget, for the segments currently shown
+        self._entries = dict()
 
         self.setLayout(QtWidgets.QVBoxLayout())
         self.scroll_area = QtWidgets.QScrollArea()
@@ -271,83 +385,75 @@ class UndulatorListWidget(QtWidgets.QWidget, PyDMPrimitiveWidget):
         self._prefix = value
         self._setup_channels()
 
-    def value_cb(self, first_segment, value):
-        if first_segment:
-            self._first_segment = value
-        else:
-            self._last_segment = value
-        if self.connected():
-            self._setup_widgets()
-
-    def conn_cb(self, entry, connected):
-        self._connections[entry] = connected
-        if self.connected():
-            self._setup_widgets()
-
     def connected(self):
-        if not len(self._connections):
+        if self.line is None:
             return False
-        return all(self._connections.values())
+        return self.line.segment_range() is not None
 
     def _setup_channels(self):
+        if self.line is not None:
+            self.clear()
+            for ch in self.line.channels():
+                ch.disconnect()
+            self.line.deleteLater()
+            self.line = None
         if not self._prefix:
             return
-
-        pvs = {
-            'first': 'ca://{prefix}PE:UND:FirstSegment_RBV',
-            'last': 'ca://{prefix}PE:UND:LastSegment_RBV'
-        }
-
-        for entry, pv_format in pvs.items():
-            pv = pv_format.format(prefix=self.prefix)
-            conn_cb = functools.partial(self.conn_cb, entry)
-            val_cb = functools.partial(self.value_cb, entry == 'first')
-            ch = PyDMChannel(pv, value_slot=val_cb, connection_slot=conn_cb)
-            self._channels[entry] = ch
-            self._connections[entry] = False
-
-        for _, ch in self._channels.items():
-            ch.connect()
+        self.line = UndulatorLine(self._prefix, parent=self)
+        self.line.range_changed.connect(self._setup_widgets)
 
     def channels(self):
-        return [ch for ch in self._channels.values()]
+        if self.line is None:
+            return []
+        return self.line.channels()
 
     def clear(self):
         """
         Remove all inner widgets from the layout
         """
-        layout = self.widget.layout()
-        while not layout.isEmpty():
-            w = layout.takeAt(0)
-            w.deleteLater()
+        for segment in list(self._entries):
+            self._remove_entry(segment)
 
     def _setup_widgets(self):
-        if (not self.connected() or not self._first_segment or
-                not self._last_segment):
-            return
-        if self._first_segment > self._last_segment:
+        """
+        Show one row per segment, adding and removing only what changed.
+
+        Rows for segments that stay in range are left as they are, so
+        their channels stay connected across range updates.
+        """
+        segments = self.line.segment_range()
+        if segments is None:
             return
-        self.clear()
-        segments = range(self._first_segment, self._last_segment + 1)
-        for seg in segments:
-            self.widget.layout().addLayout(self._create_entry(seg))
+        for segment in set(self._entries).difference(segments):
+            self._remove_entry(segment)
+        layout = self.widget.layout()
+        # The kept rows are already in order, so new rows slot in by index
+        for index, segment in enumerate(segments):
+            if segment not in self._entries:
+                entry = self._create_entry(segment)
+                self._entries[segment] = entry
+                layout.insertWidget(index, entry)
+
+    def _remove_entry(self, segment):
+        entry = self._entries.pop(segment)
+        self.widget.layout().removeWidget(entry)
+        self.line.remove_segment(segment)
+        entry.deleteLater()
 
     def _create_entry(self, segment):
         segment_label = QtWidgets.QLabel(str(segment))
         und_widget = UndulatorWidget()
-        und_widget.prefix = self.prefix
-        und_widget.segment = segment
+        und_widget.set_line(self.line, segment, qos_tab=self.qos_tab)
 
-        curr_pv = UndulatorWidget.CHANNELS['curr_k'].format(
-            prefix=self.prefix, segment=segment
+        segment_model = self.line.segment(segment)
+        curr_label = UndulatorValueLabel(
+            segment_model, 'curr_k', qos_tab=self.qos_tab,
         )
-        curr_label = PyDMLabel(init_channel=curr_pv)
         curr_label.setMinimumWidth(100)
 
-        target_pv = UndulatorWidget.CHANNELS['target_k'].format(
-            prefix=self.prefix, segment=segment
+        target_label = UndulatorValueLabel(
+            segment_model, 'target_k', qos_tab=self.qos_tab,
         )
-        target_label = PyDMLabel(init_channel=target_pv)
         target_label.setMinimumWidth(100)
 
         k_values_layout = QtWidgets.QFormLayout()
@@ -355,7 +461,9 @@ class UndulatorListWidget(QtWidgets.QWidget, PyDMPrimitiveWidget):
         k_values_layout.addRow("Current K:", curr_label)
         k_values_layout.addRow("Target K:", target_label)
 
+        entry = QtWidgets.QWidget()
         layout = QtWidgets.QHBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
         layout.addWidget(segment_label)
         layout.addWidget(und_widget)
         layout.addLayout(k_values_layout)
@@ -363,8 +471,265 @@ class UndulatorListWidget(QtWidgets.QWidget, PyDMPrimitiveWidget):
         layout.setStretch(0, 0)
         layout.setStretch(1, 1)
         layout.setStretch(2, 0)
+        entry.setLayout(layout)
+
+        return entry
+
+
+class FastFaultHeatmap(QtWidgets.QWidget, PyDMPrimitiveWidget):
+    """
+    Overview of every configured fast fault, drawn as one colored cell each.
+
+    Cells are laid out in the FastFaultStore's order (PLC, then FFO, then
+    FF), which is the same order the Fast Faults tab uses, and wrap to
+    fill the widget width. The displayed state of each fast fault is
+    kept as one code in a small array, and a change in the store only
+    invalidates the one cell it touches, so the widget stays cheap to
+    keep live at full update rates.
+
+    Clicking a cell emits ``fault_clicked`` with the fast fault's index.
+    """
+    fault_clicked = QtCore.Signal(int)
+
+    STATE_NAMES = ('Disconnected', 'Not in use', 'OK', 'Faulted', 'Bypassed')
+    STATE_COLORS = {
+        'Disconnected': QtGui.QColor(100, 100, 100),
+        'Not in use': QtGui.QColor(225, 225, 225),
+        'OK': QtGui.QColor(0, 200, 0),
+        'Faulted': QtGui.QColor(230, 0, 0),
+        'Bypassed': QtGui.QColor(245, 180, 0),
+    }
+    # The store flags that the displayed state depends on
+    FLAGS = ('connected', 'in_use', 'ok', 'bypassed')
+
+    CELL_SIZE = 6
+    CELL_SPACING = 1
+
+    def __init__(self, parent=None):
+        super().__init__(parent=parent)
+        self.store = None
+        self._states = np.zeros(0, dtype=np.uint8)
+        self._columns = 1
+        self.setMouseTracking(True)
+        self.setSizePolicy(
+            QtWidgets.QSizePolicy.Expanding,
+            QtWidgets.QSizePolicy.Fixed,
+        )
+
+    def setup_store(self, store: FastFaultStore) -> None:
+        """
+        Show every fast fault in the store, and follow its changes.
+        """
+        self.store = store
+        self._states = self.state_codes(store.faults)
+        store.fault_changed.connect(self.fault_changed)
+        self._relayout(self.width())
+        self.update()
+
+    @classmethod
+    def state_codes(cls, faults: np.ndarray) -> np.ndarray:
+        """The index into STATE_NAMES for each fast fault record."""
+        return np.select(
+            [~faults['connected'], faults['bypassed'], ~faults['in_use'],
+             faults['ok']],
+            [0, 4, 1, 2],
+            default=3,
+        ).astype(np.uint8)
+
+    def fault_changed(self, index: int, flag: str) -> None:
+        """
+        Recompute one cell's state, repainting only on a visible change.
+        """
+        if flag not in self.FLAGS:
+            return
+        state = self.state_codes(self.store.faults[index:index + 1])[0]
+        if state == self._states[index]:
+            return
+        self._states[index] = state
+        self.update(self.cell_rect(index))
+
+    def state_name(self, index: int) -> str:
+        """The displayed state of the cell at index."""
+        return self.STATE_NAMES[self._states[index]]
+
+    def _pitch(self) -> int:
+        return self.CELL_SIZE + self.CELL_SPACING
+
+    def cell_rect(self, index: int) -> QtCore.QRect:
+        row, col = divmod(index, self._columns)
+        pitch = self._pitch()
+        return QtCore.QRect(
+            col * pitch, row * pitch, self.CELL_SIZE, self.CELL_SIZE,
+        )
 
-        return layout
+    def index_at(self, pos: QtCore.QPoint) -> Optional[int]:
+        pitch = self._pitch()
+        col = pos.x() // pitch
+        if col >= self._columns:
+            return None
+        index = (pos.y() // pitch) * self._columns + col
+        if 0 <= index < len(self._states):
+            return index
+        return None
+
+    def _columns_for_width(self, width: int) -> int:
+        return max(1, (width + self.CELL_SPACING) // self._pitch())
+
+    def hasHeightForWidth(self) -> bool:
+        return True
+
+    def heightForWidth(self, width: int) -> int:
+        rows = -(-len(self._states) // self._columns_for_width(width))
+        return max(rows * self._pitch() - self.CELL_SPACING, 0)
+
+    def sizeHint(self) -> QtCore.QSize:
+        return QtCore.QSize(400, self.heightForWidth(400))
+
+    def _relayout(self, width: int) -> None:
+        """Pick the number of columns and the height to fit all the cells."""
+        self._columns = self._columns_for_width(width)
+        self.setFixedHeight(self.heightForWidth(width))
+
+    def resizeEvent(self, ev: QtGui.QResizeEvent) -> None:
+        if self._columns_for_width(ev.size().width()) != self._columns:
+            self._relayout(ev.size().width())
+        super().resizeEvent(ev)
+
+    def paintEvent(self, ev: QtGui.QPaintEvent) -> None:
+        """
+        Paint only the cells that intersect the dirty rectangle.
+        """
+        if not len(self._states):
+            return
+        painter = QtGui.QPainter(self)
+        pitch = self._pitch()
+        rect = ev.rect()
+        first_row = rect.top() // pitch
+        last_row = rect.bottom() // pitch
+        first_col = rect.left() // pitch
+        last_col = min(rect.right() // pitch, self._columns - 1)
+        count = len(self._states)
+        for row in range(first_row, last_row + 1):
+            start = row * self._columns
+            if start >= count:
+                break
+            for col in range(first_col, last_col + 1):
+                index = start + col
+                if index >= count:
+                    break
+                painter.fillRect(
+                    col * pitch, row * pitch, self.CELL_SIZE, self.CELL_SIZE,
+                    self.STATE_COLORS[self.state_name(index)],
+                )
+        painter.end()
+
+    def event(self, ev: QtCore.QEvent) -> bool:
+        if ev.type() == QtCore.QEvent.ToolTip:
+            index = self.index_at(ev.pos())
+            if index is None:
+                QtWidgets.QToolTip.hideText()
+            else:
+                QtWidgets.QToolTip.showText(
+                    ev.globalPos(),
+                    f'{self.store.table.names[index]}: '
+                    f'{self.state_name(index)}',
+                    self,
+                )
+            return True
+        return super().event(ev)
+
+    def mousePressEvent(self, ev: QtGui.QMouseEvent) -> None:
+        index = self.index_at(ev.pos())
+        if index is not None and ev.button() == QtCore.Qt.LeftButton:
+            self.fault_clicked.emit(index)
+        super().mousePressEvent(ev)
+
+
+class FaultSparkline(QtWidgets.QWidget):
+    """
+    Tiny step chart of an FFO's recent fault and bypass counts.
+
+    This draws straight from the ring buffers in an ``FFOHistory``, with
+    the most recent ``WINDOW`` seconds spread across the widget width.
+    Faults are drawn in red and bypasses in orange on a shared scale.
+    The chart only repaints on new transitions and on a slow timer to
+    scroll the time axis along, and not at all while hidden.
+    """
+    WINDOW = 3600
+    SCROLL_MS = 30000
+
+    FAULT_PEN = QtGui.QPen(QtGui.QColor(230, 0, 0), 1)
+    BYPASS_PEN = QtGui.QPen(QtGui.QColor(245, 180, 0), 1)
+
+    def __init__(self, history: FFOHistory, parent=None):
+        super().__init__(parent=parent)
+        self.history = history
+        self.setSizePolicy(
+            QtWidgets.QSizePolicy.Fixed,
+            QtWidgets.QSizePolicy.Preferred,
+        )
+        self.setFixedWidth(160)
+        self._timer = QtCore.QTimer(self)
+        self._timer.timeout.connect(self.update)
+        self._timer.start(self.SCROLL_MS)
+
+    def sizeHint(self) -> QtCore.QSize:
+        return QtCore.QSize(160, 32)
+
+    def _step_line(
+        self, buffer: RingBuffer, start: float, scale: float,
+    ) -> QtGui.QPolygonF:
+        """
+        Map the samples of one buffer onto a step line in widget coordinates.
+        """
+        times, values = buffer.samples()
+        before = np.searchsorted(times, start)
+        w, h = self.width() - 1, self.height() - 1
+        xs = np.clip((times[before:] - start) / self.WINDOW, 0, 1) * w
+        ys = h - values[before:] * scale
+        if before:
+            # Carry the last value from before the window in from the left
+            xs = np.insert(xs, 0, 0)
+            ys = np.insert(ys, 0, h - values[before - 1] * scale)
+        points = QtGui.QPolygonF()
+        for index, (x, y) in enumerate(zip(xs, ys)):
+            if index:
+                points.append(QtCore.QPointF(x, points.last().y()))
+            points.append(QtCore.QPointF(x, y))
+        if len(points):
+            points.append(QtCore.QPointF(w, points.last().y()))
+        return points
+
+    def paintEvent(self, ev: QtGui.QPaintEvent) -> None:
+        painter = QtGui.QPainter(self)
+        painter.fillRect(self.rect(), QtGui.QColor('white'))
+        painter.setPen(QtGui.QColor(200, 200, 200))
+        painter.drawRect(self.rect().adjusted(0, 0, -1, -1))
+        start = time.time() - self.WINDOW
+        _, faults = self.history.faults.samples()
+        _, bypasses = self.history.bypasses.samples()
+        top = max(faults.max(initial=0), bypasses.max(initial=0), 1)
+        scale = (self.height() - 3) / top
+        for buffer, pen in (
+            (self.history.bypasses, self.BYPASS_PEN),
+            (self.history.faults, self.FAULT_PEN),
+        ):
+            painter.setPen(pen)
+            painter.drawPolyline(self._step_line(buffer, start, scale))
+        painter.end()
+
+    def event(self, ev: QtCore.QEvent) -> bool:
+        if ev.type() == QtCore.QEvent.ToolTip:
+            QtWidgets.QToolTip.showText(
+                ev.globalPos(),
+                f'Fault (red) and bypass (orange) counts over the last '
+                f'{self.WINDOW // 60} minutes\n'
+                f'{len(self.history.faults)} fault and '
+                f'{len(self.history.bypasses)} bypass transitions recorded',
+                self,
+            )
+            return True
+        return super().event(ev)
 
 
 class FixNegBitmaskByteIndicator(PyDMByteIndicator):
@@ -395,15 +760,36 @@ class ValueTooltipByteIndicator(FixNegBitmaskByteIndicator):
     Byte indicator that can set its tooltip when the value updates.
 
     This should be subclassed to override the "tooltip_function" method.
+    The tooltip is rendered by the ComputeService, so tooltip_function
+    must only use its arguments, see "tooltip_args".
     """
+    _tooltip_args = None
+
     def tooltip_function(self, value: int) -> str:
         raise NotImplementedError()
 
+    def tooltip_args(self) -> tuple:
+        """The arguments for tooltip_function, from the current state."""
+        return (self.value,)
+
     def update_indicators(self):
         rval = super().update_indicators()
-        self.PyDMToolTip = self.tooltip_function(self.value)
+        self.request_tooltip()
         return rval
 
+    def request_tooltip(self) -> None:
+        """Render the tooltip in the background, if its inputs changed."""
+        args = self.tooltip_args()
+        if args == self._tooltip_args:
+            return
+        self._tooltip_args = args
+        ComputeService.instance().submit(
+            self, self.tooltip_function, args, self.set_tooltip,
+        )
+
+    def set_tooltip(self, text: str) -> None:
+        self.PyDMToolTip = text
+
 
 class BCByteIndicator(ValueTooltipByteIndicator):
     """
@@ -413,27 +799,141 @@ class BCByteIndicator(ValueTooltipByteIndicator):
         return get_tooltip_for_bc_bitmask(value)
 
 
+class EvRangeBroadcaster(QtCore.QObject):
+    """
+    The line's eV range definitions, subscribed once for every widget.
+
+    Widgets register with ``add_consumer`` and are only held by weak
+    reference, so rows that are destroyed are not kept alive by this.
+    Each new definition is parsed into a tuple once and pushed to every
+    live consumer's ``new_range_def`` method.
+
+    Widgets that only show one element of the definitions register with
+    ``add_index_consumer`` instead, and their ``new_range_value`` method
+    is only called when that element changes. They are also told when
+    the channel connects and disconnects, through their
+    ``range_connection_changed`` method.
+
+    There is one of these per application, see
+    ``EvRangeBroadcaster.instance``.
+    """
+    _instance: Optional[EvRangeBroadcaster] = None
+
+    def __init__(self, parent=None):
+        super().__init__(parent=parent)
+        self.address = None
+        self.range_def = None
+        self.connected = False
+        self._channel = None
+        self._consumers = weakref.WeakSet()
+        self._index_consumers = collections.defaultdict(weakref.WeakSet)
+
+    @classmethod
+    def instance(cls) -> EvRangeBroadcaster:
+        """Get the application-wide broadcaster, creating it if needed."""
+        if cls._instance is None:
+            cls._instance = cls(parent=QtWidgets.QApplication.instance())
+        return cls._instance
+
+    def set_address(self, address: str) -> None:
+        """Set the channel address of the eV range definitions."""
+        if address == self.address:
+            return
+        if self._channel is not None:
+            self._channel.disconnect()
+        self.address = address
+        self.range_def = None
+        self.connection_changed(False)
+        self._channel = PyDMChannel(
+            address=address,
+            connection_slot=self.connection_changed,
+            value_slot=self.new_range_def,
+        )
+        self._channel.connect()
+
+    def add_consumer(self, consumer) -> None:
+        """
+        Start pushing range definitions to consumer.
+
+        If we already have the definitions, they are pushed right away.
+        """
+        self._consumers.add(consumer)
+        if self.range_def is not None:
+            consumer.new_range_def(self.range_def)
+
+    def add_index_consumer(self, index: int, consumer) -> None:
+        """
+        Start pushing one element of the range definitions to consumer.
+
+        If we already have the definitions, the element is pushed right away.
+        """
+        self._index_consumers[index].add(consumer)
+        if self.range_def is not None and index < len(self.range_def):
+            consumer.new_range_value(self.range_def[index])
+        consumer.range_connection_changed(self.connected)
+
+    def remove_index_consumer(self, index: int, consumer) -> None:
+        """Stop pushing an element of the range definitions to consumer."""
+        self._index_consumers[index].discard(consumer)
+
+    def connection_changed(self, connected: bool) -> None:
+        """Tell the element consumers that the channel (dis)connected."""
+        if connected == self.connected:
+            return
+        self.connected = connected
+        for consumers in self._index_consumers.values():
+            self._push(consumers, 'range_connection_changed', connected)
+
+    def new_range_def(self, range_def: Iterable[int]) -> None:
+        """
+        Parse the new definitions once and push them to the consumers.
+
+        Only the consumers of elements that changed are updated.
+        """
+        old_def = self.range_def or ()
+        new_def = tuple(int(value) for value in range_def)
+        self.range_def = new_def
+        if old_def == new_def:
+            return
+        self._push(self._consumers, 'new_range_def', new_def)
+        for index, consumers in self._index_consumers.items():
+            if index >= len(new_def):
+                continue
+            if index < len(old_def) and old_def[index] == new_def[index]:
+                continue
+            self._push(consumers, 'new_range_value', new_def[index])
+
+    @staticmethod
+    def _push(consumers: weakref.WeakSet, method: str, value) -> None:
+        for consumer in list(consumers):
+            try:
+                getattr(consumer, method)(value)
+            except RuntimeError:
+                # The qt side of the widget is already gone
+                consumers.discard(consumer)
+
+    def channels(self) -> list[PyDMChannel]:
+        if self._channel is None:
+            return []
+        return [self._channel]
+
+
 class EvByteIndicator(ValueTooltipByteIndicator):
     """
     Update the tooltip for ev bitmasks.
 
     This refers to the line's global eV range definitions as
-    reported by the IOC.
+    reported by the IOC, which are shared by every instance
+    through the EvRangeBroadcaster.
 
     It implements some logic so that it displays the
     correct tooltip whether the eV range definition values
     come in before or after the first value.
     """
-    _ev_bytes = []
-    _range_address = None
-
     def __init__(self, parent=None, init_channel=None):
-        self._range_ch = None
-        self._range_def = []
-        self._ev_bytes.append(self)
+        self._range_def = ()
         super().__init__(parent, init_channel)
-        if self._range_address is not None:
-            self.apply_range_ch()
+        EvRangeBroadcaster.instance().add_consumer(self)
 
     @classmethod
     def set_range_address(cls, range_address: str):
@@ -442,41 +942,28 @@ class EvByteIndicator(ValueTooltipByteIndicator):
 
         Updates all previously created widgets of this type.
         """
-        cls._range_address = range_address
-        for evbt in cls._ev_bytes:
-            evbt.apply_range_ch()
+        EvRangeBroadcaster.instance().set_address(range_address)
 
-    def apply_range_ch(self):
-        """
-        Causes this widget's tooltip to update when the ranges change.
-        """
-        if self._range_ch is not None:
-            self._range_ch.disconnect()
-            self._channels.remove(self._range_ch)
-        self._range_ch = PyDMChannel(
-            address=self._range_address,
-            value_slot=self.new_range_def,
-        )
-        self._range_ch.connect()
-        self._channels.append(self._range_ch)
+    def tooltip_args(self) -> tuple:
+        return (self.value, self._range_def)
 
-    def tooltip_function(self, value: int) -> str:
+    def tooltip_function(self, value: int, range_def: tuple[int, ...]) -> str:
         """
         If we have ranges, give a good tooltip, otherwise apologize.
         """
-        if self._range_def:
-            return get_ev_range_tooltip(value, self._range_def)
+        if range_def:
+            return get_ev_range_tooltip(value, range_def)
         return 'eV ranges have not loaded'
 
-    def new_range_def(self, range_def: Iterable[int]):
+    def new_range_def(self, range_def: tuple[int, ...]):
         """
         Make this widget aware of the eV ranges.
 
-        This is expected to be called exactly once.
+        This is called by the EvRangeBroadcaster whenever they change.
         """
-        self._range_def = list(range_def)
+        self._range_def = range_def
         if isinstance(self.value, int):
-            self.PyDMToolTip = self.tooltip_function(self.value)
+            self.request_tooltip()
 
 
 class ResizingTextEdit(QtWidgets.QTextEdit):
@@ -510,3 +997,225 @@ class ResizingTextEdit(QtWidgets.QTextEdit):
         """
         self.set_height_to_text()
         return super().resizeEvent(ev)
+
+
+class VerticalLabel(PyDMLabel):
+    """
+    A PyDMLabel that draws its text rotated to read from bottom to top.
+
+    The text is laid out once into a QStaticText, and the rotated size
+    hints are computed once, and both are only redone when the text,
+    font or style changes. Repaints just draw the prepared text.
+    """
+    def __init__(self, parent=None, init_channel=None):
+        self._static_text = None
+        self._hints = None
+        super().__init__(parent=parent, init_channel=init_channel)
+
+    def setMaximumSize(self, *args):
+        """
+        Drop the narrow maximum width that the ui files use for designer.
+
+        Designer draws these labels horizontally, so they get a small
+        maximum width there to look right. Rotated, that would clip them.
+        """
+        size = QtCore.QSize(*args)
+        super().setMaximumSize(size.height(), size.height())
+
+    def setText(self, text):
+        if text != self.text():
+            self._invalidate()
+        super().setText(text)
+
+    def changeEvent(self, event):
+        if event.type() in (QtCore.QEvent.FontChange,
+                            QtCore.QEvent.StyleChange):
+            self._invalidate()
+        super().changeEvent(event)
+
+    def _invalidate(self):
+        self._static_text = None
+        self._hints = None
+        self.updateGeometry()
+
+    def _rotated_hints(self):
+        if self._hints is None:
+            hint = super().sizeHint()
+            min_hint = super().minimumSizeHint()
+            self._hints = (
+                QtCore.QSize(hint.height(), hint.width()),
+                QtCore.QSize(min_hint.height(), min_hint.width()),
+            )
+        return self._hints
+
+    def sizeHint(self):
+        return self._rotated_hints()[0]
+
+    def minimumSizeHint(self):
+        return self._rotated_hints()[1]
+
+    def paintEvent(self, event):
+        if self._static_text is None:
+            static_text = QtGui.QStaticText(self.text())
+            static_text.setTextFormat(QtCore.Qt.PlainText)
+            static_text.prepare(QtGui.QTransform(), self.font())
+            metrics = self.fontMetrics()
+            # size of text inside the label widget
+            text_rect = metrics.boundingRect(self.text())
+            self._static_text = (
+                static_text, text_rect.width(), text_rect.height(),
+                metrics.ascent(),
+            )
+        static_text, text_w, text_h, ascent = self._static_text
+        # size of label widget
+        hint = self.sizeHint()
+
+        painter = QtGui.QPainter(self)
+        painter.translate(hint.width(), hint.height())
+        painter.rotate(270)
+        # this will make it look like it is right (or top) justified
+        pos_x = hint.height() - text_w
+        # center the text on the bitmask, static text is placed by its top
+        pos_y = -(hint.width() - text_h) - ascent
+        painter.drawStaticText(QtCore.QPointF(pos_x, pos_y), static_text)
+        painter.end()
+
+
+class EvRangeLabel(VerticalLabel):
+    """
+    Vertical label for one element of the line's eV range definitions.
+
+    Rather than subscribing its own slice of the eVRangeCnst_RBV waveform,
+    this is fed its element by the shared EvRangeBroadcaster, and is only
+    updated when that element changes. Set ``rangeIndex`` to pick the
+    element.
+
+    It has no channel of its own, so PyDM never disables it: it is
+    disabled until it gets a value, and while the broadcaster's channel
+    is disconnected.
+    """
+    def __init__(self, parent=None, init_channel=None):
+        self._range_index = -1
+        self._has_value = False
+        super().__init__(parent=parent, init_channel=init_channel)
+        self.setEnabled(False)
+
+    @QtCore.Property(int)
+    def rangeIndex(self):
+        return self._range_index
+
+    @rangeIndex.setter
+    def rangeIndex(self, index):
+        if index == self._range_index:
+            return
+        broadcaster = EvRangeBroadcaster.instance()
+        if self._range_index >= 0:
+            broadcaster.remove_index_consumer(self._range_index, self)
+        self._range_index = index
+        if index >= 0:
+            broadcaster.add_index_consumer(index, self)
+
+    def new_range_value(self, value: int) -> None:
+        self._has_value = True
+        self.setText(str(value))
+        self.setEnabled(True)
+
+    def range_connection_changed(self, connected: bool) -> None:
+        self.setEnabled(connected and self._has_value)
+
+
+class RateLimitedLabel(PyDMLabel):
+    """
+    A PyDMLabel that shows new values at most at the rate of its QoS tier.
+
+    The tier is looked up by class name and then by qos_tab, see
+    pmpsui.qos. Alarm severity and connection changes are still shown
+    right away, only the value text is paced.
+    """
+    def __init__(self, parent=None, init_channel=None, qos_tab=None):
+        self._throttled_value_changed = QoSPolicy.instance().throttle(
+            super().value_changed, type(self).__name__, tab=qos_tab,
+        )
+        super().__init__(parent=parent, init_channel=init_channel)
+
+    def value_changed(self, new_value):
+        self._throttled_value_changed(new_value)
+
+
+class UndulatorValueLabel(RateLimitedLabel):
+    """
+    Label for one value of an UndulatorSegment.
+
+    This is a PyDMLabel without a channel of its own: it is fed the
+    value, precision, units, alarm severity and connection state from
+    the shared segment model instead. The value text is paced like a
+    RateLimitedLabel.
+
+    Parameters
+    ----------
+    segment_model : UndulatorSegment
+        The segment to show a value from.
+    entry : str
+        The name of the value, e.g. 'curr_k'.
+    qos_tab : str, optional
+        The tab name used to look up the update rate, see pmpsui.qos.
+    """
+    def __init__(self, segment_model, entry, qos_tab=None, parent=None):
+        super().__init__(parent=parent, qos_tab=qos_tab)
+        self.entry = entry
+        # The value last, so it is formatted with the rest already known
+        self._slots = {
+            f'{entry}_prec': self.precision_changed,
+            f'{entry}_unit': self.unit_changed,
+            f'{entry}_severity': self.alarm_severity_changed,
+            entry: self.value_changed,
+        }
+        self.connection_changed(segment_model.connections.get(entry, False))
+        for name, slot in self._slots.items():
+            value = segment_model.values.get(name)
+            if value is not None:
+                slot(value)
+        segment_model.value_changed.connect(self.new_value)
+        segment_model.connection_changed.connect(self.new_conn)
+
+    def new_value(self, entry, value):
+        try:
+            slot = self._slots[entry]
+        except KeyError:
+            return
+        slot(value)
+
+    def new_conn(self, entry, connected):
+        if entry == self.entry:
+            self.connection_changed(connected)
+
+    def connection_changed(self, connected):
+        super().connection_changed(connected)
+        # PyDM only enables and disables widgets that have a channel
+        self.setEnabled(connected)
+
+    def alarm_severity_changed(self, new_alarm_severity):
+        # PyDM ignores the severity of widgets that have no channel
+        if new_alarm_severity == self._alarm_state:
+            return
+        self._alarm_state = new_alarm_severity
+        refresh_style(self)
+
+
+class SeverityResetLabel(PyDMLabel):
+    """
+    A PyDMLabel whose alarm severity is set by its owner, not its channel.
+
+    PyDM resets a label's severity whenever its channel connects or
+    disconnects. After each connection change, this calls
+    ``severity_reset`` with the new connection state so that the owner
+    can send its severity again.
+    """
+    def __init__(self, parent=None, init_channel=None):
+        self.severity_reset = None
+        super().__init__(parent=parent, init_channel=init_channel)
+
+    def connection_changed(self, connected):
+        super().connection_changed(connected)
+        if self.severity_reset is not None:
+            self.severity_reset(connected)